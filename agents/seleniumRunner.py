@@ -0,0 +1,297 @@
+"""
+Parallel runner for generated Selenium scripts.
+
+Generated scripts (backend /generate_selenium_script/, agents/seleniumAgent.py,
+selenium_scripts/*.py) expose `run(driver, url=None)`. Instead of every script
+starting and quitting its own Chrome, the runner keeps a pool of warm headless
+drivers and runs the scripts across them in parallel, collecting a result and
+timing per test. Works offline against local file:// pages.
+
+    python agents/seleniumRunner.py selenium_scripts/test_case_1.py --workers 4
+    python agents/seleniumRunner.py --testcases generated_testcases.jsonl --page uploaded_docs/checkout.html
+"""
+
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import traceback
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# Generated scripts import the shared locator helpers from selenium_scripts/
+SCRIPTS_DIR = str(Path(__file__).resolve().parent.parent / "selenium_scripts")
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+
+def make_chrome(headless: bool = True):
+    from selenium import webdriver
+
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument("--headless=new")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--allow-file-access-from-files")
+    options.add_argument("--window-size=1280,900")
+    return webdriver.Chrome(options=options)
+
+
+# How long a test waits for a free driver, and how often it checks that the pool still has one
+ACQUIRE_TIMEOUT = 600.0
+ACQUIRE_POLL = 1.0
+
+
+class DriverPoolExhausted(RuntimeError):
+    """Every driver of the pool was lost and none could be started in its place."""
+
+
+class DriverPool:
+    """
+    A fixed number of started WebDrivers, handed out one test at a time.
+    A driver that crashes is replaced; if its replacement cannot be started
+    the pool shrinks, and once no driver is left acquire() raises
+    DriverPoolExhausted instead of waiting.
+    """
+
+    def __init__(self, size: int = 4, factory: Optional[Callable[[], object]] = None, headless: bool = True):
+        self.size = size
+        self.factory = factory or (lambda: make_chrome(headless=headless))
+        self._idle: "queue.Queue" = queue.Queue()
+        self._all: List[object] = []
+        self._lock = threading.Lock()
+        self.lost = 0
+        self.last_error: Optional[str] = None
+
+    def warm_up(self):
+        """Start all drivers up front, in parallel, so no test pays browser startup."""
+        with ThreadPoolExecutor(max_workers=self.size) as ex:
+            for driver in ex.map(lambda _: self._start(), range(self.size)):
+                if driver is not None:
+                    self._add(driver)
+
+    def _start(self):
+        """A new driver, or None (counted as lost) if it fails to start."""
+        try:
+            return self.factory()
+        except Exception as e:
+            with self._lock:
+                self.lost += 1
+                self.last_error = "".join(traceback.format_exception_only(type(e), e)).strip()
+            return None
+
+    def _add(self, driver):
+        with self._lock:
+            self._all.append(driver)
+        self._idle.put(driver)
+
+    def _replace(self, driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        fresh = self._start()
+        # The old driver only leaves the pool now, so it never looks empty while a replacement starts
+        with self._lock:
+            if driver in self._all:
+                self._all.remove(driver)
+        if fresh is not None:
+            self._add(fresh)
+
+    @property
+    def capacity(self) -> int:
+        """Drivers still in the pool, idle or in use."""
+        with self._lock:
+            return len(self._all)
+
+    @staticmethod
+    def _reset(driver):
+        # Leave no state behind for the next test
+        driver.delete_all_cookies()
+        driver.get("about:blank")
+
+    def _get(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        while True:
+            if not self.capacity:
+                raise DriverPoolExhausted(f"all {self.size} WebDrivers were lost"
+                                          + (f"; last error: {self.last_error}" if self.last_error else ""))
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"no WebDriver became free within {timeout:.0f}s")
+            try:
+                return self._idle.get(timeout=min(ACQUIRE_POLL, remaining))
+            except queue.Empty:
+                continue
+
+    @contextmanager
+    def acquire(self, timeout: float = ACQUIRE_TIMEOUT):
+        driver = self._get(timeout)
+        try:
+            yield driver
+        finally:
+            try:
+                self._reset(driver)
+                self._idle.put(driver)
+            except Exception:
+                # Browser crashed or hung: swap in a fresh one
+                self._replace(driver)
+
+    def close(self):
+        with self._lock:
+            drivers, self._all = self._all, []
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+
+def load_script(source: str, name: str = "generated_test") -> Callable:
+    """Compile a generated script without running its __main__ block and return its run()."""
+    namespace = {"__name__": name, "__file__": name}
+    exec(compile(source, name, "exec"), namespace)
+    run = namespace.get("run")
+    if not callable(run):
+        raise ValueError(f"{name} does not define run(driver, url=None)")
+    return run
+
+
+def _run_one(pool: DriverPool, name: str, source: str, url: Optional[str]) -> Dict:
+    result = {"name": name, "status": "passed", "seconds": 0.0, "error": None}
+    start = time.perf_counter()
+    try:
+        run = load_script(source, name)
+        with pool.acquire() as driver:
+            start = time.perf_counter()
+            run(driver, url) if url else run(driver)
+    except AssertionError as e:
+        result.update(status="failed", error=str(e) or "assertion failed")
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            result.update(status="failed", error=f"exit code {e.code}")
+    except Exception as e:
+        result.update(status="error", error="".join(traceback.format_exception_only(type(e), e)).strip())
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def run_scripts(scripts: Dict[str, str], workers: int = 4, url: Optional[str] = None,
+                headless: bool = True, pool: Optional[DriverPool] = None) -> Dict:
+    """
+    Run {name: script source} across `workers` warm drivers.
+    Returns {"results": [...], "summary": {...}} with per-test status and seconds.
+    """
+    own_pool = pool is None
+    pool = pool or DriverPool(size=max(1, min(workers, len(scripts))), headless=headless)
+    started = time.perf_counter()
+    try:
+        if own_pool:
+            pool.warm_up()
+        warm = time.perf_counter() - started
+        with ThreadPoolExecutor(max_workers=pool.size) as ex:
+            futures = [ex.submit(_run_one, pool, name, src, url) for name, src in scripts.items()]
+            results = [f.result() for f in futures]
+    finally:
+        if own_pool:
+            pool.close()
+
+    summary = {
+        "total": len(results),
+        "passed": sum(r["status"] == "passed" for r in results),
+        "failed": sum(r["status"] == "failed" for r in results),
+        "errors": sum(r["status"] == "error" for r in results),
+        "workers": pool.size,
+        "drivers_lost": pool.lost,
+        "driver_startup_seconds": round(warm, 3),
+        "wall_seconds": round(time.perf_counter() - started, 3),
+    }
+    return {"results": results, "summary": summary}
+
+
+def run_testcases(testcases: List[Dict], page: str, workers: int = 4, headless: bool = True,
+                  locator_index: Optional[str] = None) -> Dict:
+    """
+    Generate a script per testcase (seleniumAgent) and run them against a local page.
+    `locator_index` is the backend's locator_index.json; the page's ranked selectors are used from it.
+    """
+    from seleniumAgent import generate_selenium_script
+
+    url = Path(page).resolve().as_uri()
+    page_locators = None
+    if locator_index:
+        pages = json.loads(Path(locator_index).read_text(encoding="utf-8"))
+        page_locators = pages.get(Path(page).name)
+    scripts = {}
+    for tc in testcases:
+        payload = tc.get("payload", tc)
+        name = tc.get("id") or payload.get("Test_ID") or f"tc_{len(scripts)}"
+        testcase = {"test_id": payload.get("Test_ID", name), "feature": payload.get("Feature", "")}
+        scripts[name] = generate_selenium_script(testcase, "", assume_file_path=url,
+                                                 page_locators=page_locators)
+    return run_scripts(scripts, workers=workers, url=url, headless=headless)
+
+
+def _read_testcases(path: Path) -> List[Dict]:
+    text = path.read_text(encoding="utf-8")
+    if path.suffix == ".jsonl":
+        # Replay the append-only log: later lines overwrite, "del" lines remove
+        records = {}
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if entry.get("op") == "del":
+                records.pop(entry["id"], None)
+            else:
+                records[entry["id"]] = entry
+        return list(records.values())
+    data = json.loads(text)
+    return list(data.values()) if isinstance(data, dict) else data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run generated Selenium scripts on a pool of warm drivers.")
+    parser.add_argument("scripts", nargs="*", help="script files exposing run(driver, url=None)")
+    parser.add_argument("--testcases", help="generated_testcases.jsonl/.json to turn into scripts")
+    parser.add_argument("--page", help="local HTML page to test (e.g. uploaded_docs/checkout.html)")
+    parser.add_argument("--locators", help="backend locator index (chroma_db/locator_index.json) for --testcases")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--headed", action="store_true", help="show the browsers")
+    parser.add_argument("--report", help="write the JSON results here")
+    args = parser.parse_args()
+
+    if args.testcases:
+        if not args.page:
+            parser.error("--testcases needs --page")
+        report = run_testcases(_read_testcases(Path(args.testcases)), args.page,
+                               workers=args.workers, headless=not args.headed,
+                               locator_index=args.locators)
+    else:
+        if not args.scripts:
+            parser.error("give script files or --testcases")
+        scripts = {p: Path(p).read_text(encoding="utf-8") for p in args.scripts}
+        url = Path(args.page).resolve().as_uri() if args.page else None
+        report = run_scripts(scripts, workers=args.workers, url=url, headless=not args.headed)
+
+    for r in report["results"]:
+        mark = "✓" if r["status"] == "passed" else "✗"
+        print(f"{mark} {r['name']}  {r['status']}  {r['seconds']:.2f}s" + (f"  {r['error']}" if r["error"] else ""))
+    s = report["summary"]
+    print(f"\n{s['passed']}/{s['total']} passed, {s['failed']} failed, {s['errors']} errors "
+          f"on {s['workers']} drivers in {s['wall_seconds']:.1f}s (driver startup {s['driver_startup_seconds']:.1f}s)")
+
+    if args.report:
+        Path(args.report).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    sys.exit(0 if s["passed"] == s["total"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Vector index layer for the Retriever.
+
+Two interchangeable indexes over L2-normalized vectors (cosine = dot product):
+
+- BruteForceIndex: exact scoring of every row, top-k picked with argpartition.
+  search_many() scores a whole batch of queries as (rows x queries) tiles.
+- IVFIndex: inverted-file index built with spherical k-means in numpy. Only
+  the `nprobe` lists whose centroids are closest to the query are scored,
+  so `nprobe` trades recall for latency.
+
+Both take an optional RowFilter (e.g. the rows of some sources): only those
+rows are scored, so a filter never costs top-k slots.
+"""
+
+import time
+import hashlib
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+ASSIGN_BLOCK = 65536
+ROW_BLOCK = 16384     # rows per tile in search_many
+QUERY_BLOCK = 256     # queries per tile: a tile is at most ROW_BLOCK x QUERY_BLOCK float32 (16 MB)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest scores, best first, without a full sort."""
+    n = scores.shape[0]
+    if n == 0 or k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k >= n:
+        return np.argsort(-scores)
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part])]
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Per-row top_k_indices of a 2-d score array: (n, k) column indices, best first."""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k < scores.shape[1]:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(k), scores.shape).copy()
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+def stack_results(results, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(idx, scores) pairs of single-query searches as (n, k) arrays, padded with -1 / -inf."""
+    idx = np.full((len(results), k), -1, dtype=np.int64)
+    scores = np.full((len(results), k), -np.inf, dtype=np.float32)
+    for q, (i, s) in enumerate(results):
+        idx[q, :len(i)] = i[:k]
+        scores[q, :len(s)] = s[:k]
+    return idx, scores
+
+
+class RowFilter:
+    """
+    The rows a search may return: sorted row numbers, plus a bitmap over all
+    `n` rows (built on first use) for indexes that test membership instead.
+    """
+
+    def __init__(self, rows: np.ndarray, n: int):
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.n = n
+        self._mask: Optional[np.ndarray] = None
+        # One contiguous range (a single source, usually) is read as a slice
+        self.range = (int(self.rows[0]), int(self.rows[-1]) + 1) \
+            if len(self.rows) and self.rows[-1] - self.rows[0] + 1 == len(self.rows) else None
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def mask(self) -> np.ndarray:
+        if self._mask is None:
+            mask = np.zeros(self.n, dtype=bool)
+            mask[self.rows] = True
+            self._mask = mask
+        return self._mask
+
+    def take(self, vectors, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """float32 vectors of the filter's rows[start:stop]."""
+        stop = len(self.rows) if stop is None else min(stop, len(self.rows))
+        if self.range is not None:
+            return np.asarray(vectors[self.range[0] + start:self.range[0] + stop], dtype=np.float32)
+        return np.asarray(vectors[self.rows[start:stop]], dtype=np.float32)
+
+
+def fingerprint(vectors: np.ndarray) -> str:
+    """Cheap identity check for a saved index: shape plus a strided sample of rows."""
+    n = vectors.shape[0]
+    sample = np.ascontiguousarray(vectors[::max(1, n // 64)])
+    h = hashlib.sha1(str(vectors.shape).encode("utf-8"))
+    h.update(sample.tobytes())
+    return h.hexdigest()
+
+
+class BruteForceIndex:
+    kind = "exact"
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+
+    def search(self, qvec: np.ndarray, top_k: int, subset: Optional[RowFilter] = None,
+               **_) -> Tuple[np.ndarray, np.ndarray]:
+        if subset is None:
+            scores = self.vectors @ qvec
+            idx = top_k_indices(scores, top_k)
+            return idx, scores[idx]
+        scores = np.empty(len(subset), dtype=np.float32)
+        for start in range(0, len(subset), ASSIGN_BLOCK):
+            scores[start:start + ASSIGN_BLOCK] = subset.take(self.vectors, start, start + ASSIGN_BLOCK) @ qvec
+        idx = top_k_indices(scores, top_k)
+        return subset.rows[idx], scores[idx]
+
+    def search_many(self, queries: np.ndarray, top_k: int, subset: Optional[RowFilter] = None,
+                    **_) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact top_k for each row of `queries` (n_queries, dim): (n_queries, k)
+        row indices and scores, best first, k = min(top_k, rows searched).
+        Scores are computed one (ROW_BLOCK x QUERY_BLOCK) tile at a time and
+        folded into a running top-k, so memory does not grow with the store.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        n = self.vectors.shape[0] if subset is None else len(subset)
+        k = max(0, min(top_k, n))
+        best_idx = np.full((len(queries), k), -1, dtype=np.int64)
+        best = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        if k == 0 or len(queries) == 0:
+            return best_idx, best
+        for start in range(0, n, ROW_BLOCK):
+            # Read (and dequantize) each block of rows once for all queries
+            if subset is None:
+                block = np.asarray(self.vectors[start:start + ROW_BLOCK], dtype=np.float32)
+            else:
+                block = subset.take(self.vectors, start, start + ROW_BLOCK)
+            for q0 in range(0, len(queries), QUERY_BLOCK):
+                q1 = q0 + QUERY_BLOCK
+                tile = queries[q0:q1] @ block.T                       # (queries, rows)
+                top = top_k_rows(tile, k)
+                cand_idx = np.concatenate([best_idx[q0:q1], top + start], axis=1)
+                cand = np.concatenate([best[q0:q1], np.take_along_axis(tile, top, axis=1)], axis=1)
+                keep = top_k_rows(cand, k)
+                best_idx[q0:q1] = np.take_along_axis(cand_idx, keep, axis=1)
+                best[q0:q1] = np.take_along_axis(cand, keep, axis=1)
+        if subset is not None:
+            best_idx = subset.rows[best_idx]  # positions in the subset -> store rows
+        return best_idx, best
+
+
+class IVFIndex:
+    kind = "ivf"
+
+    def __init__(self, vectors: np.ndarray, n_lists: Optional[int] = None, nprobe: int = 8):
+        self.vectors = vectors
+        n = vectors.shape[0]
+        self.n_lists = max(1, min(n, n_lists or int(np.sqrt(n))))
+        self.nprobe = nprobe
+        self.centroids: Optional[np.ndarray] = None
+        self.order: Optional[np.ndarray] = None    # row ids grouped by list
+        self.offsets: Optional[np.ndarray] = None  # list i -> order[offsets[i]:offsets[i+1]]
+
+    # ---------- build ----------
+
+    def _assign(self, centroids: np.ndarray) -> np.ndarray:
+        n = self.vectors.shape[0]
+        labels = np.empty(n, dtype=np.int32)
+        for start in range(0, n, ASSIGN_BLOCK):
+            block = np.asarray(self.vectors[start:start + ASSIGN_BLOCK], dtype=np.float32)
+            labels[start:start + ASSIGN_BLOCK] = np.argmax(block @ centroids.T, axis=1)
+        return labels
+
+    def build(self, n_iter: int = 10, sample_size: Optional[int] = None, seed: int = 0) -> "IVFIndex":
+        rng = np.random.default_rng(seed)
+        n = self.vectors.shape[0]
+        sample_size = min(n, sample_size or 256 * self.n_lists)
+        sample = np.asarray(self.vectors[np.sort(rng.choice(n, sample_size, replace=False))], dtype=np.float32)
+
+        centroids = sample[rng.choice(sample_size, self.n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(labels, kind="stable")
+            present, starts = np.unique(labels[order], return_index=True)
+            sums = np.zeros_like(centroids)
+            sums[present] = np.add.reduceat(sample[order], starts, axis=0)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Re-seed empty lists from random sample points
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            norms[empty] = 1.0
+            centroids = sums / norms
+
+        labels = self._assign(centroids)
+        self.centroids = centroids.astype(np.float32)
+        self.order = np.argsort(labels, kind="stable").astype(np.int64)
+        self.offsets = np.searchsorted(labels[self.order], np.arange(self.n_lists + 1)).astype(np.int64)
+        return self
+
+    # ---------- search ----------
+
+    def search(self, qvec: np.ndarray, top_k: int, nprobe: Optional[int] = None,
+               subset: Optional[RowFilter] = None) -> Tuple[np.ndarray, np.ndarray]:
+        nprobe = min(self.n_lists, nprobe or self.nprobe)
+        if subset is not None and len(subset) <= self.vectors.shape[0] * nprobe // self.n_lists:
+            # Fewer rows pass the filter than the probed lists hold: score them all, exactly
+            return BruteForceIndex(self.vectors).search(qvec, top_k, subset=subset)
+        lists = top_k_indices(self.centroids @ qvec, nprobe)
+        rows = np.concatenate([self.order[self.offsets[i]:self.offsets[i + 1]] for i in lists])
+        if subset is not None:
+            rows = rows[subset.mask[rows]]
+        if rows.size == 0:
+            return rows, np.empty(0, dtype=np.float32)
+        rows.sort()  # sequential access into (possibly memory-mapped) vectors
+        scores = np.asarray(self.vectors[rows], dtype=np.float32) @ qvec
+        best = top_k_indices(scores, top_k)
+        return rows[best], scores[best]
+
+    def search_many(self, queries: np.ndarray, top_k: int, nprobe: Optional[int] = None,
+                    subset: Optional[RowFilter] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """search() for each row of `queries`, as (n_queries, top_k) arrays padded with -1 / -inf."""
+        queries = np.asarray(queries, dtype=np.float32)
+        k = max(0, min(top_k, self.vectors.shape[0] if subset is None else len(subset)))
+        return stack_results([self.search(q, k, nprobe=nprobe, subset=subset) for q in queries], k)
+
+    # ---------- persistence ----------
+
+    def save(self, path):
+        np.savez(path, centroids=self.centroids, order=self.order, offsets=self.offsets,
+                 fingerprint=fingerprint(self.vectors), nprobe=self.nprobe)
+
+    @classmethod
+    def load(cls, path, vectors: np.ndarray, nprobe: Optional[int] = None) -> "IVFIndex":
+        data = np.load(path)
+        if str(data["fingerprint"]) != fingerprint(vectors):
+            raise ValueError(f"{path} was built for different embeddings; rebuild it")
+        index = cls(vectors, n_lists=data["centroids"].shape[0], nprobe=nprobe or int(data["nprobe"]))
+        index.centroids = data["centroids"]
+        index.order = data["order"]
+        index.offsets = data["offsets"]
+        return index
+
+
+def build_index(kind: str, vectors: np.ndarray, path: Optional[Path] = None,
+                nprobe: int = 8, n_lists: Optional[int] = None):
+    """Create the index named by `kind` ("exact" or "ivf"), loading a saved IVF index from `path` if valid."""
+    if kind == "exact":
+        return BruteForceIndex(vectors)
+    if kind != "ivf":
+        raise ValueError(f"Unknown index kind: {kind}")
+
+    if path is not None and Path(path).exists():
+        try:
+            return IVFIndex.load(path, vectors, nprobe=nprobe)
+        except Exception:
+            pass
+    index = IVFIndex(vectors, n_lists=n_lists, nprobe=nprobe).build()
+    if path is not None:
+        index.save(path)
+    return index
+
+
+def measure_recall(index, vectors: np.ndarray, queries: np.ndarray, top_k: int = 5, **search_kwargs) -> Dict[str, float]:
+    """Recall@k and mean latency of `index` against exact search on the same vectors."""
+    exact = BruteForceIndex(vectors)
+    hits = 0
+    exact_time = 0.0
+    index_time = 0.0
+    for q in queries:
+        t0 = time.perf_counter()
+        truth, _ = exact.search(q, top_k)
+        t1 = time.perf_counter()
+        found, _ = index.search(q, top_k, **search_kwargs)
+        t2 = time.perf_counter()
+        exact_time += t1 - t0
+        index_time += t2 - t1
+        hits += len(np.intersect1d(truth, found))
+    n = max(1, len(queries))
+    return {
+        "recall": hits / float(n * min(top_k, vectors.shape[0])),
+        "exact_ms": 1000 * exact_time / n,
+        "index_ms": 1000 * index_time / n,
+    }
@@ -0,0 +1,71 @@
+"""
+Compare the IVF index against exact search on the same embeddings.
+
+    python backend/bench_index.py                    # uses ingest/vector_store
+    python backend/bench_index.py --embeddings x.npy # any saved (n, dim) array
+    python backend/bench_index.py --synthetic 200000 # random clustered vectors
+
+Prints recall@k and mean per-query latency for several nprobe values.
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+from ann_index import IVFIndex, measure_recall
+from vector_store import VectorStore
+
+
+def synthetic_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    # Clustered data behaves more like real embeddings than uniform noise
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 500), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), n)] + 0.3 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store", default="ingest/vector_store")
+    parser.add_argument("--embeddings", default=None, help="load vectors from a .npy file instead of the store")
+    parser.add_argument("--synthetic", type=int, default=0, help="use N random vectors instead of a file")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--n-lists", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        vectors = synthetic_vectors(args.synthetic, args.dim)
+    elif args.embeddings:
+        vectors = np.load(Path(args.embeddings)).astype(np.float32)
+    else:
+        store = VectorStore(args.store)
+        vectors = np.asarray(store.vectors[:], dtype=np.float32)
+        store.close()
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors = vectors / norms
+
+    # Queries are perturbed copies of stored rows
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    t0 = time.perf_counter()
+    index = IVFIndex(vectors, n_lists=args.n_lists).build()
+    print(f"{len(vectors)} vectors, {index.n_lists} lists, built in {time.perf_counter() - t0:.2f}s")
+
+    for nprobe in (1, 2, 4, 8, 16, 32, 64):
+        if nprobe > index.n_lists:
+            break
+        r = measure_recall(index, vectors, queries, top_k=args.top_k, nprobe=nprobe)
+        print(f"nprobe={nprobe:3d}  recall@{args.top_k}={r['recall']:.3f}  "
+              f"ivf={r['index_ms']:.3f}ms  exact={r['exact_ms']:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Measure backend startup: how long `import main` takes in a fresh interpreter,
+which modules dominate it, and (optionally) how long uvicorn takes to answer
+its first /health.
+
+    python backend/bench_startup.py                # import time, 5 cold runs
+    python backend/bench_startup.py --server       # also time-to-first-/health
+    python backend/bench_startup.py --top 20       # show main's 20 slowest imports
+
+Every run is a new subprocess, so nothing is cached in-process between runs
+(the OS page cache still is, as it would be on a warm host).
+"""
+
+import os
+import re
+import sys
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+
+def time_import(runs: int) -> list:
+    times = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR,
+                             capture_output=True, text=True, check=True)
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return times
+
+
+def slowest_imports(top: int) -> list:
+    """Parse `python -X importtime` and return main's direct imports with the largest cumulative time."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR,
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        if m and len(m.group(3)) == 3:  # one level below main
+            rows.append((int(m.group(2)) / 1e6, m.group(4)))
+    return sorted(rows, reverse=True)[:top]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_first_health(timeout: float = 120.0) -> float:
+    port = _free_port()
+    env = dict(os.environ, QA_WARMUP="0")
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                            cwd=BACKEND_DIR, env=env)
+    try:
+        while time.perf_counter() - start < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"server exited with code {proc.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as r:
+                    if r.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.05)
+        raise TimeoutError("server did not answer /health")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark backend import and startup time.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports of main to list")
+    parser.add_argument("--server", action="store_true", help="also time uvicorn start to first /health")
+    args = parser.parse_args()
+
+    times = time_import(args.runs)
+    print(f"import main: median {statistics.median(times) * 1000:.0f} ms, "
+          f"min {min(times) * 1000:.0f} ms, max {max(times) * 1000:.0f} ms over {args.runs} runs")
+
+    print("\nslowest imports of main (cumulative):")
+    for seconds, module in slowest_imports(args.top):
+        print(f"  {seconds * 1000:8.1f} ms  {module}")
+
+    if args.server:
+        print(f"\nuvicorn start -> first /health: {time_first_health() * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
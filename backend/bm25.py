@@ -0,0 +1,412 @@
+"""
+Lexical (BM25) index over KB chunks, for hybrid retrieval.
+
+Dense embeddings blur exact identifiers: endpoint paths, element ids and
+error codes. This module keeps an inverted index over the chunks. Each term
+maps to a posting list of (doc, term frequency) held in compact typed arrays
+(uint32 doc numbers, uint16 tfs). A query touches only the postings of its
+own terms, which takes microseconds.
+
+Tokens keep identifiers whole ("/api/cart/apply-coupon", "err_402") and
+also emit their path segments and word parts, so "apply-coupon" and
+"apply coupon" still match. Documents can be added and removed
+incrementally; removals are tombstoned and the postings are compacted once
+enough dead documents pile up. Document frequencies count a dead document
+until the next compaction. Searches can be restricted to a boolean mask over
+document numbers (see doc_mask), which callers build once per filter. A
+loaded index reads its postings straight from the saved arrays; a term's
+list is only copied once a document is added to it.
+
+rrf() fuses ranked lists (lexical + dense) by reciprocal rank.
+confident_hits() spots "easy" queries, where a rare identifier singles out
+its chunks, so callers can answer those lexically without a dense lookup.
+"""
+
+import os
+import re
+import math
+import threading
+from array import array
+from collections import Counter
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9_]+(?:[./:-][a-z0-9_]+)*")
+PART_RE = re.compile(r"[a-z0-9]+")
+SEGMENT_RE = re.compile(r"[/.:]")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with"
+    .split()
+)
+
+K1 = 1.2
+B = 0.75
+RRF_K = 60
+MAX_TF = 65535
+
+assert array("I").itemsize == 4 and array("H").itemsize == 2
+
+# (offsets, docs, tfs) of an index with nothing loaded from a file
+NO_POSTINGS = (np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint16))
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for tok in TOKEN_RE.findall(text.lower()):
+        parts = PART_RE.findall(tok)
+        if len(parts) > 1 or tok != (parts[0] if parts else tok):
+            tokens.append(tok)  # the identifier as written
+            segments = [s for s in SEGMENT_RE.split(tok) if s]
+            if len(segments) > 1:
+                # path segments that are identifiers themselves, e.g. "apply-coupon"
+                tokens.extend(s for s in segments if s not in parts)
+        for p in parts:
+            if len(p) > 1 and p not in STOPWORDS:
+                tokens.append(p)
+    return tokens
+
+
+def is_identifier(token: str) -> bool:
+    """Paths, snake/kebab-case names and codes: anything with a digit or a joiner."""
+    return any(c.isdigit() or c in "/_.:-" for c in token)
+
+
+def rrf(rankings: Sequence[Sequence[Hashable]], k: int = RRF_K,
+        weights: Optional[Sequence[float]] = None) -> List[Tuple[Hashable, float]]:
+    """Reciprocal rank fusion: score(d) = sum_i w_i / (k + rank_i(d)), ranks starting at 1."""
+    scores: Dict[Hashable, float] = {}
+    for i, ranking in enumerate(rankings):
+        w = weights[i] if weights else 1.0
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + w / (k + rank)
+    return sorted(scores.items(), key=lambda kv: -kv[1])
+
+
+class BM25Index:
+    def __init__(self, path: Optional[str] = None, k1: float = K1, b: float = B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        # Bumped on every change to the documents; masks from doc_mask() hold until it moves
+        self.generation = 0
+        self._reset()
+        if path and os.path.exists(path):
+            self._load(path)
+
+    def _reset(self):
+        self._vocab: Dict[str, int] = {}
+        self._terms: List[str] = []
+        # term id -> doc numbers (uint32) / term frequencies (uint16); None while the
+        # term's postings are still the slice of the loaded file (see _postings)
+        self._post_docs: List[Optional[array]] = []
+        self._post_tfs: List[Optional[array]] = []
+        self._loaded = NO_POSTINGS
+        self._keys: List[Optional[str]] = []  # doc number -> key, None once removed
+        self._doc_of: Dict[str, int] = {}
+        self._alive = bytearray()  # doc number -> 1 while not removed
+        self._doc_len = array("I")
+        self._total_len = 0
+        self._dead = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_of)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._doc_of
+
+    def keys(self) -> List[str]:
+        return list(self._doc_of)
+
+    def doc(self, key: str) -> Optional[int]:
+        """Document number of a key, or None."""
+        return self._doc_of.get(key)
+
+    def sync(self, keys: Sequence[str], text_of: Callable[[int], str]) -> bool:
+        """
+        Make the index hold exactly `keys`, as documents 0..len(keys)-1 in that
+        order: drop the ones that are gone, add the new ones (reading text_of(i)
+        only for those) and renumber if the order moved. Callers that sync with
+        their row order can then use doc numbers as rows. Returns True if
+        anything changed.
+        """
+        keys = list(keys)
+        with self._lock:
+            if not self._dead and self._keys == keys:
+                return False
+            wanted = set(keys)
+            if len(wanted) != len(keys):
+                raise ValueError("sync() needs unique keys")
+            self.remove_many([k for k in self._doc_of if k not in wanted])
+            fresh = [i for i, k in enumerate(keys) if k not in self._doc_of]
+            self.add_many([keys[i] for i in fresh], [text_of(i) for i in fresh])
+            if self._dead or self._keys != keys:
+                new_of_old = np.full(len(self._keys), -1, dtype=np.int64)
+                new_of_old[[self._doc_of[k] for k in keys]] = np.arange(len(keys))
+                self._renumber(new_of_old)
+            return True
+
+    def _postings(self, tid: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(doc numbers, term frequencies) of a term, as read-only arrays."""
+        if self._post_docs[tid] is None:
+            offsets, docs, tfs = self._loaded
+            start, stop = offsets[tid], offsets[tid + 1]
+            return docs[start:stop], tfs[start:stop]
+        return (np.frombuffer(self._post_docs[tid], dtype=np.uint32),
+                np.frombuffer(self._post_tfs[tid], dtype=np.uint16))
+
+    # ---------- updates ----------
+
+    def add(self, key: str, text: str):
+        self.add_many([key], [text])
+
+    def add_many(self, keys: Iterable[str], texts: Iterable[str]):
+        with self._lock:
+            for key, text in zip(keys, texts):
+                if key in self._doc_of:
+                    self._remove(key)
+                doc = len(self._keys)
+                counts = Counter(tokenize(text))
+                for term, tf in counts.items():
+                    tid = self._vocab.get(term)
+                    if tid is None:
+                        tid = self._vocab[term] = len(self._terms)
+                        self._terms.append(term)
+                        self._post_docs.append(array("I"))
+                        self._post_tfs.append(array("H"))
+                    elif self._post_docs[tid] is None:
+                        docs, tfs = self._postings(tid)
+                        self._post_docs[tid] = array("I", docs.tobytes())
+                        self._post_tfs[tid] = array("H", tfs.tobytes())
+                    self._post_docs[tid].append(doc)
+                    self._post_tfs[tid].append(min(tf, MAX_TF))
+                length = sum(counts.values())
+                self._keys.append(key)
+                self._doc_of[key] = doc
+                self._alive.append(1)
+                self._doc_len.append(length)
+                self._total_len += length
+                self.generation += 1
+
+    def _remove(self, key: str) -> bool:
+        doc = self._doc_of.pop(key, None)
+        if doc is None:
+            return False
+        self._keys[doc] = None
+        self._alive[doc] = 0
+        self._total_len -= self._doc_len[doc]
+        self._dead += 1
+        self.generation += 1
+        return True
+
+    def remove_many(self, keys: Iterable[str]) -> int:
+        with self._lock:
+            removed = sum(self._remove(k) for k in keys)
+            if self._dead > max(1000, len(self._doc_of)):
+                self.compact()
+            return removed
+
+    def compact(self):
+        """Drop removed documents from every posting list and renumber the rest."""
+        with self._lock:
+            alive = np.frombuffer(self._alive, dtype=bool).copy()
+            self._renumber(np.where(alive, np.cumsum(alive, dtype=np.int64) - 1, -1))
+
+    def _renumber(self, new_of_old: np.ndarray):
+        """Make document d number new_of_old[d], dropping it where that is -1 (every removed one)."""
+        kept = np.flatnonzero(new_of_old >= 0)
+        order = kept[np.argsort(new_of_old[kept], kind="stable")]
+        # Postings stay sorted by doc number unless documents swap places
+        in_order = bool(np.all(np.diff(new_of_old[kept]) > 0))
+        post_docs, post_tfs, terms = [], [], []
+        for tid, term in enumerate(self._terms):
+            docs, tfs = self._postings(tid)
+            docs = new_of_old[docs]
+            keep = docs >= 0
+            if not keep.any():
+                continue
+            docs, tfs = docs[keep], tfs[keep]
+            if not in_order:
+                by_doc = np.argsort(docs, kind="stable")
+                docs, tfs = docs[by_doc], tfs[by_doc]
+            post_docs.append(array("I", docs.astype(np.uint32).tobytes()))
+            post_tfs.append(array("H", tfs.tobytes()))
+            terms.append(term)
+        self._terms = terms
+        self._vocab = {t: i for i, t in enumerate(terms)}
+        self._post_docs = post_docs
+        self._post_tfs = post_tfs
+        self._loaded = NO_POSTINGS
+        self._doc_len = array("I", np.frombuffer(self._doc_len, dtype=np.uint32)[order].tobytes())
+        self._keys = [self._keys[d] for d in order]
+        self._doc_of = {k: i for i, k in enumerate(self._keys)}
+        self._alive = bytearray(b"\x01" * len(self._keys))
+        self._dead = 0
+        self.generation += 1
+
+    # ---------- search ----------
+
+    def _idf(self, df: int) -> float:
+        n = len(self._doc_of)
+        return max(0.0, math.log(1.0 + (n - df + 0.5) / (df + 0.5)))
+
+    def doc_mask(self, keys: Iterable[str], invert: bool = False) -> np.ndarray:
+        """
+        Mask over document numbers for search(): the live documents among
+        `keys`, or with `invert` the live ones not among them. It stays valid
+        while `generation` is unchanged, so callers build it once per filter.
+        """
+        with self._lock:
+            docs = np.fromiter((self._doc_of[k] for k in keys if k in self._doc_of), dtype=np.int64)
+            if invert:
+                mask = np.frombuffer(self._alive, dtype=bool).copy()
+                mask[docs] = False
+            else:
+                mask = np.zeros(len(self._keys), dtype=bool)
+                mask[docs] = True
+            return mask
+
+    def search(self, query: str, k: int = 10, mask: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """
+        Top-k (key, score) by BM25, best first; only documents sharing a term
+        with the query, and only those set in `mask` if given (see doc_mask).
+        Only the postings of the query terms are scored.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            n_live = len(self._doc_of)
+            if not terms or not n_live:
+                return []
+            avgdl = self._total_len / n_live or 1.0
+            doc_len = np.frombuffer(self._doc_len, dtype=np.uint32)
+            alive = np.frombuffer(self._alive, dtype=bool) if self._dead else None
+            if mask is not None and len(mask) < len(self._keys):
+                # Documents added since the mask was built are outside it
+                mask = np.concatenate([mask, np.zeros(len(self._keys) - len(mask), dtype=bool)])
+            hit_docs, hit_scores = [], []
+            for term in terms:
+                tid = self._vocab.get(term)
+                if tid is None:
+                    continue
+                docs, tf = self._postings(tid)
+                idf = self._idf(len(docs))
+                sel = None if alive is None else alive[docs]
+                if mask is not None:
+                    sel = mask[docs] if sel is None else sel & mask[docs]
+                if sel is not None:
+                    docs, tf = docs[sel], tf[sel]
+                tf = tf.astype(np.float32)
+                norm = self.k1 * (1.0 - self.b + self.b * doc_len[docs] / avgdl)
+                hit_docs.append(docs)
+                hit_scores.append(idf * tf * (self.k1 + 1.0) / (tf + norm))
+            if not hit_docs:
+                return []
+
+            # A doc's score is the sum over the postings it appears in
+            if len(hit_docs) == 1:
+                candidates, scores = hit_docs[0], hit_scores[0].astype(np.float32)
+            elif sum(map(len, hit_docs)) * 8 < len(self._keys):
+                candidates, where = np.unique(np.concatenate(hit_docs), return_inverse=True)
+                scores = np.bincount(where, weights=np.concatenate(hit_scores)).astype(np.float32)
+            else:
+                # Postings spanning much of the corpus: summing by doc number beats sorting them
+                scores = np.bincount(np.concatenate(hit_docs), weights=np.concatenate(hit_scores))
+                candidates = np.flatnonzero(scores)
+                scores = scores[candidates].astype(np.float32)
+            positive = scores > 0
+            candidates, scores = candidates[positive], scores[positive]
+            if len(candidates) > k:
+                part = np.argpartition(-scores, k - 1)[:k]
+                part.sort()
+                candidates, scores = candidates[part], scores[part]
+            order = np.argsort(-scores, kind="stable")
+            return [(self._keys[d], float(score)) for d, score in zip(candidates[order], scores[order])]
+
+    def doc_freq(self, term: str) -> int:
+        tid = self._vocab.get(term)
+        if tid is None:
+            return 0
+        if self._post_docs[tid] is None:
+            offsets = self._loaded[0]
+            return int(offsets[tid + 1] - offsets[tid])
+        return len(self._post_docs[tid])
+
+    def confident_hits(self, query: str, hits: List[Tuple[str, float]],
+                       max_df: int = 3, margin: float = 2.0) -> Optional[List[Tuple[str, float]]]:
+        """
+        The hits worth returning without a dense lookup, or None if the query
+        is not "easy". A query is easy when it names a rare identifier (in at
+        most `max_df` chunks), the best lexical hit contains it and beats the
+        runner-up by `margin`; a lone hit must score at least that term's
+        idf / `margin`. Only hits within `margin` of the best are kept, which
+        usually cuts top_k for these queries.
+        """
+        if not hits:
+            return None
+        rare = [t for t in set(tokenize(query)) if is_identifier(t) and 0 < self.doc_freq(t) <= max_df]
+        if not rare:
+            return None
+        best_key, best = hits[0]
+        with self._lock:
+            # The best hit must itself contain the identifier; hits filtered by
+            # the caller (or a weak match on other terms) would not
+            doc = self._doc_of.get(best_key)
+            held = [t for t in rare if doc is not None
+                    and (self._postings(self._vocab[t])[0] == doc).any()]
+            if not held:
+                return None
+            # A lone hit has no runner-up to beat; the identifier must carry real weight in it instead
+            floor = max(self._idf(self.doc_freq(t)) for t in held) / margin
+        runner_up = hits[1][1] if len(hits) > 1 else 0.0
+        if best < max(margin * runner_up, floor):
+            return None
+        return [h for h in hits if h[1] * margin >= best]
+
+    # ---------- persistence ----------
+
+    def save(self, path: Optional[str] = None):
+        """Write a compacted copy as one CSR-style .npz (concatenated postings + offsets)."""
+        path = path or self.path
+        with self._lock:
+            if self._dead:
+                self.compact()
+            postings = [self._postings(tid) for tid in range(len(self._terms))]
+            lengths = np.array([len(docs) for docs, _ in postings], dtype=np.int64)
+            offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=offsets[1:])
+            docs = np.concatenate([docs for docs, _ in postings] or [np.zeros(0, dtype=np.uint32)])
+            tfs = np.concatenate([tfs for _, tfs in postings] or [np.zeros(0, dtype=np.uint16)])
+            arrays = {
+                "terms": np.array(self._terms, dtype=str),
+                "offsets": offsets,
+                "docs": docs,
+                "tfs": tfs,
+                "keys": np.array(self._keys, dtype=str),
+                "doc_len": np.frombuffer(self._doc_len, dtype=np.uint32),
+            }
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    def _load(self, path: str):
+        with np.load(path, allow_pickle=False) as data:
+            terms = data["terms"].tolist()
+            offsets = data["offsets"]
+            docs = data["docs"].astype(np.uint32)
+            tfs = data["tfs"].astype(np.uint16)
+            keys = data["keys"].tolist()
+            doc_len = data["doc_len"].astype(np.uint32)
+        self._terms = terms
+        self._vocab = {t: i for i, t in enumerate(terms)}
+        # Postings stay slices of the loaded arrays until a term gets a new document
+        self._loaded = (offsets, docs, tfs)
+        self._post_docs = [None] * len(terms)
+        self._post_tfs = [None] * len(terms)
+        self._keys = keys
+        self._doc_of = {k: i for i, k in enumerate(keys)}
+        self._alive = bytearray(b"\x01" * len(keys))
+        self._doc_len = array("I", doc_len.tobytes())
+        self._total_len = int(doc_len.sum())
+        self._dead = 0
+        self.generation += 1
@@ -0,0 +1,311 @@
+"""
+Columnar, memory-mapped chunk store: one file per chunk set.
+
+Replaces the JSON chunk lists (ingest/chunks.json, embeddings_meta.json and
+the vector store's chunk_meta.json). Those repeated every key for every
+chunk, stored the text twice and had to be parsed whole before the first
+lookup. Here each column is a fixed-width array and all texts are one utf-8
+blob, so opening a store is one mmap plus a few np.frombuffer views.
+Loading is O(1) in the number of chunks, and any row can be read directly.
+
+Layout (little-endian, sections 8-byte aligned):
+    header          magic "QACHUNKS", format version, id width, row count,
+                    source count, then the byte offset of every section
+    source_offsets  uint64 [n_sources + 1]  into source_blob
+    source_blob     utf-8 source names (the distinct ones, usually few)
+    ids             S<id width> [count]     chunk ids, utf-8, NUL-padded
+    source_idx      uint32 [count]          row -> source number
+    chunk_index     int32 [count]           position within the source, -1 if unknown
+    text_offsets    uint64 [count + 1]      into texts
+    texts           utf-8 chunk texts, back to back
+
+ChunkStoreWriter appends rows one at a time to temp files, so a store can
+be written from a generator without holding the chunks in memory, and it
+can resume from a checkpoint. The file is swapped in only when the writer
+closes cleanly.
+"""
+
+import os
+import mmap
+import struct
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+MAGIC = b"QACHUNKS"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sIIQQ7Q")
+SECTIONS = ("source_offsets", "source_blob", "ids", "source_idx", "chunk_index", "text_offsets", "texts")
+COPY_BLOCK = 1 << 20
+
+
+def _pad(f) -> int:
+    pos = f.tell()
+    if pos % 8:
+        f.write(b"\0" * (8 - pos % 8))
+    return f.tell()
+
+
+def _copy(src, dst, limit: Optional[int] = None):
+    remaining = limit
+    while remaining is None or remaining > 0:
+        block = src.read(COPY_BLOCK if remaining is None else min(COPY_BLOCK, remaining))
+        if not block:
+            break
+        dst.write(block)
+        if remaining is not None:
+            remaining -= len(block)
+
+
+# One fixed-size record per row in the writer's temp file
+ROW_RECORD = np.dtype([("source", "<u4"), ("index", "<i4"), ("text_end", "<u8")])
+TEMP_PARTS = ("texts", "ids", "rows")
+
+
+class ChunkStoreWriter:
+    """
+    Appends rows to temp files next to `path` (or in `work_dir`) and assembles
+    the store on close(), so memory stays flat however many rows are written.
+    state() records how far the temp files are valid; passing it back as
+    `resume` truncates them to that point and carries on, which lets an
+    interrupted run continue from its last checkpoint.
+    """
+
+    def __init__(self, path, work_dir=None, resume: Optional[Dict[str, Any]] = None):
+        self.path = Path(path)
+        work = Path(work_dir) if work_dir else self.path.parent
+        work.mkdir(parents=True, exist_ok=True)
+        self._parts = {name: work / f"{self.path.name}.{name}.tmp" for name in TEMP_PARTS}
+        self._files = {}
+        if resume:
+            for name, part in self._parts.items():
+                f = open(part, "r+b")
+                f.truncate(resume["sizes"][name])
+                f.seek(0, os.SEEK_END)
+                self._files[name] = f
+            self.rows = resume["rows"]
+            self._id_width = resume["id_width"]
+            self._source_of = {s: i for i, s in enumerate(resume["sources"])}
+        else:
+            self._files = {name: open(part, "wb") for name, part in self._parts.items()}
+            self.rows = 0
+            self._id_width = 1
+            self._source_of: Dict[str, int] = {}
+        self._text_end = self._files["texts"].tell()
+
+    def __len__(self):
+        return self.rows
+
+    def add(self, chunk_id: str, source: Optional[str], index: Optional[int], text: str):
+        data = (text or "").encode("utf-8")
+        cid = (chunk_id or "").encode("utf-8")
+        if b"\n" in cid:
+            raise ValueError(f"chunk id {chunk_id!r} contains a newline")
+        self._files["texts"].write(data)
+        self._text_end += len(data)
+        self._files["ids"].write(cid + b"\n")
+        self._id_width = max(self._id_width, len(cid))
+        src = self._source_of.setdefault(source or "", len(self._source_of))
+        record = np.array([(src, -1 if index is None else int(index), self._text_end)], dtype=ROW_RECORD)
+        self._files["rows"].write(record.tobytes())
+        self.rows += 1
+
+    def add_entry(self, entry: Dict[str, Any]):
+        """Add a chunk dict: {"id" or "chunk_id", "source", "index" or "chunk_index", "text"}."""
+        index = entry.get("index", entry.get("chunk_index"))
+        self.add(entry.get("id") or entry.get("chunk_id"), entry.get("source"), index, entry.get("text"))
+
+    def state(self) -> Dict[str, Any]:
+        """Flush the temp files and return what `resume` needs to continue from here."""
+        for f in self._files.values():
+            f.flush()
+            os.fsync(f.fileno())
+        return {"rows": self.rows, "id_width": self._id_width, "sources": list(self._source_of),
+                "sizes": {name: f.tell() for name, f in self._files.items()}}
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        sources = [s.encode("utf-8") for s in self._source_of]
+        source_offsets = np.zeros(len(sources) + 1, dtype="<u8")
+        np.cumsum([len(s) for s in sources], out=source_offsets[1:])
+        rows = (np.memmap(self._parts["rows"], dtype=ROW_RECORD, mode="r", shape=(self.rows,))
+                if self.rows else np.zeros(0, dtype=ROW_RECORD))
+
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(b"\0" * HEADER.size)
+            offsets = []
+            for name in SECTIONS:
+                offsets.append(_pad(f))
+                if name == "source_offsets":
+                    f.write(source_offsets.tobytes())
+                elif name == "source_blob":
+                    f.write(b"".join(sources))
+                elif name == "ids":
+                    with open(self._parts["ids"], "rb") as ids:
+                        for line in ids:
+                            f.write(line[:-1].ljust(self._id_width, b"\0"))
+                elif name == "texts":
+                    with open(self._parts["texts"], "rb") as texts:
+                        _copy(texts, f)
+                else:
+                    if name == "text_offsets":
+                        f.write(np.zeros(1, dtype="<u8").tobytes())
+                    field, dtype = {"source_idx": ("source", "<u4"), "chunk_index": ("index", "<i4"),
+                                    "text_offsets": ("text_end", "<u8")}[name]
+                    for start in range(0, self.rows, 1 << 16):
+                        f.write(np.ascontiguousarray(rows[field][start:start + (1 << 16)], dtype=dtype).tobytes())
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, self._id_width, self.rows, len(sources), *offsets))
+        del rows
+        os.replace(tmp, self.path)
+        self._remove_parts()
+
+    def abort(self):
+        for f in self._files.values():
+            f.close()
+        self._remove_parts()
+
+    def _remove_parts(self):
+        for part in self._parts.values():
+            part.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_chunk_store(path, entries: Iterable[Dict[str, Any]]) -> int:
+    """Write chunk dicts (see ChunkStoreWriter.add_entry) to `path`; returns the row count."""
+    with ChunkStoreWriter(path) as writer:
+        for entry in entries:
+            writer.add_entry(entry)
+    return len(writer)
+
+
+class ChunkStore:
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        try:
+            self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            self._file.close()
+            raise ValueError(f"{self.path} is not a chunk store")
+        magic, version, id_width, count, n_sources, *offsets = HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{self.path} is not a chunk store")
+        if version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{self.path} has chunk store format {version}, expected {FORMAT_VERSION}")
+        self.count = count
+        sec = dict(zip(SECTIONS, offsets))
+
+        source_offsets = np.frombuffer(self._buf, dtype="<u8", count=n_sources + 1, offset=sec["source_offsets"])
+        blob = self._buf[sec["source_blob"]:sec["source_blob"] + int(source_offsets[-1])]
+        self.sources = [blob[source_offsets[i]:source_offsets[i + 1]].decode("utf-8") for i in range(n_sources)]
+
+        self.ids = np.frombuffer(self._buf, dtype=f"S{id_width}", count=count, offset=sec["ids"])
+        self.source_idx = np.frombuffer(self._buf, dtype="<u4", count=count, offset=sec["source_idx"])
+        self.chunk_index = np.frombuffer(self._buf, dtype="<i4", count=count, offset=sec["chunk_index"])
+        self._text_offsets = np.frombuffer(self._buf, dtype="<u8", count=count + 1, offset=sec["text_offsets"])
+        self._texts_at = sec["texts"]
+        self._row_of: Optional[Dict[str, int]] = None
+        self._partitions: Optional[tuple] = None
+
+    def __len__(self):
+        return self.count
+
+    def id(self, row: int) -> str:
+        return self.ids[row].decode("utf-8")
+
+    def source(self, row: int) -> Optional[str]:
+        return self.sources[self.source_idx[row]] or None
+
+    def index(self, row: int) -> Optional[int]:
+        i = int(self.chunk_index[row])
+        return None if i < 0 else i
+
+    def text(self, row: int) -> str:
+        start = self._texts_at + int(self._text_offsets[row])
+        end = self._texts_at + int(self._text_offsets[row + 1])
+        return self._buf[start:end].decode("utf-8")
+
+    def meta(self, row: int) -> Dict[str, Any]:
+        return {"id": self.id(row), "source": self.source(row), "index": self.index(row)}
+
+    def row(self, row: int) -> Dict[str, Any]:
+        m = self.meta(row)
+        m["text"] = self.text(row)
+        return m
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(self.count):
+            yield self.row(i)
+
+    def id_list(self) -> List[str]:
+        return [i.decode("utf-8") for i in self.ids]
+
+    def row_of(self, chunk_id: str) -> Optional[int]:
+        """Row of a chunk id (the id -> row map is built on first call)."""
+        if self._row_of is None:
+            self._row_of = {k: i for i, k in enumerate(self.id_list())}
+        return self._row_of.get(chunk_id)
+
+    def source_partitions(self):
+        """
+        (order, offsets): rows grouped by source, source i owning
+        order[offsets[i]:offsets[i + 1]] in row order. Built on first call;
+        writers add a file's chunks back to back, so each group is usually
+        one contiguous range.
+        """
+        if self._partitions is None:
+            order = np.argsort(self.source_idx, kind="stable").astype(np.int64)
+            offsets = np.searchsorted(self.source_idx[order], np.arange(len(self.sources) + 1)).astype(np.int64)
+            self._partitions = (order, offsets)
+        return self._partitions
+
+    def rows_for_sources(self, include: Optional[Iterable[str]] = None,
+                         exclude: Optional[Iterable[str]] = None) -> Optional[np.ndarray]:
+        """
+        Sorted rows whose source is in `include` (all if empty) and not in
+        `exclude`, or None when neither is given. Unknown sources match nothing.
+        """
+        if not include and not exclude:
+            return None
+        include = set(include) if include else None
+        exclude = set(exclude or ())
+        order, offsets = self.source_partitions()
+        wanted = [i for i, s in enumerate(self.sources)
+                  if (include is None or s in include) and s not in exclude]
+        if len(wanted) == len(self.sources):
+            return np.arange(self.count, dtype=np.int64)
+        rows = np.concatenate([order[offsets[i]:offsets[i + 1]] for i in wanted] or [np.empty(0, dtype=np.int64)])
+        rows.sort()
+        return rows
+
+    def close(self):
+        # Views into the mmap must go before it can be closed
+        self.ids = self.source_idx = self.chunk_index = self._text_offsets = None
+        self._partitions = None
+        if getattr(self, "_buf", None) is not None:
+            try:
+                self._buf.close()
+            except BufferError:
+                pass  # a caller still holds a view; the mapping goes with it
+            self._buf = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,321 @@
+"""
+Token-aware, structure-aware chunking shared by build_kb and the ingest scripts.
+
+Chunks are sized in model tokens, not characters. all-MiniLM-L6-v2 reads at
+most 256 tokens, including [CLS] and [SEP], and silently drops the rest, so
+a chunk longer than that wastes text. Tokens are counted with the model's
+own tokenizer (transformers is already a dependency of sentence-transformers).
+If it cannot be loaded, or QA_CHUNK_TOKENIZER=estimate is set, a
+conservative wordpiece estimate is used instead.
+
+Text is cut at structural boundaries first, and only finer when a piece
+still does not fit:
+  markdown  headings start a new chunk, paragraphs and fenced code blocks
+            stay whole; every chunk starts with its heading trail
+            ("Checkout > Coupons")
+  html      extracted page text (see extract.py), with the HTML_ELEMENTS
+            summary chunked separately one element per line
+  json      objects and arrays are split into members, each prefixed
+            with its path ($.paths./api/cart), recursing into members too
+            big for one chunk; invalid JSON is chunked as text
+  text      paragraphs, then sentences, then words
+
+Overlap is a few whole trailing pieces (sentences, lines) of the previous
+chunk in the same section, never a raw character window.
+
+iter_chunks() is a generator: chunks are produced one at a time as the text
+is walked, so callers can embed or write them out without building a list.
+"""
+
+import os
+import re
+import json
+import logging
+import threading
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("qa-agent")
+
+EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
+MODEL_MAX_TOKENS = 256   # all-MiniLM-L6-v2 max_seq_length, including [CLS] and [SEP]
+SPECIAL_TOKENS = 2
+CHUNK_TOKENS = int(os.environ.get("QA_CHUNK_TOKENS", str(MODEL_MAX_TOKENS - SPECIAL_TOKENS)))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("QA_CHUNK_OVERLAP_TOKENS", "32"))
+
+# Bump when chunk boundaries change, so builds re-chunk files chunked by an older version
+CHUNKER_VERSION = 1
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+FENCE_RE = re.compile(r"^\s*(```|~~~)")
+SENTENCE_RE = re.compile(r"(?<=[.!?;:])\s+")
+WORDPIECE_RE = re.compile(r"[^\W\d_]+|\d+|\S")
+HTML_ELEMENTS_MARKER = "HTML_ELEMENTS:"
+HEADING_MAX_CHARS = 200
+
+TokenCounter = Callable[[str], int]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Upper-leaning wordpiece estimate: every punctuation mark is a token,
+    long words and digit runs split into several, non-ASCII letters count
+    one each.
+    """
+    n = 0
+    for m in WORDPIECE_RE.finditer(text):
+        w = m.group()
+        if not w.isascii():
+            n += len(w)
+        elif w.isdigit():
+            n += 1 + (len(w) - 1) // 3
+        elif len(w) > 1:
+            n += 1 + (len(w) - 1) // 8
+        else:
+            n += 1
+    return n
+
+
+_counter: Optional[TokenCounter] = None
+_counter_lock = threading.Lock()
+
+
+def get_token_counter() -> TokenCounter:
+    """The embedding model's tokenizer as a counter, loaded once; falls back to estimate_tokens."""
+    global _counter
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                _counter = estimate_tokens
+                if os.environ.get("QA_CHUNK_TOKENIZER", "model") != "estimate":
+                    try:
+                        from transformers import AutoTokenizer
+
+                        tokenizer = AutoTokenizer.from_pretrained(f"sentence-transformers/{EMBED_MODEL_NAME}")
+                        _counter = lambda text: len(tokenizer.tokenize(text))
+                    except Exception as e:
+                        logger.warning(f"Tokenizer unavailable, estimating chunk tokens: {str(e)}")
+    return _counter
+
+
+def detect_format(name: str) -> str:
+    name = name.lower()
+    if name.endswith((".md", ".markdown")):
+        return "markdown"
+    if name.endswith((".html", ".htm")):
+        return "html"
+    if name.endswith(".json"):
+        return "json"
+    return "text"
+
+
+# ---------- structural pieces ----------
+# Each generator yields (heading, piece, sep): the section a piece belongs to
+# (None outside any), the piece, and how it joins the piece before it.
+
+def _lines(text: str) -> Iterator[str]:
+    start = 0
+    while start < len(text):
+        end = text.find("\n", start)
+        if end < 0:
+            end = len(text)
+        yield text[start:end].rstrip("\r")
+        start = end + 1
+
+
+def _paragraphs(lines: Iterable[str]) -> Iterator[str]:
+    para: List[str] = []
+    for line in lines:
+        if line.strip():
+            para.append(line)
+        elif para:
+            yield "\n".join(para)
+            para = []
+    if para:
+        yield "\n".join(para)
+
+
+def _text_pieces(text: str) -> Iterator[Tuple[Optional[str], str, str]]:
+    for para in _paragraphs(_lines(text)):
+        yield None, para, "\n\n"
+
+
+def _markdown_pieces(text: str) -> Iterator[Tuple[Optional[str], str, str]]:
+    trail: List[Tuple[int, str]] = []
+    block: List[str] = []
+    fence: Optional[str] = None
+
+    def heading():
+        return " > ".join(t for _, t in trail)[:HEADING_MAX_CHARS] or None
+
+    for line in _lines(text):
+        if fence is not None:
+            block.append(line)
+            if line.strip().startswith(fence):
+                yield heading(), "\n".join(block), "\n\n"
+                block, fence = [], None
+            continue
+        m = FENCE_RE.match(line)
+        if m:
+            if block:
+                yield heading(), "\n".join(block), "\n\n"
+            block, fence = [line], m.group(1)
+            continue
+        m = HEADING_RE.match(line)
+        if m:
+            if block:
+                yield heading(), "\n".join(block), "\n\n"
+                block = []
+            level = len(m.group(1))
+            trail = [(lvl, t) for lvl, t in trail if lvl < level] + [(level, m.group(2))]
+            continue
+        if line.strip():
+            block.append(line)
+        elif block:
+            yield heading(), "\n".join(block), "\n\n"
+            block = []
+    if block:
+        yield heading(), "\n".join(block), "\n\n"
+
+
+def _html_pieces(text: str) -> Iterator[Tuple[Optional[str], str, str]]:
+    # extract.py puts every text node on its own line, then the element summary
+    section = None
+    for line in _lines(text):
+        line = line.strip()
+        if not line:
+            continue
+        if line == HTML_ELEMENTS_MARKER:
+            section = HTML_ELEMENTS_MARKER
+            continue
+        yield section, line, "\n" if section else " "
+
+
+def _json_pieces(value: Any, path: str, budget: int, count: TokenCounter) -> Iterator[Tuple[Optional[str], str, str]]:
+    if isinstance(value, dict):
+        items = value.items()
+        label = lambda k: json.dumps(k, ensure_ascii=False)
+        child = lambda k: f"{path}.{k}"
+    elif isinstance(value, list):
+        items = enumerate(value)
+        label = lambda i: f"[{i}]"
+        child = lambda i: f"{path}[{i}]"
+    else:
+        yield path, json.dumps(value, ensure_ascii=False), "\n"
+        return
+    heading = None if path == "$" else path  # top-level members need no prefix
+    for key, member in items:
+        piece = f"{label(key)}: {json.dumps(member, ensure_ascii=False)}"
+        # A token is rarely longer than a few characters; skip counting members that cannot fit
+        fits = len(piece) <= budget * 10 and count(piece) <= budget
+        if fits or not isinstance(member, (dict, list)) or not member:
+            yield heading, piece, "\n"
+        else:
+            yield from _json_pieces(member, child(key), budget, count)
+
+
+# ---------- fitting and packing ----------
+
+def _split_to_fit(text: str, budget: int, count: TokenCounter) -> Iterator[Tuple[str, int, Optional[str]]]:
+    """
+    Cut `text` into (piece, tokens, sep) no larger than budget: sentences,
+    then lines, then words, then characters. sep is None for the first piece.
+    """
+    n = count(text)
+    if n <= budget:
+        yield text, n, None
+        return
+    for splitter, sep in ((SENTENCE_RE, " "), (re.compile(r"\n+"), "\n"), (re.compile(r"\s+"), " ")):
+        parts = [p for p in splitter.split(text) if p]
+        if len(parts) > 1:
+            for part in parts:
+                for piece, tokens, inner in _split_to_fit(part, budget, count):
+                    yield piece, tokens, sep if inner is None else inner
+            return
+    # One unbroken run (minified code, base64...): hard cut
+    step = max(1, len(text) * budget // n)
+    start = 0
+    while start < len(text):
+        piece = text[start:start + step]
+        while count(piece) > budget and len(piece) > 1:
+            piece = piece[:len(piece) // 2]
+        yield piece, count(piece), "" if start else None
+        start += len(piece)
+
+
+def _pack(pieces: Iterable[Tuple[Optional[str], str, str]], max_tokens: int, overlap_tokens: int,
+          count: TokenCounter) -> Iterator[str]:
+    heading: Optional[str] = None
+    head_tokens = 0
+    current: List[Tuple[str, int, str]] = []   # (piece, tokens, sep)
+    used = 0
+
+    def render():
+        body = current[0][0] + "".join(sep + piece for piece, _, sep in current[1:])
+        return f"{heading}\n{body}" if heading else body
+
+    for section, text, sep in pieces:
+        if section != heading:
+            if current:
+                yield render()
+            current, used = [], 0
+            heading = section
+            head_tokens = count(heading) + 1 if heading else 0
+        budget = max(1, max_tokens - head_tokens)
+        for piece, tokens, inner in _split_to_fit(text, budget, count):
+            piece_sep = sep if inner is None else inner
+            if current and used + tokens > budget:
+                yield render()
+                # Carry whole trailing pieces of the previous chunk as overlap
+                tail: List[Tuple[str, int, str]] = []
+                carried = 0
+                for prev in reversed(current):
+                    if carried + prev[1] > overlap_tokens or carried + prev[1] + tokens > budget:
+                        break
+                    tail.insert(0, prev)
+                    carried += prev[1]
+                current, used = tail, carried
+            current.append((piece, tokens, piece_sep))
+            used += tokens
+    if current:
+        yield render()
+
+
+def iter_chunks(text: str, fmt: str = "text", max_tokens: int = CHUNK_TOKENS,
+                overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                count: Optional[TokenCounter] = None,
+                keep: Optional[Callable[[str], bool]] = None) -> Iterator[str]:
+    """
+    Yield chunks of `text` (in format `fmt`, see detect_format) of at most
+    `max_tokens` model tokens each. Blocks (paragraphs, lines, JSON members)
+    for which keep(block) is false are left out before packing.
+    """
+    if not text or not text.strip():
+        return
+    count = count or get_token_counter()
+    max_tokens = max(1, min(max_tokens, MODEL_MAX_TOKENS - SPECIAL_TOKENS))
+    overlap_tokens = max(0, min(overlap_tokens, max_tokens // 2))
+    text = text.replace("\r\n", "\n")
+
+    if fmt == "json":
+        try:
+            value = json.loads(text)
+        except ValueError:
+            value = None
+        if isinstance(value, (dict, list)):
+            pieces = _json_pieces(value, "$", max_tokens, count)
+        else:
+            pieces = _text_pieces(text)
+    elif fmt == "markdown":
+        pieces = _markdown_pieces(text)
+    elif fmt == "html":
+        pieces = _html_pieces(text)
+    else:
+        pieces = _text_pieces(text)
+
+    if keep is not None:
+        pieces = (p for p in pieces if keep(p[1]))
+
+    for chunk in _pack(pieces, max_tokens, overlap_tokens, count):
+        chunk = chunk.strip()
+        if chunk:
+            yield chunk
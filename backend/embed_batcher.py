@@ -0,0 +1,161 @@
+"""
+Micro-batching scheduler for embedding requests.
+
+Concurrent /generate_testcases/ calls each embed one short query. Run one
+by one, the model does many batch-of-1 forward passes, which wastes most of
+a CPU's throughput. MicroBatcher puts every request on a queue. A single
+thread takes the first queued request and keeps collecting until `window_ms`
+has passed since that request arrived, or `max_items` texts are waiting.
+It then runs one encode call and hands each caller its own rows.
+
+The window trades latency for throughput. 0 never waits: only requests that
+queued while the model was busy share a batch. A few milliseconds lets
+requests that arrive together share one. Requests that queued while the
+previous batch ran are past their window already, so they go out at once.
+
+stats() reports batch sizes (counts, histogram) and queue time (from
+submit to the start of its encode), the latter over the last requests only.
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("qa-agent")
+
+WINDOW_MS = float(os.environ.get("QA_EMBED_BATCH_WINDOW_MS", "5"))
+MAX_ITEMS = int(os.environ.get("QA_EMBED_BATCH_MAX", "64"))
+
+# Upper bounds of the batch size histogram buckets
+HISTOGRAM_BOUNDS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+QUEUE_SAMPLES = 1024
+
+
+class _Request:
+    __slots__ = ("texts", "kwargs", "submitted", "done", "result", "error")
+
+    def __init__(self, texts: List[str], kwargs: Dict[str, Any]):
+        self.texts = texts
+        self.kwargs = kwargs
+        self.submitted = time.perf_counter()
+        self.done = threading.Event()
+        self.result: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+
+
+class MicroBatcher:
+    def __init__(self, encode: Callable[..., np.ndarray], window_ms: float = WINDOW_MS,
+                 max_items: int = MAX_ITEMS, name: str = "embed-batcher"):
+        """`encode(texts, **kwargs)` must return one row per text."""
+        self.encode = encode
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_items = max(1, max_items)
+        self.name = name
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+        self._items = 0
+        self._max_batch = 0
+        self._histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        self._queue_ms: "deque[float]" = deque(maxlen=QUEUE_SAMPLES)
+
+    def submit(self, texts: List[str], **kwargs) -> np.ndarray:
+        """Encode `texts` as part of the next batch; blocks until its rows are ready."""
+        if not texts:
+            return self.encode([], **kwargs)
+        self._ensure_started()
+        req = _Request(list(texts), kwargs)
+        self._queue.put(req)
+        req.done.wait()
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+                    self._thread.start()
+
+    def _collect(self) -> List[_Request]:
+        pending = [self._queue.get()]
+        n_items = len(pending[0].texts)
+        deadline = pending[0].submitted + self.window
+        while n_items < self.max_items:
+            timeout = deadline - time.perf_counter()
+            try:
+                req = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            pending.append(req)
+            n_items += len(req.texts)
+        return pending
+
+    def _loop(self):
+        while True:
+            pending = self._collect()
+            # Requests can only share an encode call if they use the same options
+            groups: Dict[Tuple, List[_Request]] = {}
+            for req in pending:
+                groups.setdefault(tuple(sorted(req.kwargs.items())), []).append(req)
+            for reqs in groups.values():
+                self._run(reqs)
+
+    def _run(self, reqs: List[_Request]):
+        texts = [t for r in reqs for t in r.texts]
+        started = time.perf_counter()
+        try:
+            vectors = self.encode(texts, **reqs[0].kwargs)
+            pos = 0
+            for r in reqs:
+                r.result = vectors[pos:pos + len(r.texts)]
+                pos += len(r.texts)
+        except BaseException as e:
+            logger.error(f"Batched encode of {len(texts)} texts failed: {str(e)}")
+            for r in reqs:
+                r.error = e
+        self._record(reqs, len(texts), started)
+        for r in reqs:
+            r.done.set()
+
+    def _record(self, reqs: List[_Request], n_items: int, started: float):
+        bucket = next((i for i, b in enumerate(HISTOGRAM_BOUNDS) if n_items <= b), len(HISTOGRAM_BOUNDS))
+        with self._stats_lock:
+            self._requests += len(reqs)
+            self._batches += 1
+            self._items += n_items
+            self._max_batch = max(self._max_batch, n_items)
+            self._histogram[bucket] += 1
+            self._queue_ms.extend((started - r.submitted) * 1000.0 for r in reqs)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            waits = np.array(self._queue_ms, dtype=np.float64)
+            labels = [f"<={b}" for b in HISTOGRAM_BOUNDS] + [f">{HISTOGRAM_BOUNDS[-1]}"]
+            return {
+                "window_ms": self.window * 1000.0,
+                "max_items": self.max_items,
+                "requests": self._requests,
+                "batches": self._batches,
+                "items": self._items,
+                "avg_batch_items": round(self._items / self._batches, 2) if self._batches else None,
+                "max_batch_items": self._max_batch,
+                "batch_items_histogram": {l: n for l, n in zip(labels, self._histogram) if n},
+                "queue_ms": {
+                    "avg": round(float(waits.mean()), 3),
+                    "p50": round(float(np.percentile(waits, 50)), 3),
+                    "p95": round(float(np.percentile(waits, 95)), 3),
+                    "max": round(float(waits.max()), 3),
+                } if len(waits) else None,
+            }
@@ -0,0 +1,241 @@
+"""
+Persistent embedding cache shared by the backend, the retriever and the
+offline ingest scripts.
+
+Vectors are keyed by (model name, normalized text hash) and stored in a
+fixed-capacity memory-mapped array (float16 by default). Each slot also
+records its key and a last-used tick, so the in-memory index is rebuilt
+from the memmaps on open and the least recently used slots are reused once
+the cache is full.
+
+Several processes share the files. Writers pick and fill slots under a file
+lock, clearing a slot's key before rewriting its vector and setting the key
+last. Readers check the key before and after copying the vector, so a slot
+that another process overwrites meanwhile reads as a miss, never a wrong vector.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from shared_state import FileLock
+
+DEFAULT_CACHE_DIR = Path(os.environ.get(
+    "QA_EMBED_CACHE_DIR", Path(__file__).resolve().parent.parent / "embed_cache"))
+DEFAULT_CAPACITY = int(os.environ.get("QA_EMBED_CACHE_SIZE", "100000"))
+DEFAULT_DTYPE = os.environ.get("QA_EMBED_CACHE_DTYPE", "float16")
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def cache_key(model_name: str, text: str) -> bytes:
+    h = hashlib.sha1()
+    h.update(model_name.encode("utf-8"))
+    h.update(b"\0")
+    h.update(normalize_text(text).encode("utf-8"))
+    return h.digest()[:16]
+
+
+class EmbeddingCache:
+    def __init__(self, directory, model_name: str, capacity: int = DEFAULT_CAPACITY,
+                 dtype: str = DEFAULT_DTYPE):
+        safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in model_name)
+        self.dir = Path(directory) / safe_name
+        self.model_name = model_name
+        self.capacity = capacity
+        self.dtype = np.dtype(dtype)
+        self.dim: Optional[int] = None
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        # Serializes slot allocation and writes across processes
+        self._write_lock = FileLock(str(self.dir / "write.lock"))
+        self._slots: Dict[bytes, int] = {}
+        self._vectors = None
+        self._keys = None
+        self._ticks = None
+        self._tick = 0
+
+        if (self.dir / "meta.json").exists():
+            try:
+                self._open()
+            except Exception:
+                self._vectors = None
+
+    # ---------- storage ----------
+
+    def _open(self):
+        meta = json.loads((self.dir / "meta.json").read_text(encoding="utf-8"))
+        if meta.get("model") != self.model_name:
+            return
+        self.dim = int(meta["dim"])
+        self.capacity = int(meta["capacity"])
+        self.dtype = np.dtype(meta["dtype"])
+
+        self._vectors = np.load(self.dir / "vectors.npy", mmap_mode="r+")
+        self._keys = np.load(self.dir / "keys.npy", mmap_mode="r+")
+        self._ticks = np.load(self.dir / "ticks.npy", mmap_mode="r+")
+
+        used = np.nonzero(self._ticks)[0]
+        for slot in used:
+            self._slots[self._keys[slot].tobytes()] = int(slot)
+        self._tick = int(self._ticks.max()) if len(used) else 0
+
+    def _create(self, dim: int):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        # Another process (backend, embedChunks, the pipeline) may have created
+        # the cache since we looked; open theirs instead of truncating it under their mmaps
+        with FileLock(str(self.dir / "create.lock")):
+            if (self.dir / "meta.json").exists():
+                try:
+                    self._open()
+                except Exception:
+                    self._vectors = None
+                if self._vectors is not None:
+                    return
+            self.dim = dim
+            fmt = np.lib.format
+            arrays = {}
+            for name, dtype, shape in (("vectors", self.dtype, (self.capacity, dim)),
+                                       ("keys", np.uint8, (self.capacity, 16)),
+                                       ("ticks", np.uint64, (self.capacity,))):
+                # Built under a temp name and swapped in: a reader never maps a half-written file
+                tmp = self.dir / f"{name}.npy.tmp"
+                arr = fmt.open_memmap(tmp, mode="w+", dtype=dtype, shape=shape)
+                arr.flush()
+                os.replace(tmp, self.dir / f"{name}.npy")
+                arrays[name] = arr
+            self._vectors, self._keys, self._ticks = arrays["vectors"], arrays["keys"], arrays["ticks"]
+            meta = {"model": self.model_name, "dim": dim, "capacity": self.capacity, "dtype": self.dtype.name}
+            tmp = self.dir / "meta.json.tmp"
+            tmp.write_text(json.dumps(meta), encoding="utf-8")
+            os.replace(tmp, self.dir / "meta.json")
+
+    def _free_slots(self, n: int) -> np.ndarray:
+        """Pick n slots to write, evicting the least recently used ones."""
+        n = min(n, self.capacity)
+        slots = np.argpartition(self._ticks, n - 1)[:n] if n < self.capacity else np.arange(self.capacity)
+        for slot in slots:
+            if self._ticks[slot]:
+                self._slots.pop(self._keys[slot].tobytes(), None)
+        return slots
+
+    # ---------- public API ----------
+
+    def get_many(self, keys: Sequence[bytes]) -> Dict[int, np.ndarray]:
+        """Return {position: vector} for every key that is cached."""
+        found = {}
+        if self._vectors is None:
+            self.misses += len(keys)
+            return found
+        with self._lock:
+            for pos, key in enumerate(keys):
+                slot = self._slots.get(key)
+                if slot is None or self._keys[slot].tobytes() != key:
+                    continue
+                vec = np.array(self._vectors[slot], dtype=np.float32)
+                if self._keys[slot].tobytes() != key:
+                    continue  # rewritten by another process while we copied it
+                self._tick += 1
+                self._ticks[slot] = self._tick
+                found[pos] = vec
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, keys: Sequence[bytes], vectors: np.ndarray):
+        if not len(keys):
+            return
+        vectors = np.asarray(vectors)
+        with self._lock:
+            if self._vectors is None:
+                self._create(vectors.shape[1])
+            if vectors.shape[1] != self.dim:
+                return
+            # Keep only the last `capacity` items if a huge batch overflows the cache
+            keys, vectors = list(keys)[-self.capacity:], vectors[-self.capacity:]
+            new = [(k, v) for k, v in zip(keys, vectors) if k not in self._slots]
+            if not new:
+                return
+            with self._write_lock:
+                # Ticks are shared, so the LRU pick sees slots other processes just wrote
+                self._tick = max(self._tick, int(self._ticks.max()))
+                slots = self._free_slots(len(new))
+                for slot, (key, vec) in zip(slots, new):
+                    # An empty key while the vector is rewritten: readers see a miss, not a mix
+                    self._keys[slot] = 0
+                    self._vectors[slot] = vec
+                    self._keys[slot] = np.frombuffer(key, dtype=np.uint8)
+                    self._tick += 1
+                    self._ticks[slot] = self._tick
+                    self._slots[key] = int(slot)
+
+    def flush(self):
+        with self._lock:
+            for arr in (self._vectors, self._keys, self._ticks):
+                if arr is not None:
+                    arr.flush()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._slots), "capacity": self.capacity, "hits": self.hits, "misses": self.misses}
+
+
+def encode_cached(model, texts: List[str], cache: Optional[EmbeddingCache], **encode_kwargs) -> np.ndarray:
+    """
+    Drop-in for ``model.encode(texts)`` that only runs the model for texts not
+    already in the cache. Duplicate texts in the batch are encoded once.
+    Returns a float32 array of shape (len(texts), dim).
+    """
+    encode_kwargs.setdefault("convert_to_numpy", True)
+    encode_kwargs.setdefault("show_progress_bar", False)
+    if cache is None:
+        return np.asarray(model.encode(list(texts), **encode_kwargs), dtype=np.float32)
+
+    keys = [cache_key(cache.model_name, t) for t in texts]
+    found = cache.get_many(keys)
+
+    todo: Dict[bytes, List[int]] = {}
+    for pos, key in enumerate(keys):
+        if pos not in found:
+            todo.setdefault(key, []).append(pos)
+
+    if todo:
+        first = [positions[0] for positions in todo.values()]
+        fresh = np.asarray(model.encode([texts[p] for p in first], **encode_kwargs))
+        cache.put_many(list(todo.keys()), fresh)
+        # Round-trip through the store dtype so hits and misses return identical vectors
+        fresh = fresh.astype(cache.dtype).astype(np.float32)
+        for vec, positions in zip(fresh, todo.values()):
+            for p in positions:
+                found[p] = vec
+        cache.flush()
+
+    if not found:
+        return np.zeros((0, cache.dim or 0), dtype=np.float32)
+    return np.stack([found[p] for p in range(len(texts))])
+
+
+_default_caches: Dict[str, EmbeddingCache] = {}
+_default_lock = threading.Lock()
+
+
+def get_default_cache(model_name: str) -> Optional[EmbeddingCache]:
+    """Process-wide cache for a model; QA_EMBED_CACHE=0 disables caching."""
+    if os.environ.get("QA_EMBED_CACHE", "1") == "0":
+        return None
+    with _default_lock:
+        if model_name not in _default_caches:
+            _default_caches[model_name] = EmbeddingCache(DEFAULT_CACHE_DIR, model_name)
+        return _default_caches[model_name]
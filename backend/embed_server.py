@@ -0,0 +1,217 @@
+"""
+Shared embedding service for multi-worker deployments.
+
+One process loads the sentence-transformers model (and torch) once; every
+uvicorn worker talks to it over local IPC (multiprocessing.connection on a
+Unix socket, or localhost TCP on Windows) instead of loading its own copy.
+Encode requests from all workers go through one MicroBatcher, so requests
+that arrive together are encoded in one batch. The server is also the only writer
+of the embedding cache.
+
+    QA_EMBED_AUTHKEY=<secret> python backend/embed_server.py --address unix:/tmp/qa-embed.sock
+
+backend/run.py starts it automatically when QA_WORKERS > 1, with a random
+key. Workers find it through QA_EMBED_SERVER (the address) and
+QA_EMBED_AUTHKEY. Connections unpickle what clients send, so there is no
+default key: the server and clients refuse to run without one, and Unix
+sockets are created readable and writable by the owner only.
+"""
+
+import os
+import sys
+import tempfile
+import time
+import logging
+import argparse
+import threading
+import multiprocessing
+from multiprocessing.connection import Client, Listener
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from embed_batcher import WINDOW_MS, MicroBatcher
+from embed_cache import encode_cached, get_default_cache
+
+logger = logging.getLogger("qa-agent")
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+MAX_BATCH = int(os.environ.get("QA_EMBED_SERVER_MAX_BATCH", "256"))
+
+
+def parse_address(address: str) -> Tuple[Any, str]:
+    """"unix:/path.sock" or "host:port" -> (address, family) for multiprocessing.connection."""
+    if address.startswith("unix:"):
+        return address[len("unix:"):], "AF_UNIX"
+    host, port = address.rsplit(":", 1)
+    return (host, int(port)), "AF_INET"
+
+
+def default_address() -> str:
+    if os.name == "nt":
+        return "127.0.0.1:7811"
+    return f"unix:{os.path.join(tempfile.gettempdir(), 'qa-embed.sock')}"
+
+
+def default_authkey() -> bytes:
+    key = os.environ.get("QA_EMBED_AUTHKEY")
+    if not key:
+        raise RuntimeError("QA_EMBED_AUTHKEY is not set; the embedding server needs a shared secret key")
+    return key.encode("utf-8")
+
+
+class EmbedServer:
+    def __init__(self, address: str, authkey: Optional[bytes] = None, model_name: str = MODEL_NAME,
+                 max_batch: int = MAX_BATCH, window_ms: float = WINDOW_MS):
+        self.address = address
+        self.authkey = authkey or default_authkey()
+        self.model_name = model_name
+        self.batcher = MicroBatcher(self._encode, window_ms=window_ms, max_items=max_batch)
+        self._model = None
+        self._cache = None
+        self._model_lock = threading.Lock()
+
+    def serve_forever(self, ready: Optional[Any] = None):
+        addr, family = parse_address(self.address)
+        if family == "AF_UNIX":
+            if os.path.exists(addr):
+                os.remove(addr)  # left over from a previous run
+            # Owner-only from the moment it is bound
+            old_umask = os.umask(0o177)
+            try:
+                listener = Listener(addr, family=family, authkey=self.authkey)
+            finally:
+                os.umask(old_umask)
+        else:
+            listener = Listener(addr, family=family, authkey=self.authkey)
+        threading.Thread(target=self._load_model, name="embed-model-loader", daemon=True).start()
+        logger.info(f"Embedding server listening on {self.address}")
+        if ready is not None:
+            ready.set()
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                logger.warning(f"Rejected embedding client: {str(e)}")
+                continue
+            threading.Thread(target=self._serve_client, args=(conn,), daemon=True).start()
+
+    def _serve_client(self, conn):
+        with conn:
+            while True:
+                try:
+                    msg = conn.recv()
+                except (EOFError, OSError):
+                    return
+                op = msg[0]
+                if op == "encode":
+                    # Requests from all workers share the batcher, so they share forward passes
+                    try:
+                        conn.send(("ok", self.batcher.submit(msg[1], **msg[2])))
+                    except Exception as e:
+                        conn.send(("error", str(e)))
+                elif op == "stats":
+                    conn.send(("ok", dict(self.batcher.stats(), model_loaded=self._model is not None)))
+                else:
+                    conn.send(("error", f"unknown op {op!r}"))
+
+    def _load_model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+
+                    self._cache = get_default_cache(self.model_name)
+                    self._model = SentenceTransformer(self.model_name)
+                    logger.info("Embedding server model loaded")
+        return self._model
+
+    def _encode(self, texts: List[str], **kwargs) -> np.ndarray:
+        return encode_cached(self._load_model(), texts, self._cache, **kwargs)
+
+
+class EmbedClient:
+    """SentenceTransformer-compatible ``encode`` backed by the shared embedding server."""
+
+    def __init__(self, address: str, authkey: Optional[bytes] = None, connect_timeout: float = 30.0):
+        self.address = address
+        self.authkey = authkey or default_authkey()
+        self.connect_timeout = connect_timeout
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            addr, family = parse_address(self.address)
+            deadline = time.monotonic() + self.connect_timeout
+            while True:
+                try:
+                    conn = Client(addr, family=family, authkey=self.authkey)
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    # Server still starting
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.1)
+            self._local.conn = conn
+        return conn
+
+    def _call(self, *msg):
+        for attempt in (0, 1):
+            conn = self._conn()
+            try:
+                conn.send(msg)
+                status, payload = conn.recv()
+                break
+            except (EOFError, OSError):
+                # Server restarted or the connection dropped: reconnect once
+                self._local.conn = None
+                if attempt:
+                    raise
+        if status != "ok":
+            raise RuntimeError(f"Embedding server error: {payload}")
+        return payload
+
+    def encode(self, texts, show_progress_bar: bool = False, **kwargs):
+        single = isinstance(texts, str)
+        vectors = self._call("encode", [texts] if single else list(texts), kwargs)
+        return vectors[0] if single else vectors
+
+    def stats(self) -> Dict[str, Any]:
+        return self._call("stats")
+
+
+def _serve(address: str, authkey: bytes, ready):
+    logging.basicConfig(level=logging.INFO)
+    EmbedServer(address, authkey).serve_forever(ready)
+
+
+def start_server_process(address: str, authkey: Optional[bytes] = None, timeout: float = 30.0):
+    """Start the server in a child process and wait until it accepts connections."""
+    ctx = multiprocessing.get_context("spawn")
+    ready = ctx.Event()
+    proc = ctx.Process(target=_serve, args=(address, authkey or default_authkey(), ready),
+                       name="qa-embed-server", daemon=True)
+    proc.start()
+    if not ready.wait(timeout):
+        proc.terminate()
+        raise RuntimeError(f"Embedding server did not start on {address}")
+    return proc
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared embedding server for multi-worker backends.")
+    parser.add_argument("--address", default=os.environ.get("QA_EMBED_SERVER", default_address()),
+                        help='"unix:/path.sock" (default outside Windows) or "host:port"')
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--window-ms", type=float, default=WINDOW_MS,
+                        help="how long the first request of a batch waits for others")
+    args = parser.parse_args()
+    if not os.environ.get("QA_EMBED_AUTHKEY"):
+        parser.error("set QA_EMBED_AUTHKEY to a secret shared with the workers")
+    logging.basicConfig(level=logging.INFO)
+    EmbedServer(args.address, max_batch=args.max_batch, window_ms=args.window_ms).serve_forever()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+"""
+Document text extraction (HTML, PDF, text formats).
+
+Extraction is CPU-bound (HTML parsing, PDF text layout), so batches of files
+are extracted in a process pool. Workers read the file themselves, so only
+the path goes in and only the text comes back. The HTML parser defaults to
+lxml when it is installed and falls back to the pure-Python html.parser.
+bs4 is imported on first use, so importing this module stays cheap.
+
+The same HTML walk also records element locators (see locator_index.py), so
+building the KB produces the selector index without parsing pages twice.
+
+Files are sniffed by their first bytes as well as their name: a PDF is only
+ever read through PyMuPDF, and images, archives and other binaries are
+skipped, never decoded as text. A document that still decodes mostly to
+control characters is skipped too. looks_like_text() also rejects
+high-entropy noise (compressed streams, base64 blobs); callers apply it to
+each block of text while chunking (NoiseFilter). The backend and the ingest scripts share
+this module, so both keep the same content out of the index.
+"""
+
+import os
+import math
+import time
+import multiprocessing
+import logging
+import unicodedata
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from locator_index import LOCATOR_ATTRS, rank_selectors, wants_locator
+
+logger = logging.getLogger("qa-agent")
+
+ELEMENT_ATTRS = ("id", "name", "class", "type", "placeholder")
+ELEMENT_TEXT_LEN = 60
+SLOW_EXTRACT_SEC = float(os.environ.get("QA_SLOW_EXTRACT_SEC", "5"))
+
+# Text below this share of printable characters, or above this many bits of
+# entropy per character, is not prose or code. English sits near 4.2 bits
+# and source code near 5, base64 near 6, and compressed or encrypted bytes at 7-8.
+MIN_PRINTABLE = float(os.environ.get("QA_MIN_PRINTABLE", "0.95"))
+MAX_ENTROPY = float(os.environ.get("QA_MAX_ENTROPY", "5.7"))
+
+SNIFF_BYTES = 4096
+BINARY_MAGIC = (
+    (b"\x89PNG", "png"), (b"\xff\xd8\xff", "jpeg"), (b"GIF8", "gif"), (b"RIFF", "riff"),
+    (b"PK\x03\x04", "zip"), (b"\x1f\x8b", "gzip"), (b"7z\xbc\xaf", "7z"), (b"Rar!", "rar"),
+    (b"\x7fELF", "elf"), (b"\xd0\xcf\x11\xe0", "ole"), (b"SQLite format 3", "sqlite"),
+    (b"\x93NUMPY", "npy"),
+)
+
+
+def _default_html_parser() -> str:
+    configured = os.environ.get("QA_HTML_PARSER")
+    if configured:
+        return configured
+    try:
+        import lxml  # noqa: F401
+        return "lxml"
+    except ImportError:
+        return "html.parser"
+
+
+HTML_PARSER = _default_html_parser()
+
+
+def _element_text(el) -> str:
+    """el.get_text().strip()[:60] without materializing the whole subtree's text."""
+    parts = []
+    length = 0
+    for s in el.strings:
+        if not parts:
+            s = s.lstrip()
+            if not s:
+                continue
+        parts.append(s)
+        length += len(s)
+        if length > ELEMENT_TEXT_LEN:
+            break
+    return "".join(parts).strip()[:ELEMENT_TEXT_LEN]
+
+
+def scan_html(bytes_data: bytes, parser: Optional[str] = None) -> Tuple[str, List[Dict]]:
+    """Return (page text, locator records) from one walk over the tree."""
+    from bs4 import BeautifulSoup, CData, NavigableString  # heavy; only pool workers need it
+
+    soup = BeautifulSoup(bytes_data.decode("utf-8", errors="ignore"), parser or HTML_PARSER)
+
+    # One walk over the tree collects the page text, the element summary and the locator records
+    strings = []
+    elements = []
+    records = []
+    for node in soup.descendants:
+        if type(node) in (NavigableString, CData):
+            strings.append(str(node))
+        elif getattr(node, "attrs", None) is not None and node.name:
+            attrs = {k: v for k, v in node.attrs.items() if k in ELEMENT_ATTRS}
+            wanted = wants_locator(node.name, node.attrs)
+            if not attrs and not wanted:
+                continue
+            el_text = _element_text(node)
+            if attrs:
+                elements.append(f"<{node.name}> attrs={attrs} text={el_text}")
+            if wanted:
+                records.append({"tag": node.name,
+                                "attrs": {k: v for k, v in node.attrs.items() if k in LOCATOR_ATTRS},
+                                "text": el_text})
+
+    text = "\n".join(strings)
+    if elements:
+        text += "\n\nHTML_ELEMENTS:\n" + "\n".join(elements)
+    return text, records
+
+
+def extract_html(bytes_data: bytes, parser: Optional[str] = None) -> str:
+    return scan_html(bytes_data, parser)[0]
+
+
+def text_quality(text: str) -> Tuple[float, float]:
+    """
+    (share of printable characters, Shannon entropy of the ASCII characters
+    in bits per character). Non-ASCII characters are left out of the entropy,
+    so CJK or Cyrillic text, which has thousands of distinct characters, is
+    not mistaken for noise.
+    """
+    if not text:
+        return 1.0, 0.0
+    counts = Counter(text)
+    n = len(text)
+    bad = sum(c for ch, c in counts.items()
+              if ch == "\ufffd" or (ch not in "\t\n\r" and unicodedata.category(ch)[0] == "C"))
+    ascii_counts = [c for ch, c in counts.items() if ch < "\x80"]
+    n_ascii = sum(ascii_counts)
+    entropy = -sum(c / n_ascii * math.log2(c / n_ascii) for c in ascii_counts) if n_ascii else 0.0
+    return 1.0 - bad / n, entropy
+
+
+def looks_like_text(text: str) -> bool:
+    printable, entropy = text_quality(text)
+    return printable >= MIN_PRINTABLE and entropy <= MAX_ENTROPY
+
+
+class NoiseFilter:
+    """looks_like_text() as a `keep` predicate for chunker.iter_chunks that counts what it drops."""
+
+    def __init__(self):
+        self.dropped = 0
+
+    def __call__(self, text: str) -> bool:
+        if looks_like_text(text):
+            return True
+        self.dropped += 1
+        return False
+
+
+def sniff_format(filename: str, head: bytes) -> Tuple[str, Optional[str]]:
+    """
+    ("pdf" | "html" | "text" | "binary", detail) from the name and the first
+    bytes. Magic numbers win over the extension; detail names the binary kind.
+    """
+    if head.startswith(b"%PDF-"):
+        return "pdf", None
+    for magic, kind in BINARY_MAGIC:
+        if head.startswith(magic):
+            return "binary", kind
+    name = filename.lower()
+    if name.endswith(".pdf"):
+        return "pdf", None
+    if b"\x00" in head:
+        return "binary", "nul bytes"
+    if name.endswith((".html", ".htm")):
+        return "html", None
+    if head and text_quality(head.decode("utf-8", errors="replace"))[0] < MIN_PRINTABLE:
+        return "binary", "unprintable"
+    return "text", None
+
+
+def extract_pdf(bytes_data: bytes) -> str:
+    import fitz  # PyMuPDF
+    with fitz.open(stream=bytes_data, filetype="pdf") as doc:
+        return "\n".join(p.get_text() for p in doc)
+
+
+def extract_file(path: str) -> Dict:
+    """
+    Read and extract one file; runs inside a pool worker. HTML files also get
+    ranked locators. `skipped` says why a file yields no text on purpose
+    (binary content, unreadable PDF, noise).
+    """
+    start = time.perf_counter()
+    locators = None
+    skipped = None
+    fmt = None
+    try:
+        with open(path, "rb") as f:
+            content = f.read()
+        fmt, detail = sniff_format(path, content[:SNIFF_BYTES])
+        text = ""
+        if fmt == "binary":
+            skipped = f"binary ({detail})"
+        elif fmt == "pdf":
+            try:
+                text = extract_pdf(content)
+            except ImportError:
+                raise RuntimeError("PyMuPDF (pymupdf) is required to read PDF files")
+            except Exception as e:
+                skipped = f"pdf not readable: {str(e)}"
+        elif fmt == "html":
+            try:
+                text, records = scan_html(content)
+                locators = rank_selectors(records)
+            except Exception:
+                text = ""
+        else:
+            text = content.decode("utf-8", errors="ignore")
+        # Entropy is judged per block by the callers: a readable file may embed one base64 blob
+        printable = text_quality(text)[0] if text else 1.0
+        if printable < MIN_PRINTABLE:
+            skipped = f"not text ({printable:.0%} printable)"
+            text = ""
+        error = None
+    except Exception as e:
+        text = ""
+        error = str(e)
+    return {"path": path, "text": text, "locators": locators, "format": fmt, "skipped": skipped,
+            "seconds": time.perf_counter() - start, "error": error}
+
+
+class ExtractionPool:
+    """
+    Lazily started process pool for extract_file; `workers <= 1` extracts inline.
+    Workers are spawned, so a script that uses the pool needs a __main__ guard.
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned, not forked: the backend forks from a job thread of a multithreaded
+            # process (model, torch pools), and a forked child can inherit a held lock
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def extract(self, paths: Iterable[str]) -> Iterator[Dict]:
+        """Yield extract_file results in completion order."""
+        paths = list(paths)
+        if self.workers <= 1 or len(paths) <= 1:
+            for p in paths:
+                yield self._report(extract_file(p))
+            return
+
+        futures = [self._pool().submit(extract_file, p) for p in paths]
+        try:
+            for fut in as_completed(futures):
+                yield self._report(fut.result())
+        finally:
+            # Consumer stopped early (e.g. job cancelled): drop queued work
+            for fut in futures:
+                fut.cancel()
+
+    @staticmethod
+    def _report(result: Dict) -> Dict:
+        if result["seconds"] > SLOW_EXTRACT_SEC:
+            logger.warning(f"Slow extraction: {result['path']} took {result['seconds']:.1f}s")
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,253 @@
+"""
+Background job queue for long-running backend work (e.g. building the KB).
+
+Jobs run on a small thread pool so the FastAPI event loop stays free to
+answer /health and /generate_testcases/ while a build is in progress.
+Callers poll the job for progress and may request cancellation.
+
+With a state directory (multi-worker deployments), each job's status is
+also written to <dir>/<job_id>.json as it progresses, so any worker can
+answer a poll. Cancelling a job owned by another worker drops a
+<job_id>.cancel file, which the owning worker checks between units of work.
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("qa-agent")
+
+
+class JobCancelled(Exception):
+    """Raised inside a job function when the job has been cancelled."""
+
+
+PERSIST_INTERVAL = 0.5
+
+
+class Job:
+    def __init__(self, kind: str, state_dir: Optional[str] = None):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+        # Progress counters, updated by the job function
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.chunks_total = 0
+        self.chunks_done = 0
+        self.batches_total = 0
+        self.batches_done = 0
+
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._state_dir = state_dir
+        self._persisted_at = 0.0
+
+    @property
+    def cancel_requested(self) -> bool:
+        if not self._cancel.is_set() and self._state_dir and os.path.exists(self._cancel_file()):
+            self._cancel.set()
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        """Call between units of work; aborts the job if cancel was requested."""
+        if self.cancel_requested:
+            raise JobCancelled(self.id)
+
+    def set_file(self, path: str, **info):
+        with self._lock:
+            self.files.setdefault(path, {}).update(info)
+        self.persist()
+
+    def add_chunks(self, total: int = 0, done: int = 0):
+        with self._lock:
+            self.chunks_total += total
+            self.chunks_done += done
+        self.persist()
+
+    def add_batches(self, total: int = 0, done: int = 0):
+        with self._lock:
+            self.batches_total += total
+            self.batches_done += done
+        self.persist()
+
+    def _state_file(self) -> str:
+        return os.path.join(self._state_dir, f"{self.id}.json")
+
+    def _cancel_file(self) -> str:
+        return os.path.join(self._state_dir, f"{self.id}.cancel")
+
+    def persist(self, force: bool = False):
+        """Write the status for other workers (at most every PERSIST_INTERVAL unless forced)."""
+        if not self._state_dir:
+            return
+        now = time.time()
+        if not force and now - self._persisted_at < PERSIST_INTERVAL:
+            return
+        self._persisted_at = now
+        tmp = self._state_file() + f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp, self._state_file())
+
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at or time.time()
+        return end - self.started_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = self.elapsed()
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "elapsed_sec": round(elapsed, 3),
+                "files": {p: dict(info) for p, info in self.files.items()},
+                "chunks_total": self.chunks_total,
+                "chunks_done": self.chunks_done,
+                "batches_total": self.batches_total,
+                "batches_done": self.batches_done,
+                "chunks_per_sec": round(self.chunks_done / elapsed, 2) if elapsed > 0 else 0.0,
+                "result": self.result,
+                "error": self.error,
+            }
+
+
+class JobSnapshot:
+    """Read-only view of a job owned by another worker, loaded from its state file."""
+
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+        self.id = data["job_id"]
+        self.created_at = data.get("created_at", 0.0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.data)
+
+
+class JobManager:
+    """Runs job functions on a thread pool and keeps their state for polling."""
+
+    def __init__(self, max_workers: int = 1, max_finished: int = 100, state_dir: Optional[str] = None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="qa-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self.max_finished = max_finished
+        self.state_dir = state_dir
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+
+    def submit(self, kind: str, fn: Callable[..., Dict[str, Any]], *args, **kwargs) -> Job:
+        """Queue ``fn(job, *args, **kwargs)``; its return value becomes ``job.result``."""
+        job = Job(kind, state_dir=self.state_dir)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        job.persist(force=True)
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        logger.info(f"Queued {kind} job {job.id}")
+        return job
+
+    def _run(self, job: Job, fn, args, kwargs):
+        if job.cancel_requested:
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            job.persist(force=True)
+            return
+
+        job.status = "running"
+        job.started_at = time.time()
+        job.persist(force=True)
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = "completed"
+        except JobCancelled:
+            job.status = "cancelled"
+            logger.info(f"Job {job.id} cancelled")
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            logger.error(f"Job {job.id} failed: {str(e)}")
+        finally:
+            job.finished_at = time.time()
+            job.persist(force=True)
+
+    def _prune(self):
+        # Drop the oldest finished jobs so the registry doesn't grow forever
+        finished = [j for j in self._jobs.values() if j.finished_at is not None]
+        if len(finished) <= self.max_finished:
+            return
+        finished.sort(key=lambda j: j.finished_at)
+        for j in finished[:len(finished) - self.max_finished]:
+            del self._jobs[j.id]
+            if self.state_dir:
+                for path in (j._state_file(), j._cancel_file()):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    def _load_snapshot(self, job_id: str) -> Optional[JobSnapshot]:
+        if not self.state_dir or os.sep in job_id or "/" in job_id:
+            return None
+        try:
+            with open(os.path.join(self.state_dir, f"{job_id}.json"), "r", encoding="utf-8") as f:
+                return JobSnapshot(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job if job is not None else self._load_snapshot(job_id)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            jobs = dict(self._jobs)
+        if self.state_dir:
+            for name in os.listdir(self.state_dir):
+                if name.endswith(".json") and name[:-5] not in jobs:
+                    snap = self._load_snapshot(name[:-5])
+                    if snap is not None:
+                        jobs[snap.id] = snap
+        return sorted(jobs.values(), key=lambda j: j.created_at, reverse=True)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if isinstance(job, JobSnapshot):
+            # Owned by another worker, which picks this up at its next check
+            if job.data.get("finished_at") is None:
+                open(os.path.join(self.state_dir, f"{job_id}.cancel"), "w").close()
+            return job
+        job._cancel.set()
+        if job.status == "queued":
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            job.persist(force=True)
+        return job
+
+    def shutdown(self):
+        """Cancel this worker's unfinished jobs; running ones stop at their next check."""
+        with self._lock:
+            jobs = [j for j in self._jobs.values() if j.finished_at is None]
+        for job in jobs:
+            self.cancel(job.id)
+        self._executor.shutdown(wait=False, cancel_futures=True)
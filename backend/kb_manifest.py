@@ -0,0 +1,139 @@
+"""
+Content-addressed bookkeeping for incremental KB builds.
+
+Chunk ids are derived from the source path and the chunk text, so the same
+chunk always maps to the same id and re-ingesting a file upserts instead of
+duplicating. The manifest remembers, per source file, its size/mtime, content
+hash and the chunk ids it produced, so a rebuild only embeds what changed.
+It also carries a KB version number, bumped whenever chunks are added or
+removed, which caches of query results key on.
+"""
+
+import os
+import json
+import hashlib
+import uuid
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def normalize_path(path: str) -> str:
+    return os.path.normpath(path.replace("\\", "/"))
+
+
+def chunk_id(source_path: str, text: str) -> str:
+    """Deterministic id for a chunk: hash of its source path and content."""
+    h = hashlib.sha256()
+    h.update(normalize_path(source_path).encode("utf-8"))
+    h.update(b"\0")
+    h.update(text.encode("utf-8"))
+    return h.hexdigest()[:32]
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class KBManifest:
+    """
+    JSON manifest of ingested files plus the KB version:
+        {"epoch", "version": n, "files": {path: {"sha256", "size", "mtime", "chunk_size", "chunk_overlap", "chunk_ids"}}}
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.version = 0
+        # Distinguishes version numbers of a KB rebuilt from scratch (manifest deleted)
+        self.epoch = uuid.uuid4().hex[:8]
+        self._by_source: Optional[Dict[str, Set[str]]] = None
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.files = data.get("files", {})
+                self.version = int(data.get("version", 0))
+                self.epoch = data.get("epoch", self.epoch)
+            except Exception:
+                self.files = {}
+
+    @property
+    def kb_version(self) -> str:
+        return f"{self.epoch}.{self.version}"
+
+    def bump_version(self) -> int:
+        """Mark the KB contents as changed (chunks added or removed)."""
+        with self._lock:
+            self.version += 1
+            return self.version
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        return self.files.get(normalize_path(path))
+
+    def is_unchanged(self, path: str, params: Dict[str, Any]) -> bool:
+        """Cheap check: same size, mtime and chunking params as last build."""
+        entry = self.get(path)
+        if not entry:
+            return False
+        st = os.stat(path)
+        return (entry.get("size") == st.st_size
+                and entry.get("mtime") == st.st_mtime
+                and all(entry.get(k) == v for k, v in params.items()))
+
+    def same_content(self, path: str, sha256: str, params: Dict[str, Any]) -> bool:
+        entry = self.get(path)
+        if not entry:
+            return False
+        return entry.get("sha256") == sha256 and all(entry.get(k) == v for k, v in params.items())
+
+    def touch(self, path: str):
+        """Record a new mtime for a file whose content hash did not change."""
+        entry = self.get(path)
+        if entry:
+            st = os.stat(path)
+            entry["size"] = st.st_size
+            entry["mtime"] = st.st_mtime
+
+    def record(self, path: str, sha256: str, chunk_ids: List[str], params: Dict[str, Any]):
+        st = os.stat(path)
+        entry = {"sha256": sha256, "size": st.st_size, "mtime": st.st_mtime, "chunk_ids": list(chunk_ids)}
+        entry.update(params)
+        with self._lock:
+            self.files[normalize_path(path)] = entry
+            self._by_source = None
+
+    def remove(self, path: str):
+        """Forget a file, e.g. one that no longer yields any text."""
+        with self._lock:
+            if self.files.pop(normalize_path(path), None) is not None:
+                self._by_source = None
+
+    def chunk_ids_by_source(self) -> Dict[str, Set[str]]:
+        """
+        Source name (file name, as in the chunk metadata) -> ids of its chunks.
+        Built on first use after a change; source-filtered queries use it to
+        pick the lexical candidates of the wanted files.
+        """
+        by_source = self._by_source
+        if by_source is None:
+            by_source = {}
+            with self._lock:
+                for path, entry in self.files.items():
+                    by_source.setdefault(os.path.basename(path), set()).update(entry.get("chunk_ids", ()))
+                self._by_source = by_source
+        return by_source
+
+    def save(self):
+        # Write to a temp file and swap it in so a crash never leaves half a manifest
+        with self._lock:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"epoch": self.epoch, "version": self.version, "files": self.files}, f)
+            os.replace(tmp, self.path)
@@ -0,0 +1,171 @@
+"""
+Locator index built from uploaded HTML at ingestion time.
+
+For every HTML page the KB build sees, the elements a test is likely to touch
+(form controls, buttons, links, anything with an id/name/test id) are turned
+into a ranked list of selectors, most robust first:
+
+    data-testid > id > name > aria-label > placeholder > tag+type+name > text > classes
+
+A selector is only used when it matches exactly one element on the page.
+The index is persisted as JSON (page -> element -> selectors), so script
+generation resolves elements with dict lookups instead of guessing ids and
+probing fallbacks at run time.
+"""
+
+import os
+import re
+import json
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+LOCATOR_ATTRS = ("id", "name", "class", "type", "placeholder", "aria-label", "data-testid", "role", "href")
+INTERACTIVE_TAGS = {"input", "button", "select", "textarea", "a", "form", "option", "label"}
+
+_AUTO_ID = re.compile(r"\d{4,}|[0-9a-f]{8,}", re.I)  # ids that look generated, e.g. "ember1234"
+
+
+def wants_locator(tag: str, attrs: Dict) -> bool:
+    return tag in INTERACTIVE_TAGS or any(a in attrs for a in ("id", "name", "data-testid"))
+
+
+def _slug(value: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", value.lower()).strip("-")[:40]
+
+
+def _css_str(value: str) -> Optional[str]:
+    if "'" not in value:
+        return f"'{value}'"
+    if '"' not in value:
+        return f'"{value}"'
+    return None
+
+
+def _classes(attrs: Dict) -> List[str]:
+    cls = attrs.get("class") or []
+    return cls.split() if isinstance(cls, str) else list(cls)
+
+
+def rank_selectors(records: List[Dict]) -> Dict[str, Dict]:
+    """
+    records: [{"tag", "attrs", "text"}] for one page, in document order.
+    Returns {field: {"tag", "attrs", "text", "selectors": [[by, value], ...]}}.
+    """
+    records = [dict(r, text="") if r["tag"] == "form" else r for r in records]  # a form's text is its controls'
+
+    counts = Counter()
+    for r in records:
+        a = r["attrs"]
+        for key in ("data-testid", "id", "name", "aria-label", "placeholder"):
+            if a.get(key):
+                counts[(key, a[key])] += 1
+        if r["text"]:
+            counts[("text", r["tag"], r["text"])] += 1
+        cls = _classes(a)
+        if cls:
+            counts[("class", r["tag"], tuple(cls))] += 1
+        counts[("tag-type-name", r["tag"], a.get("type"), a.get("name"))] += 1
+
+    def unique(*key):
+        return counts[key] == 1
+
+    out: Dict[str, Dict] = {}
+    for r in records:
+        tag, a, text = r["tag"], r["attrs"], r["text"]
+        selectors = []
+        id_value = a.get("id")
+        stable_id = id_value and not _AUTO_ID.search(id_value)
+
+        if a.get("data-testid") and unique("data-testid", a["data-testid"]):
+            q = _css_str(a["data-testid"])
+            if q:
+                selectors.append(["css selector", f"[data-testid={q}]"])
+        if stable_id and unique("id", id_value):
+            selectors.append(["id", id_value])
+        if a.get("name") and unique("name", a["name"]):
+            selectors.append(["name", a["name"]])
+        for key in ("aria-label", "placeholder"):
+            if a.get(key) and unique(key, a[key]):
+                q = _css_str(a[key])
+                if q:
+                    selectors.append(["css selector", f"{tag}[{key}={q}]"])
+        if a.get("name") and a.get("type") and unique("tag-type-name", tag, a.get("type"), a.get("name")):
+            selectors.append(["css selector", f"{tag}[type='{a['type']}'][name='{a['name']}']"])
+        if text and tag in ("button", "a", "label", "option") and unique("text", tag, text):
+            q = _css_str(text)
+            if q:
+                selectors.append(["xpath", f"//{tag}[normalize-space()={q}]"])
+        cls = _classes(a)
+        if cls and unique("class", tag, tuple(cls)):
+            selectors.append(["css selector", tag + "".join("." + c for c in cls)])
+        if id_value and not stable_id and unique("id", id_value):
+            selectors.append(["id", id_value])  # generated-looking ids last
+
+        if not selectors:
+            continue
+
+        base = _slug(a.get("data-testid") or id_value or a.get("name") or a.get("aria-label")
+                     or a.get("placeholder") or text or tag) or tag
+        field = base
+        n = 2
+        while field in out:
+            field = f"{base}-{n}"
+            n += 1
+        out[field] = {"tag": tag, "attrs": {k: v for k, v in a.items() if k != "href"},
+                      "text": text, "selectors": selectors}
+    return out
+
+
+class LocatorIndex:
+    """page (file name) -> {"path", "url", "elements": {field: {..., "selectors"}}}, persisted as JSON."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.pages: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.pages = json.load(f)
+            except Exception:
+                self.pages = {}
+
+    def update(self, page_path: str, elements: Dict[str, Dict]):
+        entry = {"path": page_path, "url": Path(page_path).resolve().as_uri(), "elements": elements}
+        with self._lock:
+            self.pages[os.path.basename(page_path)] = entry
+
+    def get_page(self, page: str) -> Optional[Dict]:
+        return self.pages.get(os.path.basename(page))
+
+    def lookup(self, page: str, field: str) -> Optional[List[List[str]]]:
+        entry = self.get_page(page)
+        if not entry:
+            return None
+        element = entry["elements"].get(field)
+        return element["selectors"] if element else None
+
+    def match(self, page: str, words: Iterable[str], limit: int = 10) -> Dict[str, Dict]:
+        """Elements of `page` whose name, attributes or text mention any of `words`."""
+        entry = self.get_page(page)
+        if not entry:
+            return {}
+        words = {w.lower() for w in words if len(w) > 2}
+        scored = []
+        for field, el in entry["elements"].items():
+            hay = " ".join([field, el.get("text") or ""] +
+                           [str(v) for v in el["attrs"].values() if isinstance(v, str)]).lower()
+            score = sum(1 for w in words if w in hay)
+            if score:
+                scored.append((-score, field))
+        scored.sort()
+        return {field: entry["elements"][field] for _, field in scored[:limit]}
+
+    def save(self):
+        with self._lock:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.pages, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
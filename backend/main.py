@@ -1,19 +1,44 @@
 
 import os
+import sys
 import json
+import asyncio
 import uuid
+import time
 import logging
-from typing import List, Dict
-
-from fastapi import FastAPI, UploadFile, File, Body
+import threading
+from contextlib import contextmanager
+from itertools import chain
+from typing import List, Dict, Optional
+
+# Make sibling modules importable whether started as `main` or `backend.main`
+_backend_dir = os.path.dirname(os.path.abspath(__file__))
+if _backend_dir not in sys.path:
+    sys.path.insert(0, _backend_dir)
+
+from fastapi import FastAPI, UploadFile, File, Body, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
-from chromadb import PersistentClient
-from sentence_transformers import SentenceTransformer
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+# chromadb, sentence_transformers (torch), the tokenizer and bs4 are imported on
+# first use, so the server can answer /health without paying for them.
 
-from bs4 import BeautifulSoup
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+
+from jobs import JobManager, Job
+from kb_manifest import KBManifest, chunk_id, file_sha256, normalize_path
+from chunker import (CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS, CHUNKER_VERSION, MODEL_MAX_TOKENS,
+                     SPECIAL_TOKENS, detect_format, iter_chunks)
+from embed_batcher import MicroBatcher
+from embed_cache import encode_cached, get_default_cache
+from uploads import UploadIndex, UploadTooLarge, stream_to_disk
+from extract import ExtractionPool, NoiseFilter
+from testcase_store import TestcaseStore
+from locator_index import LocatorIndex
+from bm25 import BM25Index, rrf
+from query_cache import QueryCache
+from shared_state import FileLock, file_stamp
 
 
 app = FastAPI(title="QA-Agent Backend")
@@ -35,80 +60,259 @@ os.makedirs(CHROMA_DIR, exist_ok=True)
 
 EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
 
-client = PersistentClient(path=CHROMA_DIR)
 collection_name = "qa_agent_docs"
+_collection = None
+_collection_lock = threading.Lock()
+
 
-try:
-    collection = client.get_collection(collection_name)
-    logger.info(f"Loaded collection '{collection_name}'")
-except Exception:
-    collection = client.create_collection(collection_name)
-    logger.info(f"Created collection '{collection_name}'")
+def get_collection():
+    """Open (or create) the Chroma collection on first use."""
+    global _collection
+    if _collection is None:
+        with _collection_lock:
+            if _collection is None:
+                from chromadb import PersistentClient
+
+                client = PersistentClient(path=CHROMA_DIR)
+                try:
+                    coll = client.get_collection(collection_name)
+                    logger.info(f"Loaded collection '{collection_name}'")
+                except Exception:
+                    coll = client.create_collection(collection_name)
+                    logger.info(f"Created collection '{collection_name}'")
+                _collection = coll
+    return _collection
+
+# Tracks which files/chunks are already embedded so rebuilds are incremental
+KB_MANIFEST_FILE = os.path.join(CHROMA_DIR, "kb_manifest.json")
+kb_manifest = KBManifest(KB_MANIFEST_FILE)
+
+# page -> element -> ranked selectors, filled from uploaded HTML during KB builds
+LOCATOR_INDEX_FILE = os.path.join(CHROMA_DIR, "locator_index.json")
+locator_index = LocatorIndex(LOCATOR_INDEX_FILE)
+
+# Lexical index over the same chunks, fused with dense results (QA_HYBRID=0 for dense only)
+BM25_INDEX_FILE = os.path.join(CHROMA_DIR, "bm25_index.npz")
+HYBRID = os.environ.get("QA_HYBRID", "1") != "0"
+bm25_index = BM25Index(BM25_INDEX_FILE)
+# Source filters whose BM25 doc masks are kept (see _source_mask)
+LEXICAL_MASK_CACHE_SIZE = 64
+_bm25_backfill_lock = threading.Lock()
+
+# Retrieval results keyed by (KB version, top_k, normalized query); set QA_QUERY_CACHE_FILE to persist
+QUERY_CACHE_SIZE = int(os.environ.get("QA_QUERY_CACHE_SIZE", "1024"))
+query_cache = QueryCache(capacity=QUERY_CACHE_SIZE, path=os.environ.get("QA_QUERY_CACHE_FILE") or None)
+
+# Several worker processes may share chroma_db/. Builds hold this lock, so there is
+# one KB writer at a time, and each worker reloads the KB state files once
+# another worker has changed them (see refresh_kb_state).
+kb_write_lock = FileLock(os.path.join(CHROMA_DIR, ".kb_write.lock"))
+_kb_stamp = file_stamp(KB_MANIFEST_FILE)
+
+# KB builds run here so they never block the event loop. With QA_JOB_STATE_DIR
+# (set by run.py for multiple workers) any worker can report or cancel a job.
+JOB_WORKERS = int(os.environ.get("QA_JOB_WORKERS", "1"))
+job_manager = JobManager(max_workers=JOB_WORKERS, state_dir=os.environ.get("QA_JOB_STATE_DIR") or None)
+
+# Multi-worker mode: encode through the shared embedding server instead of loading the model here
+EMBED_SERVER = os.environ.get("QA_EMBED_SERVER")
+
+# HTML/PDF extraction is CPU-bound; spread a build's files over processes
+EXTRACT_WORKERS = int(os.environ.get("QA_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+extraction_pool = ExtractionPool(workers=EXTRACT_WORKERS)
 
 # Lazy load embedding model to save memory
 _embed_model = None
+_embed_model_lock = threading.Lock()
 
 def get_embed_model():
     global _embed_model
     if _embed_model is None:
-        logger.info("Loading embedding model...")
-        _embed_model = SentenceTransformer(EMBED_MODEL_NAME)
+        with _embed_model_lock:
+            if _embed_model is None:
+                if EMBED_SERVER:
+                    from embed_server import EmbedClient
+
+                    logger.info(f"Using embedding server at {EMBED_SERVER}")
+                    _embed_model = EmbedClient(EMBED_SERVER)
+                else:
+                    from sentence_transformers import SentenceTransformer
+
+                    logger.info("Loading embedding model...")
+                    _embed_model = SentenceTransformer(EMBED_MODEL_NAME)
     return _embed_model
 
 
+def _encode_local(texts: List[str]):
+    return encode_cached(get_embed_model(), texts, get_default_cache(EMBED_MODEL_NAME))
+
+
+# Concurrent requests' texts are encoded together (QA_EMBED_BATCH_WINDOW_MS, QA_EMBED_BATCH_MAX)
+embed_batcher = MicroBatcher(_encode_local)
+
+
+def embed_texts(texts: List[str]):
+    """Encode texts with the shared model, skipping any already in the on-disk embedding cache."""
+    if EMBED_SERVER:
+        # The embedding server batches and caches itself; workers never write to the cache
+        return encode_cached(get_embed_model(), texts, None)
+    return embed_batcher.submit(texts)
+
+
+def _remember_kb_stamp():
+    global _kb_stamp
+    _kb_stamp = file_stamp(KB_MANIFEST_FILE)
+
+
+def refresh_kb_state():
+    """
+    Reload the manifest, lexical and locator indexes and reopen the collection
+    if another worker process rebuilt the KB. The manifest is saved last by
+    a build, so its file stamp is the change marker. Costs one stat otherwise.
+    """
+    global kb_manifest, bm25_index, locator_index, _collection, _kb_stamp
+    if file_stamp(KB_MANIFEST_FILE) == _kb_stamp:
+        return
+    with _collection_lock:
+        stamp = file_stamp(KB_MANIFEST_FILE)
+        if stamp == _kb_stamp:
+            return
+        _kb_stamp = stamp
+        locator_index = LocatorIndex(LOCATOR_INDEX_FILE)
+        bm25_index = BM25Index(BM25_INDEX_FILE)
+        kb_manifest = KBManifest(KB_MANIFEST_FILE)
+        if _collection is not None:
+            _collection = None
+            try:
+                # Chroma caches clients per path; drop it so the other worker's writes are read
+                from chromadb.api.client import SharedSystemClient
+                SharedSystemClient.clear_system_cache()
+            except Exception:
+                pass
+    logger.info("KB was changed by another worker; reloaded its state")
+
+
+def ensure_lexical_index():
+    """Backfill the BM25 index from the collection for KBs built before it existed."""
+    if not HYBRID or len(bm25_index):
+        return
+    with _bm25_backfill_lock:
+        if len(bm25_index):
+            return
+        total = get_collection().count()
+        if not total:
+            return
+        logger.info(f"Building lexical index over {total} existing chunks...")
+        for offset in range(0, total, 1000):
+            page = get_collection().get(include=["documents"], limit=1000, offset=offset)
+            bm25_index.add_many(page["ids"], page["documents"])
+        bm25_index.save()
+
 
-TESTCASE_FILE = "generated_testcases.json"
-if os.path.exists(TESTCASE_FILE):
-    try:
-        with open(TESTCASE_FILE, "r", encoding="utf-8") as f:
-            GENERATED_TESTCASES = json.load(f)
-    except Exception:
-        GENERATED_TESTCASES = {}
-else:
-    GENERATED_TESTCASES = {}
 
+# Append-only log; loaded on first use. The old JSON file is migrated into it once.
+TESTCASE_FILE = "generated_testcases.jsonl"
+LEGACY_TESTCASE_FILE = "generated_testcases.json"
+testcase_store = TestcaseStore(TESTCASE_FILE, legacy_path=LEGACY_TESTCASE_FILE)
 
-def save_testcases():
-    with open(TESTCASE_FILE, "w", encoding="utf-8") as f:
-        json.dump(GENERATED_TESTCASES, f, indent=2)
 
 
-def extract_text_from_file(filename: str, bytes_data: bytes) -> str:
-    name = filename.lower()
+# Warm-up loads everything the first real request would otherwise wait for.
+# /readyz starts it on demand (the load balancer's first probe); QA_WARMUP=1
+# also starts it right after startup. Readiness flips only once it finished.
+WARMUP = os.environ.get("QA_WARMUP", "0") == "1"
+WARMUP_DELAY = float(os.environ.get("QA_WARMUP_DELAY", "1.0"))
 
+_warm_up_lock = threading.Lock()
+_warm_up_state: Dict = {"status": "not_started", "steps": {}, "error": None, "seconds": None}
+
+
+def _warm_up_step(name: str, fn):
+    start = time.perf_counter()
+    result = fn()
+    _warm_up_state["steps"][name] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def warm_up():
+    """Load the model, run a dummy encode, open the collection and touch both indexes."""
+    start = time.perf_counter()
     try:
-        if name.endswith(".html") or name.endswith(".htm"):
-            soup = BeautifulSoup(bytes_data.decode("utf-8", errors="ignore"), "html.parser")
-            text = soup.get_text(separator="\n")
+        model = _warm_up_step("load_model", get_embed_model)
+        # Not through the embedding cache: the point is to run the model once
+        vec = _warm_up_step("dummy_encode", lambda: model.encode(["warm-up query"], convert_to_numpy=True))
+        coll = _warm_up_step("open_collection", get_collection)
+
+        def touch_vector_index():
+            if coll.count():
+                coll.query(query_embeddings=vec.tolist(), n_results=1)
+
+        _warm_up_step("touch_vector_index", touch_vector_index)
+        if HYBRID:
+            _warm_up_step("touch_lexical_index", lambda: (ensure_lexical_index(), bm25_index.search("warm-up query", 1)))
+    except Exception as e:
+        logger.error(f"Warm-up failed: {str(e)}")
+        _warm_up_state.update(status="failed", error=str(e))
+        return
+    _warm_up_state.update(status="ready", error=None, seconds=round(time.perf_counter() - start, 3))
+    logger.info(f"Warm-up finished in {_warm_up_state['seconds']:.1f}s")
 
-            elements = []
-            for el in soup.find_all(True):
-                attrs = {k: v for k, v in el.attrs.items()
-                         if k in ("id", "name", "class", "type", "placeholder")}
-                if attrs:
-                    elements.append(f"<{el.name}> attrs={attrs} text={el.get_text().strip()[:60]}")
-            if elements:
-                text += "\n\nHTML_ELEMENTS:\n" + "\n".join(elements)
 
-            return text
+def start_warm_up() -> bool:
+    """Run warm_up in a background thread unless it is running or done. Returns True if started."""
+    with _warm_up_lock:
+        if _warm_up_state["status"] in ("running", "ready"):
+            return False
+        _warm_up_state.update(status="running", steps={}, error=None, seconds=None)
+    threading.Thread(target=warm_up, name="qa-warmup", daemon=True).start()
+    return True
 
-        if name.endswith((".md", ".txt", ".json")):
-            return bytes_data.decode("utf-8", errors="ignore")
 
-        if name.endswith(".pdf"):
-            try:
-                import fitz
-                doc = fitz.open(stream=bytes_data, filetype="pdf")
-                return "\n".join([p.get_text() for p in doc])
-            except:
-                return ""
+async def _warm_up_later():
+    # Give uvicorn a moment to bind its socket first; the work itself runs in its own thread
+    await asyncio.sleep(WARMUP_DELAY)
+    start_warm_up()
+
+
+_warm_up_task = None
 
-        return bytes_data.decode("utf-8", errors="ignore")
 
-    except:
-        return ""
+@app.on_event("startup")
+async def _start_warm_up():
+    global _warm_up_task
+    if WARMUP:
+        _warm_up_task = asyncio.get_running_loop().create_task(_warm_up_later())
 
 
+@app.get("/livez")
+async def livez():
+    """Liveness: the process serves requests. Never waits on the model or the KB."""
+    return {"status": "alive"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 only once warm-up finished; otherwise starts it (if needed) and returns 503."""
+    if _warm_up_state["status"] == "ready":
+        return {"status": "ready", "warm_up_seconds": _warm_up_state["seconds"], "steps": _warm_up_state["steps"]}
+    failed, error = _warm_up_state["status"] == "failed", _warm_up_state["error"]
+    start_warm_up()  # a failed warm-up is retried on the next probe
+    return JSONResponse(status_code=503, content={
+        "status": "failed" if failed else "warming_up",
+        "steps": dict(_warm_up_state["steps"]),
+        "error": error,
+    })
+
+
+@app.on_event("shutdown")
+def _save_caches():
+    query_cache.save()
+
+
+@app.on_event("shutdown")
+def _stop_jobs():
+    job_manager.shutdown()
+
 
 @app.get("/")
 async def root():
@@ -117,13 +321,22 @@ async def root():
 @app.get("/health")
 async def health():
     try:
-        # Check if ChromaDB is accessible
-        collection_count = collection.count()
+        # Count documents only once the collection is open; /health must not trigger the heavy imports
+        collection_count = _collection.count() if _collection is not None else None
+        cache = None if EMBED_SERVER else get_default_cache(EMBED_MODEL_NAME)
         return {
             "status": "healthy", 
             "service": "qa-agent-backend",
             "chromadb_documents": collection_count,
-            "embedding_model_loaded": _embed_model is not None
+            "collection_open": _collection is not None,
+            "embedding_model_loaded": _embed_model is not None,
+            "embedding_server": EMBED_SERVER,
+            "warm_up": _warm_up_state["status"],
+            "embedding_cache": cache.stats() if cache is not None else None,
+            "embedding_batches": None if EMBED_SERVER else embed_batcher.stats(),
+            "lexical_index_chunks": len(bm25_index) if HYBRID else None,
+            "kb_version": kb_manifest.kb_version,
+            "query_cache": query_cache.stats()
         }
     except Exception as e:
         return {
@@ -132,45 +345,64 @@ async def health():
             "error": str(e)
         }
 
+UPLOAD_DIR = "uploaded_assets"
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB limit
+UPLOAD_CONCURRENCY = int(os.environ.get("QA_UPLOAD_CONCURRENCY", "4"))
+upload_index = UploadIndex(os.path.join(UPLOAD_DIR, ".upload_index.json"))
+
+
+async def _save_upload(f: UploadFile, sem: asyncio.Semaphore) -> Dict:
+    # Sanitize filename to prevent path traversal
+    safe_filename = os.path.basename(f.filename)
+    path = os.path.join(UPLOAD_DIR, safe_filename)
+
+    async with sem:
+        info = await stream_to_disk(f, path, MAX_FILE_SIZE, known_sha256=upload_index.get(path))
+
+    entry = {"filename": safe_filename, "path": path, "size": info["size"], "sha256": info["sha256"]}
+    if info["unchanged"]:
+        entry["unchanged"] = True
+        logger.info(f"Identical to existing file, kept: {path}")
+    else:
+        duplicate = upload_index.find(info["sha256"])
+        if duplicate and duplicate != path:
+            entry["duplicate_of"] = duplicate
+        await run_in_threadpool(upload_index.record, path, info["sha256"])
+        logger.info(f"Saved file: {path} ({info['size']} bytes)")
+    return entry
+
+
 @app.post("/upload_files/")
 async def upload_files(files: List[UploadFile] = File(...)):
     try:
-        saved = []
-        upload_dir = "uploaded_assets"
-        MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB limit
-        
         # Create upload directory if it doesn't exist
-        os.makedirs(upload_dir, exist_ok=True)
-        logger.info(f"Upload directory: {os.path.abspath(upload_dir)}")
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        logger.info(f"Upload directory: {os.path.abspath(UPLOAD_DIR)}")
 
+        named = []
         for f in files:
-            try:
-                if not f.filename:
-                    logger.warning("Received file with no filename")
-                    continue
-                
-                # Sanitize filename to prevent path traversal
-                safe_filename = os.path.basename(f.filename)
-                path = os.path.join(upload_dir, safe_filename)
-                
-                # Read file content
-                content = await f.read()
-                
-                # Check file size
-                if len(content) > MAX_FILE_SIZE:
-                    logger.warning(f"File {f.filename} too large: {len(content)} bytes")
-                    return {"status": "error", "message": f"File {f.filename} is too large (max 10MB)"}
-                
-                # Write file
-                with open(path, "wb") as fh:
-                    fh.write(content)
-                
-                saved.append({"filename": safe_filename, "path": path, "size": len(content)})
-                logger.info(f"Saved file: {path} ({len(content)} bytes)")
-                
-            except Exception as e:
-                logger.error(f"Error saving file {f.filename}: {str(e)}")
-                return {"status": "error", "message": f"Failed to save {f.filename}: {str(e)}"}
+            if not f.filename:
+                logger.warning("Received file with no filename")
+                continue
+            # Reject oversized files before writing anything
+            if f.size is not None and f.size > MAX_FILE_SIZE:
+                logger.warning(f"File {f.filename} too large: {f.size} bytes")
+                return {"status": "error", "message": f"File {f.filename} is too large (max 10MB)"}
+            named.append(f)
+
+        # Files are streamed to disk concurrently, a bounded number at a time
+        sem = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+        results = await asyncio.gather(*[_save_upload(f, sem) for f in named], return_exceptions=True)
+
+        saved = []
+        for f, res in zip(named, results):
+            if isinstance(res, UploadTooLarge):
+                logger.warning(f"File {f.filename} too large: {res} bytes")
+                return {"status": "error", "message": f"File {f.filename} is too large (max 10MB)"}
+            if isinstance(res, Exception):
+                logger.error(f"Error saving file {f.filename}: {str(res)}")
+                return {"status": "error", "message": f"Failed to save {f.filename}: {str(res)}"}
+            saved.append(res)
 
         if not saved:
             return {"status": "error", "message": "No files were saved"}
@@ -185,79 +417,203 @@ async def upload_files(files: List[UploadFile] = File(...)):
 
 
 
-@app.post("/build_kb/")
-async def build_kb(
-    file_paths: List[str] = Body(...),
-    chunk_size: int = Body(1000),
-    chunk_overlap: int = Body(200)
-):
+@contextmanager
+def kb_mutation(active: bool):
+    """Bump the KB version before and after changing chunks (even if the build fails midway)."""
+    if not active:
+        yield
+        return
+    kb_manifest.bump_version()
     try:
-        docs = []
-        metadatas = []
-        ids = []
+        yield
+    finally:
+        kb_manifest.bump_version()
+        kb_manifest.save()
+        _remember_kb_stamp()
+
+
+def _build_kb_job(job: Job, file_paths: List[str], chunk_size: int, chunk_overlap: int) -> Dict:
+    # One KB writer at a time across worker processes; start from the latest state on disk
+    with kb_write_lock:
+        refresh_kb_state()
+        return _build_kb(job, file_paths, chunk_size, chunk_overlap)
+
+
+def _build_kb(job: Job, file_paths: List[str], chunk_size: int, chunk_overlap: int) -> Dict:
+    docs = []
+    metadatas = []
+    ids = []
+
+    # Chunk ids are content-addressed, so only chunks that are new since the
+    # last build need embedding; chunks that disappeared get deleted.
+    # Sizes are in model tokens; anything past the model's input limit would be truncated
+    chunk_size = min(chunk_size, MODEL_MAX_TOKENS - SPECIAL_TOKENS)
+    chunk_overlap = min(chunk_overlap, chunk_size // 2)
+    params = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "chunker": CHUNKER_VERSION}
+    pending_files = []   # (path, sha256, chunk_ids) to record once upserted
+    stale_ids = []
+    kept_ids = []
+    kept_metadatas = []
+    unchanged_files = []
+    skipped_files = []   # binary or noise, kept out of the KB
+    dropped_files = []   # gone or extract to no text any more; forgotten once their chunks are deleted
+
+    for raw_path in file_paths:
+        job.check_cancelled()
+        job.set_file(raw_path, status="pending")
+
+    ensure_lexical_index()
+
+    to_extract = {}  # path -> (raw_path, sha256)
+
+    for raw_path in file_paths:
+        job.check_cancelled()
+        try:
+            # Normalize path separators
+            path = raw_path.replace("/", os.sep).replace("\\", os.sep)
+
+            # Check if file exists
+            if not os.path.exists(path):
+                logger.warning(f"Missing file: {path} (absolute: {os.path.abspath(path)})")
+                # Like a file that no longer yields text: its chunks must not stay searchable
+                previous = kb_manifest.get(path)
+                if previous:
+                    stale_ids.extend(previous.get("chunk_ids", []))
+                    dropped_files.append(path)
+                job.set_file(raw_path, status="missing")
+                continue
 
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size, chunk_overlap=chunk_overlap
-        )
+            is_html = path.lower().endswith((".html", ".htm"))
+            needs_locators = is_html and locator_index.get_page(path) is None
 
-        for raw_path in file_paths:
-            try:
-                # Normalize path separators
-                path = raw_path.replace("/", os.sep).replace("\\", os.sep)
-                
-                # Check if file exists
-                if not os.path.exists(path):
-                    logger.warning(f"Missing file: {path} (absolute: {os.path.abspath(path)})")
-                    continue
+            if kb_manifest.is_unchanged(path, params) and not needs_locators:
+                logger.info(f"Unchanged since last build, skipping: {path}")
+                job.set_file(raw_path, status="unchanged")
+                unchanged_files.append(os.path.basename(path))
+                continue
 
-                logger.info(f"Processing file: {path}")
+            sha256 = file_sha256(path)
+            if kb_manifest.same_content(path, sha256, params) and not needs_locators:
+                logger.info(f"Content unchanged (mtime only), skipping: {path}")
+                kb_manifest.touch(path)
+                job.set_file(raw_path, status="unchanged")
+                unchanged_files.append(os.path.basename(path))
+                continue
 
-                with open(path, "rb") as f:
-                    content = f.read()
+            job.set_file(raw_path, status="extracting")
+            to_extract[path] = (raw_path, sha256)
 
-                text = extract_text_from_file(path, content)
-                if not text:
-                    logger.warning(f"No text extracted from: {path}")
-                    continue
+        except Exception as e:
+            logger.error(f"Error processing file {raw_path}: {str(e)}")
+            job.set_file(raw_path, status="error", error=str(e))
+            continue
+
+    # Extract in the process pool; chunk each file as soon as its text is back
+    for extracted in extraction_pool.extract(to_extract):
+        job.check_cancelled()
+        path = extracted["path"]
+        raw_path, sha256 = to_extract[path]
+        try:
+            logger.info(f"Extracted {path} in {extracted['seconds']:.2f}s")
+            job.set_file(raw_path, extract_seconds=round(extracted["seconds"], 3))
+
+            if extracted["error"]:
+                raise RuntimeError(extracted["error"])
+
+            if extracted.get("locators") is not None:
+                locator_index.update(path, extracted["locators"])
+                job.set_file(raw_path, locators=len(extracted["locators"]))
+
+            previous = kb_manifest.get(path) or {}
+            previous_ids = set(previous.get("chunk_ids", []))
+
+            if extracted.get("skipped"):
+                # Record it with no chunks, so it is not re-read until it changes
+                logger.warning(f"Skipping {path}: {extracted['skipped']}")
+                stale_ids.extend(previous_ids)
+                pending_files.append((path, sha256, []))
+                skipped_files.append({"file": os.path.basename(path), "reason": extracted["skipped"]})
+                job.set_file(raw_path, status="skipped", reason=extracted["skipped"])
+                continue
 
-                chunks = splitter.split_text(text)
-                logger.info(f"Split {path} into {len(chunks)} chunks")
-
-                for i, c in enumerate(chunks):
-                    uid = str(uuid.uuid4())
-                    docs.append(c)
-                    metadatas.append({"source": os.path.basename(path), "path": path, "chunk_index": i})
-                    ids.append(uid)
-                    
-            except Exception as e:
-                logger.error(f"Error processing file {raw_path}: {str(e)}")
+            text = extracted["text"]
+            if not text:
+                logger.warning(f"No text extracted from: {path}")
+                # Chunks of an earlier version must not stay searchable
+                stale_ids.extend(previous_ids)
+                if previous:
+                    dropped_files.append(path)
+                job.set_file(raw_path, status="empty")
                 continue
 
-        if not docs:
-            return {"status": "no_docs_found", "received": file_paths, "message": "No documents could be processed"}
+            # Blocks of noise (e.g. a base64 blob inside a readable file) never reach a chunk
+            noise = NoiseFilter()
+            chunks = iter_chunks(text, detect_format(path), chunk_size, chunk_overlap, keep=noise)
+
+            file_ids = []
+            seen_ids = set()
+            new_chunks = 0
+
+            for i, c in enumerate(chunks):
+                uid = chunk_id(path, c)
+                if uid in seen_ids:
+                    continue  # identical chunk repeated within the file
+                seen_ids.add(uid)
+                file_ids.append(uid)
+                meta = {"source": os.path.basename(path), "path": normalize_path(path), "chunk_index": i}
+                if uid in previous_ids:
+                    kept_ids.append(uid)
+                    kept_metadatas.append(meta)
+                    continue
+                docs.append(c)
+                metadatas.append(meta)
+                ids.append(uid)
+                new_chunks += 1
+
+            logger.info(f"Split {path} into {len(file_ids)} chunks"
+                        + (f", dropped {noise.dropped} blocks that are not text" if noise.dropped else ""))
+            stale_ids.extend(previous_ids.difference(seen_ids))
+            pending_files.append((path, sha256, file_ids))
+
+            job.set_file(raw_path, status="extracted", chunks=len(file_ids), new_chunks=new_chunks,
+                         noise_blocks=noise.dropped)
+            job.add_chunks(total=new_chunks)
+
+        except Exception as e:
+            logger.error(f"Error processing file {raw_path}: {str(e)}")
+            job.set_file(raw_path, status="error", error=str(e))
+            continue
+
+    if not docs and not pending_files and not unchanged_files and not dropped_files:
+        return {"status": "no_docs_found", "received": file_paths, "message": "No documents could be processed"}
+
+    # Process in batches to avoid memory issues; each one is a single encode call of the batcher
+    BATCH_SIZE = embed_batcher.max_items
+    if docs:
+        logger.info(f"Generating embeddings for {len(docs)} new chunks in batches of {BATCH_SIZE}...")
+        job.add_batches(total=(len(docs) - 1) // BATCH_SIZE + 1)
 
-        # Process in batches to avoid memory issues
-        BATCH_SIZE = 50  # Process 50 chunks at a time
-        logger.info(f"Generating embeddings for {len(docs)} chunks in batches of {BATCH_SIZE}...")
-        
         try:
-            embed_model = get_embed_model()
+            get_embed_model()
         except Exception as e:
             logger.error(f"Failed to load embedding model: {str(e)}")
-            return {"status": "error", "message": f"Failed to load embedding model: {str(e)}"}
+            raise RuntimeError(f"Failed to load embedding model: {str(e)}")
 
+    # Results cached while chunks change must not outlive the change
+    with kb_mutation(bool(docs or stale_ids)):
         # Process in batches
         for i in range(0, len(docs), BATCH_SIZE):
+            job.check_cancelled()
             batch_docs = docs[i:i+BATCH_SIZE]
             batch_metadatas = metadatas[i:i+BATCH_SIZE]
             batch_ids = ids[i:i+BATCH_SIZE]
-            
+
             try:
                 logger.info(f"Processing batch {i//BATCH_SIZE + 1}/{(len(docs)-1)//BATCH_SIZE + 1} ({len(batch_docs)} chunks)...")
-                batch_embeddings = embed_model.encode(batch_docs, convert_to_numpy=True, show_progress_bar=False)
-                
+                batch_embeddings = embed_texts(batch_docs)
+
                 try:
-                    collection.add(
+                    get_collection().upsert(
                         documents=batch_docs,
                         metadatas=batch_metadatas,
                         ids=batch_ids,
@@ -265,91 +621,388 @@ async def build_kb(
                     )
                 except Exception as e:
                     logger.warning(f"Error with tolist(), trying without: {str(e)}")
-                    collection.add(
+                    get_collection().upsert(
                         documents=batch_docs,
                         metadatas=batch_metadatas,
                         ids=batch_ids,
                         embeddings=batch_embeddings
                     )
-                    
+
             except MemoryError:
                 logger.error("Out of memory while processing embeddings")
-                return {"status": "error", "message": "Out of memory. Try uploading smaller files or reduce chunk_size."}
-            except Exception as e:
-                logger.error(f"Error processing batch: {str(e)}")
-                return {"status": "error", "message": f"Error processing batch: {str(e)}"}
+                raise RuntimeError("Out of memory. Try uploading smaller files or reduce chunk_size.")
+
+            if HYBRID:
+                bm25_index.add_many(batch_ids, batch_docs)
+
+            job.add_batches(done=1)
+            job.add_chunks(done=len(batch_docs))
+
+        job.check_cancelled()
+
+        # Chunks that survived an edit may have moved; refresh their metadata without re-embedding
+        for i in range(0, len(kept_ids), BATCH_SIZE):
+            get_collection().update(ids=kept_ids[i:i+BATCH_SIZE], metadatas=kept_metadatas[i:i+BATCH_SIZE])
+
+        if stale_ids:
+            logger.info(f"Deleting {len(stale_ids)} stale chunks")
+            stale = list(stale_ids)
+            for i in range(0, len(stale), BATCH_SIZE):
+                get_collection().delete(ids=stale[i:i+BATCH_SIZE])
+            bm25_index.remove_many(stale)
+
+    # The manifest goes last: other workers reload everything once it changes
+    locator_index.save()
+    if HYBRID:
+        bm25_index.save()
+    for path, sha256, file_ids in pending_files:
+        kb_manifest.record(path, sha256, file_ids, params)
+    for path in dropped_files:
+        kb_manifest.remove(path)
+    kb_manifest.save()
+    _remember_kb_stamp()
+
+    return {
+        "status": "kb_built",
+        "num_chunks": len(docs) + len(kept_ids),
+        "new_chunks": len(docs),
+        "deleted_chunks": len(stale_ids),
+        "unchanged_files": unchanged_files,
+        "skipped_files": skipped_files,
+        "ingested_files": list({m["source"] for m in metadatas + kept_metadatas})
+    }
 
-        return {
-            "status": "kb_built",
-            "num_chunks": len(docs),
-            "ingested_files": list({m["source"] for m in metadatas})
-        }
-    
+
+@app.post("/build_kb/")
+async def build_kb(
+    file_paths: List[str] = Body(...),
+    chunk_size: int = Body(CHUNK_TOKENS),
+    chunk_overlap: int = Body(CHUNK_OVERLAP_TOKENS)
+):
+    try:
+        job = job_manager.submit("build_kb", _build_kb_job, file_paths, chunk_size, chunk_overlap)
+        return {"status": "queued", "job_id": job.id}
     except Exception as e:
         logger.error(f"Build KB error: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return {"status": "error", "message": f"Failed to build KB: {str(e)}"}
+        return {"status": "error", "message": f"Failed to queue KB build: {str(e)}"}
+
+
+@app.get("/jobs/")
+async def list_jobs():
+    jobs = job_manager.list()
+    return {"count": len(jobs), "items": [j.to_dict() for j in jobs]}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        return {"status": "error", "message": "job_not_found"}
+    return job.to_dict()
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return {"status": "error", "message": "job_not_found"}
+    return job.to_dict()
 
 
 class QueryRequest(BaseModel):
     query: str
     top_k: int = 5
+    # Only search chunks of these source files / of all but these (file names, e.g. "faq.json")
+    include_sources: Optional[List[str]] = None
+    exclude_sources: Optional[List[str]] = None
 
 
-@app.post("/generate_testcases/")
-async def generate_testcases(req: QueryRequest):
-    try:
-        result = collection.query(
-            query_texts=[req.query],
-            n_results=req.top_k
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    top_k: int = 5
+    include_sources: Optional[List[str]] = None
+    exclude_sources: Optional[List[str]] = None
+
+
+def _source_where(include_sources: Optional[List[str]], exclude_sources: Optional[List[str]]) -> Optional[Dict]:
+    """Chroma metadata filter for the source lists; Chroma applies it before the vector search."""
+    clauses = []
+    if include_sources:
+        clauses.append({"source": {"$in": list(include_sources)}})
+    if exclude_sources:
+        clauses.append({"source": {"$nin": list(exclude_sources)}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+# (include, exclude) -> (index, generation, kb version, mask); see _source_mask
+_lexical_masks: Dict[tuple, tuple] = {}
+
+
+def _source_mask(include_sources: Optional[List[str]], exclude_sources: Optional[List[str]]):
+    """
+    The lexical side of the same filter: a mask over BM25 doc numbers, from the
+    manifest's per-source ids. Built once per filter and reused until the
+    index or the manifest changes.
+    """
+    if not include_sources and not exclude_sources:
+        return None
+    key = (tuple(sorted(include_sources or ())), tuple(sorted(exclude_sources or ())))
+    index, version = bm25_index, kb_manifest.kb_version
+    cached = _lexical_masks.get(key)
+    if cached and cached[0] is index and cached[1] == index.generation and cached[2] == version:
+        return cached[3]
+
+    by_source = kb_manifest.chunk_ids_by_source()
+
+    def ids(sources):
+        return chain.from_iterable(by_source.get(s, ()) for s in sources)
+
+    generation = index.generation
+    if include_sources:
+        mask = index.doc_mask(ids(include_sources))
+        if exclude_sources:
+            mask &= index.doc_mask(ids(exclude_sources), invert=True)
+    else:
+        mask = index.doc_mask(ids(exclude_sources), invert=True)
+    if len(_lexical_masks) >= LEXICAL_MASK_CACHE_SIZE:
+        _lexical_masks.pop(next(iter(_lexical_masks)), None)
+    _lexical_masks[key] = (index, generation, version, mask)
+    return mask
+
+
+def query_kb(queries: List[str], top_k: int, include_sources: Optional[List[str]] = None,
+             exclude_sources: Optional[List[str]] = None) -> List[List[Dict]]:
+    """
+    Hybrid retrieval. Each query is first run against the BM25 index; queries
+    that name a rare identifier with a clear winner are answered from it
+    directly. The rest are embedded with the same local model used for the KB
+    (one encode call) and looked up in a single multi-query call to the
+    collection. Dense and lexical rankings are then fused by reciprocal rank.
+    include_sources / exclude_sources restrict both sides to chunks of those
+    files before ranking, so filtered-out chunks never take a top_k slot.
+    """
+    ensure_lexical_index()
+    n_candidates = top_k * 2 if HYBRID else top_k
+    mask = _source_mask(include_sources, exclude_sources) if HYBRID else None
+    where = _source_where(include_sources, exclude_sources)
+    lexical = [bm25_index.search(q, n_candidates, mask=mask) if HYBRID else [] for q in queries]
+
+    ranked_ids: List[List[str]] = [[] for _ in queries]
+    dense_queries = []
+    for qi, q in enumerate(queries):
+        # Rarity is judged corpus-wide, so a source filter can leave a "confident" hit
+        # without the identifier: filtered queries always go through dense search too
+        easy = bm25_index.confident_hits(q, lexical[qi]) if HYBRID and where is None else None
+        if easy:
+            ranked_ids[qi] = [key for key, _ in easy[:top_k]]
+        else:
+            dense_queries.append(qi)
+
+    found: Dict[str, Dict] = {}
+    if dense_queries:
+        query_embeddings = embed_texts([queries[qi] for qi in dense_queries])
+        result = get_collection().query(
+            query_embeddings=query_embeddings.tolist(),
+            n_results=n_candidates,
+            **({"where": where} if where else {})
         )
-    except Exception as e:
-        return {"status": "error", "details": str(e)}
-
-    retrieved = []
-    try:
-        for t, meta in zip(result["documents"][0], result["metadatas"][0]):
-            retrieved.append({"text": t, "meta": meta})
-    except:
-        retrieved = []
-
+        for j, qi in enumerate(dense_queries):
+            try:
+                dense_ids = result["ids"][j]
+                for uid, t, meta in zip(dense_ids, result["documents"][j], result["metadatas"][j]):
+                    found[uid] = {"text": t, "meta": meta}
+            except Exception:
+                dense_ids = []
+            if lexical[qi]:
+                fused = rrf([dense_ids, [key for key, _ in lexical[qi]]])
+                ranked_ids[qi] = [key for key, _ in fused[:top_k]]
+            else:
+                ranked_ids[qi] = dense_ids[:top_k]
+
+    # Lexical-only hits still need their text and metadata
+    missing = list({uid for ids in ranked_ids for uid in ids if uid not in found})
+    if missing:
+        got = get_collection().get(ids=missing, include=["documents", "metadatas"])
+        for uid, t, meta in zip(got["ids"], got["documents"], got["metadatas"]):
+            found[uid] = {"text": t, "meta": meta}
+
+    return [[found[uid] for uid in ids if uid in found] for ids in ranked_ids]
+
+
+def query_kb_cached(queries: List[str], top_k: int, include_sources: Optional[List[str]] = None,
+                    exclude_sources: Optional[List[str]] = None) -> List[List[Dict]]:
+    """query_kb, answering repeated queries from the result cache; only misses are looked up."""
+    refresh_kb_state()
+    version = kb_manifest.kb_version
+    query_cache.load(version)
+    # Filtered queries are cached apart from unfiltered ones (a flat string keeps keys JSON-safe)
+    extra = (HYBRID,)
+    if include_sources or exclude_sources:
+        extra += ("in:" + ",".join(sorted(include_sources or ())) + "|ex:" + ",".join(sorted(exclude_sources or ())),)
+    keys = [QueryCache.key(version, top_k, q, *extra) for q in queries]
+
+    results: List[Optional[List[Dict]]] = [query_cache.get(k) for k in keys]
+    misses = [i for i, r in enumerate(results) if r is None]
+    if misses:
+        fresh = query_kb([queries[i] for i in misses], top_k, include_sources, exclude_sources)
+        # A build that started meanwhile may have changed what we read; don't cache that
+        cacheable = kb_manifest.kb_version == version
+        for i, retrieved in zip(misses, fresh):
+            results[i] = retrieved
+            if cacheable:
+                query_cache.put(keys[i], retrieved)
+    return results
+
+
+def make_testcases(query: str, retrieved: List[Dict]) -> List[Dict]:
     generated = []
 
     for i, item in enumerate(retrieved, start=1):
         tc = {
             "Test_ID": f"TC-{i:03}",
-            "Feature": req.query,
-            "Test_Scenario": f"Validate: {req.query}",
+            "Feature": query,
+            "Test_Scenario": f"Validate: {query}",
             "Expected_Result": "The feature should work as expected.",
             "Grounded_In": [item["meta"].get("source", "unknown")],
         }
 
         uid = str(uuid.uuid4())
-        GENERATED_TESTCASES[uid] = {"id": uid, "payload": tc}
         generated.append({"id": uid, "payload": tc})
 
-    save_testcases()
+    return generated
+
+
+@app.post("/generate_testcases/")
+async def generate_testcases(req: QueryRequest):
+    try:
+        # Encoding is CPU-bound; keep it off the event loop
+        retrieved = (await run_in_threadpool(query_kb_cached, [req.query], req.top_k,
+                                             req.include_sources, req.exclude_sources))[0]
+    except Exception as e:
+        return {"status": "error", "details": str(e)}
+
+    generated = make_testcases(req.query, retrieved)
+
+    await run_in_threadpool(testcase_store.put_many, generated)
     return {"status": "ok", "generated": generated, "retrieved": len(retrieved)}
 
 
+@app.post("/generate_testcases/batch/")
+async def generate_testcases_batch(req: BatchQueryRequest):
+    queries = [q for q in req.queries if q and q.strip()]
+    if not queries:
+        return {"status": "error", "details": "No queries given"}
+
+    try:
+        retrieved_per_query = await run_in_threadpool(query_kb_cached, queries, req.top_k,
+                                                      req.include_sources, req.exclude_sources)
+    except Exception as e:
+        return {"status": "error", "details": str(e)}
+
+    results = []
+    all_generated = []
+    for query, retrieved in zip(queries, retrieved_per_query):
+        generated = make_testcases(query, retrieved)
+        all_generated.extend(generated)
+        results.append({"query": query, "generated": generated, "retrieved": len(retrieved)})
+
+    await run_in_threadpool(testcase_store.put_many, all_generated)
+    return {"status": "ok", "count": len(results), "results": results}
+
 
+
+def _testcase_filters(feature: Optional[str], source: Optional[str],
+                      created_after: Optional[float], created_before: Optional[float]) -> Dict:
+    return {"feature": feature, "source": source,
+            "created_after": created_after, "created_before": created_before}
+
+
+# Plain `def` routes run in the threadpool: the testcase log and the KB state
+# are read under inter-process file locks and may be (re)loaded from disk
 @app.get("/list_testcases/")
-async def list_testcases():
-    return {"count": len(GENERATED_TESTCASES), "items": list(GENERATED_TESTCASES.values())}
+def list_testcases(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[int] = None,
+    feature: Optional[str] = None,
+    source: Optional[str] = None,
+    created_after: Optional[float] = None,
+    created_before: Optional[float] = None,
+):
+    """One page of testcases; pass `next_cursor` back as `cursor` for the next page."""
+    filters = _testcase_filters(feature, source, created_after, created_before)
+    records, next_cursor = testcase_store.query(cursor=cursor, limit=limit, **filters)
+    items = [{"id": r["id"], "payload": r["payload"], "created_at": r.get("created_at")} for r in records]
+    return {"count": len(items), "total": len(testcase_store), "items": items, "next_cursor": next_cursor}
+
+
+@app.get("/list_testcases/export")
+async def export_testcases(
+    feature: Optional[str] = None,
+    source: Optional[str] = None,
+    created_after: Optional[float] = None,
+    created_before: Optional[float] = None,
+):
+    """Stream every matching testcase as NDJSON (one JSON object per line)."""
+    filters = _testcase_filters(feature, source, created_after, created_before)
+
+    def lines():
+        for r in testcase_store.iter_query(**filters):
+            yield json.dumps({"id": r["id"], "payload": r["payload"], "created_at": r.get("created_at")},
+                             ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 
 class SeleniumRequest(BaseModel):
     testcase_id: str
 
 
+def _script_locators(testcase: Dict):
+    """Pick the grounding HTML page and the elements the testcase mentions from the locator index."""
+    for source in testcase.get("Grounded_In") or []:
+        page = locator_index.get_page(source)
+        if not page:
+            continue
+        words = " ".join(str(testcase.get(k, "")) for k in ("Feature", "Test_Scenario", "Expected_Result"))
+        elements = locator_index.match(source, words.replace("-", " ").split())
+        if not elements:
+            # Nothing named in the testcase; check the page's form controls instead
+            elements = {f: el for f, el in page["elements"].items()
+                        if el["tag"] in ("input", "button", "select", "textarea")}
+            elements = dict(list(elements.items())[:10])
+        return page, elements
+    return None, {}
+
+
+@app.get("/locators/{page}")
+def get_locators(page: str):
+    refresh_kb_state()
+    entry = locator_index.get_page(page)
+    if not entry:
+        return {"error": "page_not_indexed"}
+    return entry
+
+
 @app.post("/generate_selenium_script/")
-async def generate_selenium_script(req: SeleniumRequest):
-    tc = GENERATED_TESTCASES.get(req.testcase_id)
+def generate_selenium_script(req: SeleniumRequest):
+    refresh_kb_state()
+    tc = testcase_store.get(req.testcase_id)
     if not tc:
         return {"error": "testcase_not_found"}
 
     testcase = tc["payload"]
+    page, elements = _script_locators(testcase)
+    if page:
+        url = page["url"]
+    else:
+        sources = testcase.get("Grounded_In") or ["page.html"]
+        url = f"file:///REPLACE_WITH_PATH/{sources[0]}"
+
+    locator_lines = "".join(
+        f"    {field!r}: {[tuple(s) for s in el['selectors']]!r},\n" for field, el in elements.items()
+    )
 
     script = f"""
 from selenium import webdriver
@@ -357,16 +1010,36 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
-driver = webdriver.Chrome()
-driver.get("http://example.com/checkout")
+URL = {url!r}
+
+# Ranked selectors from the locator index built at ingestion (most robust first)
+LOCATORS = {{
+{locator_lines}}}
+
 
-print("Running Testcase: {testcase['Test_ID']}")
-print("Scenario: {testcase['Test_Scenario']}")
-print("Expected: {testcase['Expected_Result']}")
+def run(driver, url=None):
+    driver.get(url or URL)
 
-WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
+    print("Running Testcase:", {str(testcase.get('Test_ID', ''))!r})
+    print("Scenario:", {str(testcase.get('Test_Scenario', ''))!r})
+    print("Expected:", {str(testcase.get('Expected_Result', ''))!r})
 
-driver.quit()
+    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
+
+    for field, selectors in LOCATORS.items():
+        by, sel = selectors[0]
+        found = driver.find_elements(by, sel)
+        assert found, f"{{field}}: nothing matches {{by}}={{sel!r}}"
+        print(f"Found {{field}}: <{{found[0].tag_name}}> via {{by}}={{sel!r}}")
+
+
+if __name__ == "__main__":
+    driver = webdriver.Chrome()
+    try:
+        run(driver)
+    finally:
+        driver.quit()
 """.strip()
 
-    return {"status": "ok", "selenium_script": script}
+    return {"status": "ok", "selenium_script": script, "page": page["path"] if page else None,
+            "located_elements": list(elements)}
@@ -0,0 +1,110 @@
+"""
+LRU cache of retrieval results, keyed by (KB version, top_k, normalized query).
+
+CI sends the same requirement strings over and over; a hit skips embedding
+and the vector/lexical lookups entirely. The KB version is part of the key,
+and builds bump it whenever chunks are added or removed, so results from an
+older KB can never be served. Entries from old versions simply age out of
+the LRU.
+
+With a path, the cache is also persisted as JSON: it is written every
+`save_every` inserts and on save(), and only entries for the current KB
+version are kept when it is loaded.
+"""
+
+import os
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+def normalize_query(query: str) -> str:
+    # The embedding model and the BM25 tokenizer are both case-insensitive
+    return " ".join(query.lower().split())
+
+
+class QueryCache:
+    def __init__(self, capacity: int = 1024, path: Optional[str] = None, save_every: int = 50):
+        self.capacity = capacity
+        self.path = path
+        self.save_every = save_every
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self._unsaved = 0
+        self.hits = 0
+        self.misses = 0
+        self._loaded_for: Optional[Hashable] = None
+
+    @staticmethod
+    def key(kb_version: Hashable, top_k: int, query: str, *extra: Hashable) -> Tuple:
+        return (kb_version, top_k, normalize_query(query)) + extra
+
+    def load(self, kb_version: Hashable):
+        """Read persisted entries for `kb_version` (no-op without a path or after the first call)."""
+        if not self.path or self._loaded_for is not None:
+            return
+        self._loaded_for = kb_version
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            return
+        with self._lock:
+            for key, value in data.get("entries", []):
+                key = tuple(key)
+                if key[0] == kb_version:
+                    self._entries[key] = value
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Tuple, value: Any):
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+            self._unsaved += 1
+            due = self.path and self._unsaved >= self.save_every
+        if due:
+            self.save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            entries = [[list(k), v] for k, v in self._entries.items()]
+            self._unsaved = 0
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"entries": entries}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "persistent": bool(self.path),
+        }
@@ -1,78 +1,283 @@
 
 """
 Simple cosine-similarity retriever using saved embeddings + metadata (sentence-transformers).
+Reads the memory-mapped store written by ingest/embedChunks.py (see vector_store.py).
 Replace this file in your project and restart the backend.
 """
 
-import json
+import sys
+import threading
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Sequence
 
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
-EMBED_FILE = Path("ingest/embeddings.npy")
-META_FILE = Path("ingest/embeddings_meta.json")
+_backend_dir = str(Path(__file__).resolve().parent)
+if _backend_dir not in sys.path:
+    sys.path.insert(0, _backend_dir)
+from embed_cache import encode_cached, get_default_cache
+from ann_index import RowFilter, build_index
+from vector_store import VectorStore
+from bm25 import BM25Index, rrf
+
+STORE_DIR = Path("ingest/vector_store")
+IVF_INDEX_FILE = Path("ingest/ivf_index.npz")
+BM25_FILE = Path("ingest/bm25_index.npz")
 MODEL_NAME = "all-MiniLM-L6-v2"
+FILTER_CACHE_SIZE = 64
+
+
+class BatchResults:
+    """
+    Results of Retriever.retrieve_many as arrays, one row per query, best
+    first: rows (chunk row in the store, -1 where a query has fewer than
+    top_k hits) and scores (nan there). Hybrid retrievers also fill
+    dense_scores and lexical_scores, nan where a chunk was not in that
+    ranking. results[i] gives query i as the dicts retrieve() returns; they
+    are only built when asked for.
+    """
+
+    def __init__(self, retriever: "Retriever", rows: np.ndarray, scores: np.ndarray,
+                 dense_scores: Optional[np.ndarray] = None, lexical_scores: Optional[np.ndarray] = None):
+        self._retriever = retriever
+        self.rows = rows
+        self.scores = scores
+        self.dense_scores = dense_scores
+        self.lexical_scores = lexical_scores
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, q: int) -> List[Dict[str, Any]]:
+        results = []
+        for col, row in enumerate(self.rows[q]):
+            if row < 0:
+                break
+            r = self._retriever._result(int(row), float(self.scores[q, col]))
+            if self.dense_scores is not None:
+                r["dense_score"] = _optional(self.dense_scores[q, col])
+                r["lexical_score"] = _optional(self.lexical_scores[q, col])
+            results.append(r)
+        return results
+
+    def __iter__(self) -> Iterator[List[Dict[str, Any]]]:
+        for q in range(len(self)):
+            yield self[q]
+
+    def chunk_ids(self) -> List[List[str]]:
+        """Chunk ids per query, read straight from the id column (no text is touched)."""
+        ids = self._retriever.store.chunks.ids
+        return [[cid.decode("utf-8") for cid in ids[row[row >= 0]]] for row in self.rows]
+
+
+def _optional(score) -> Optional[float]:
+    return None if np.isnan(score) else float(score)
 
 
 class Retriever:
-    def __init__(self, model_name: str = MODEL_NAME):
-     
-        if not EMBED_FILE.exists():
-            raise FileNotFoundError(f"{EMBED_FILE} not found. Run ingest/embedChunks.py first.")
-        if not META_FILE.exists():
-            raise FileNotFoundError(f"{META_FILE} not found. Run ingest/embedChunks.py first.")
+    def __init__(self, model_name: str = MODEL_NAME, index: str = "exact", nprobe: int = 8, hybrid: bool = True):
+        """
+        index: "exact" scores every chunk; "ivf" uses an approximate IVF index
+        (built on first use and saved next to the embeddings). Higher `nprobe`
+        gives better recall at the cost of latency.
+        hybrid: also rank chunks with BM25 (ingest/bm25_index.npz, loaded on the
+        first query and brought up to date then if needed) and fuse both rankings.
+        """
 
-       
-        self.vectors = np.load(EMBED_FILE)  
+        # mmap'd, pre-normalized vectors plus the columnar chunk store: opening costs no parsing
+        if not (STORE_DIR / "store.json").exists():
+            raise FileNotFoundError(f"{STORE_DIR} not found. Run ingest/embedChunks.py first.")
+        self.store = VectorStore(STORE_DIR)
 
-        meta_text = META_FILE.read_text(encoding="utf-8")
-        self.meta = json.loads(meta_text)  
+        self.vectors = self.store.vectors
 
-      
-        norms = np.linalg.norm(self.vectors, axis=1, keepdims=True)
-        norms[norms == 0] = 1.0
-        self.vectors = self.vectors / norms
+        self.index = build_index(index, self.vectors, path=IVF_INDEX_FILE if index == "ivf" else None, nprobe=nprobe)
+
+        self.hybrid = hybrid
+        self._lexical: Optional[BM25Index] = None
+        self._lexical_lock = threading.Lock()
 
       
         self.model = SentenceTransformer(model_name)
+        self.cache = get_default_cache(model_name)
+        self._filters: Dict[tuple, Optional[RowFilter]] = {}
+
+    @property
+    def lexical(self) -> Optional[BM25Index]:
+        """The BM25 index (None unless hybrid), loaded and synced with the store on first use."""
+        if not self.hybrid:
+            return None
+        if self._lexical is None:
+            with self._lexical_lock:
+                if self._lexical is None:
+                    # Chunk ids are the lexical keys (rows without one use their row number).
+                    # sync() numbers the documents in row order, so a doc number is a store row.
+                    keys = [k or str(i) for i, k in enumerate(self.store.chunks.id_list())]
+                    lexical = BM25Index(str(BM25_FILE))
+                    if lexical.sync(keys, self.store.text):
+                        lexical.save()
+                    self._lexical = lexical
+        return self._lexical
+
+    def source_filter(self, include_sources: Optional[Sequence[str]] = None,
+                      exclude_sources: Optional[Sequence[str]] = None) -> Optional[RowFilter]:
+        """
+        Rows of the chunks from `include_sources` (all sources if empty) minus
+        `exclude_sources`, from the store's per-source partitions; None if no
+        filter is given. Recent filters are kept, so repeating one is free.
+        """
+        if not include_sources and not exclude_sources:
+            return None
+        key = (tuple(sorted(include_sources or ())), tuple(sorted(exclude_sources or ())))
+        if key not in self._filters:
+            if len(self._filters) >= FILTER_CACHE_SIZE:
+                self._filters.pop(next(iter(self._filters)))
+            rows = self.store.chunks.rows_for_sources(include_sources, exclude_sources)
+            self._filters[key] = RowFilter(rows, len(self.store))
+        return self._filters[key]
+
+    def _lexical_search(self, query: str, k: int, subset: Optional[RowFilter]):
+        """BM25 hits as (store row, score); doc numbers are rows, so the filter's row mask applies as is."""
+        lexical = self.lexical
+        hits = lexical.search(query, k, mask=None if subset is None else subset.mask)
+        return hits, [(lexical.doc(key), s) for key, s in hits]
 
     def embed_query(self, text: str) -> np.ndarray:
         """Embed a single query and normalize."""
-        vec = self.model.encode([text])[0]
+        vec = encode_cached(self.model, [text], self.cache)[0]
         norm = np.linalg.norm(vec)
         if norm == 0:
             return vec
         return vec / norm
 
-    def retrieve(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    def embed_queries(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed a batch of queries in one model call; rows normalized."""
+        vecs = encode_cached(self.model, list(texts), self.cache)
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vecs / norms
+
+    def retrieve(self, query: str, top_k: int = 5, nprobe: int = None,
+                 include_sources: Optional[Sequence[str]] = None,
+                 exclude_sources: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
         """
         Return top_k matching chunks for query.
-        Each result contains: score, chunk_id, source, index, text
+        Each result contains: score, chunk_id, source, index, text.
+        include_sources / exclude_sources restrict the search to chunks of
+        those source files; only their rows are scored (see source_filter).
+        With hybrid retrieval, score is the fused (reciprocal rank) score and
+        dense_score / lexical_score are the per-ranking scores (None if the
+        chunk was not in that ranking). Unfiltered queries that name a rare
+        identifier are answered from the lexical index alone, skipping the embedding.
         """
-        if not query:
+        subset = self.source_filter(include_sources, exclude_sources)
+        if not query or (subset is not None and not len(subset)):
             return []
 
+        lexical_scores = {}
+        dense_scores = {}
+        if self.hybrid:
+            hits, ranked = self._lexical_search(query, top_k * 2, subset)
+            lexical_scores = dict(ranked)
+            # Rarity is judged corpus-wide; with a source filter always search densely too
+            easy = self.lexical.confident_hits(query, hits) if subset is None else None
+            if easy:
+                return self._results(ranked[:min(top_k, len(easy))], dense_scores, lexical_scores)
+
         qvec = self.embed_query(query)
+        n_dense = top_k * 2 if lexical_scores else top_k
+        top_k_idx, top_scores = self.index.search(qvec, n_dense, nprobe=nprobe, subset=subset)
+        dense_scores = {int(i): float(s) for i, s in zip(top_k_idx, top_scores)}
 
-        
-        scores = np.dot(self.vectors, qvec)  
+        if not lexical_scores:
+            ranked = [(int(i), float(s)) for i, s in zip(top_k_idx, top_scores)][:top_k]
+            return self._results(ranked, dense_scores, lexical_scores)
 
-  
-        top_k_idx = np.argsort(-scores)[:top_k]
+        fused = rrf([[int(i) for i in top_k_idx], list(lexical_scores)])
+        return self._results(fused[:top_k], dense_scores, lexical_scores)
 
-        results = []
-        for idx in top_k_idx:
-            m = self.meta[idx]
-            results.append({
-                "score": float(scores[idx]),
-                "chunk_id": m.get("id") or m.get("chunk_id"),
-                "source": m.get("source"),
-                "index": m.get("index") or m.get("chunk_index"),
-                "text": m.get("text")
-            })
+    def retrieve_many(self, queries: Sequence[str], top_k: int = 5, nprobe: int = None,
+                      include_sources: Optional[Sequence[str]] = None,
+                      exclude_sources: Optional[Sequence[str]] = None) -> BatchResults:
+        """
+        retrieve() for a batch of queries. All queries that need the model
+        are embedded in one call and scored together (one blocked
+        queries x chunks product for the exact index); the results come
+        back as arrays (see BatchResults) instead of a list of dicts per
+        query. Ranking is the same as retrieve(), query by query. The
+        source filter applies to every query.
+        """
+        subset = self.source_filter(include_sources, exclude_sources)
+        n = len(queries)
+        rows = np.full((n, top_k), -1, dtype=np.int64)
+        scores = np.full((n, top_k), np.nan, dtype=np.float32)
+        hybrid = self.hybrid
+        dense_out = np.full((n, top_k), np.nan, dtype=np.float32) if hybrid else None
+        lexical_out = np.full((n, top_k), np.nan, dtype=np.float32) if hybrid else None
+
+        # The lexical side stays per query; queries it answers alone are never embedded
+        lexical_scores: Dict[int, Dict[int, float]] = {}
+        dense_queries = []
+        for q, query in enumerate(queries):
+            if not query or (subset is not None and not len(subset)):
+                continue
+            if hybrid:
+                hits, ranked = self._lexical_search(query, top_k * 2, subset)
+                lexical_scores[q] = dict(ranked)
+                easy = self.lexical.confident_hits(query, hits) if subset is None else None
+                if easy:
+                    self._fill(q, ranked[:min(top_k, len(easy))], {}, lexical_scores[q],
+                               rows, scores, dense_out, lexical_out)
+                    continue
+            dense_queries.append(q)
+
+        if dense_queries:
+            qvecs = self.embed_queries([queries[q] for q in dense_queries])
+            n_dense = top_k * 2 if hybrid else top_k
+            dense_idx, dense_scores = self.index.search_many(qvecs, n_dense, nprobe=nprobe, subset=subset)
+            if not hybrid:
+                k = min(top_k, dense_idx.shape[1])
+                rows[dense_queries, :k] = dense_idx[:, :k]
+                scores[dense_queries, :k] = np.where(dense_idx[:, :k] >= 0, dense_scores[:, :k], np.nan)
+            else:
+                for q, idx, sc in zip(dense_queries, dense_idx, dense_scores):
+                    ranked_dense = [int(i) for i in idx if i >= 0]
+                    dense = dict(zip(ranked_dense, (float(s) for s in sc)))
+                    if lexical_scores[q]:
+                        ranked = rrf([ranked_dense, list(lexical_scores[q])])[:top_k]
+                    else:
+                        ranked = [(i, dense[i]) for i in ranked_dense[:top_k]]
+                    self._fill(q, ranked, dense, lexical_scores[q], rows, scores, dense_out, lexical_out)
 
+        return BatchResults(self, rows, scores, dense_out, lexical_out)
+
+    @staticmethod
+    def _fill(q, ranked, dense_scores, lexical_scores, rows, scores, dense_out, lexical_out):
+        for col, (idx, score) in enumerate(ranked):
+            rows[q, col] = idx
+            scores[q, col] = score
+            dense_out[q, col] = dense_scores.get(idx, np.nan)
+            lexical_out[q, col] = lexical_scores.get(idx, np.nan)
+
+    def _result(self, idx: int, score: float) -> Dict[str, Any]:
+        m = self.store.meta(idx)
+        return {
+            "score": float(score),
+            "chunk_id": m.get("id"),
+            "source": m.get("source"),
+            "index": m.get("index"),
+            "text": self.store.text(idx)
+        }
+
+    def _results(self, ranked, dense_scores, lexical_scores) -> List[Dict[str, Any]]:
+        results = []
+        for idx, score in ranked:
+            r = self._result(idx, score)
+            if self.hybrid:
+                r["dense_score"] = dense_scores.get(idx)
+                r["lexical_score"] = lexical_scores.get(idx)
+            results.append(r)
         return results
 
 
@@ -1,5 +1,7 @@
 import os
 import sys
+import tempfile
+import secrets
 
 # Add backend directory to path
 backend_dir = os.path.dirname(os.path.abspath(__file__))
@@ -9,29 +11,67 @@ if backend_dir not in sys.path:
 # Change to backend directory for file operations
 os.chdir(backend_dir)
 
+
+def _configure_workers():
+    """
+    Multi-worker mode: one embedding server process holds the model, and the
+    uvicorn workers share it, the KB (single writer under a file lock) and
+    job state.
+    """
+    from embed_server import start_server_process
+
+    if os.name == "nt":
+        default_address = "127.0.0.1:7811"
+    else:
+        default_address = f"unix:{os.path.join(tempfile.gettempdir(), f'qa-embed-{os.getpid()}.sock')}"
+    # Workers inherit these through the environment
+    os.environ.setdefault("QA_EMBED_SERVER", default_address)
+    os.environ.setdefault("QA_EMBED_AUTHKEY", secrets.token_hex(16))
+    os.environ.setdefault("QA_JOB_STATE_DIR", os.path.join(backend_dir, "chroma_db", "jobs"))
+
+    print(f"Starting embedding server on {os.environ['QA_EMBED_SERVER']}")
+    return start_server_process(os.environ["QA_EMBED_SERVER"], os.environ["QA_EMBED_AUTHKEY"].encode("utf-8"))
+
+
 # Import after path is set
 try:
     from main import app
     import uvicorn
-    
+
     if __name__ == "__main__":
         # Render and other platforms provide the port via PORT environment variable.
         # Use it when present, otherwise default to 8000 for local development.
         port = int(os.environ.get("PORT", os.environ.get("port", 8000)))
         env_port = os.environ.get("PORT") or os.environ.get("port")
+        workers = int(os.environ.get("QA_WORKERS", os.environ.get("WEB_CONCURRENCY", "1")))
         print(f"Detected PORT env var: {env_port}")
-        print(f"Starting server on 0.0.0.0:{port}")
-        uvicorn.run(
-            app,
-            host="0.0.0.0",
-            port=port,
-            log_level="info",
-            access_log=True,
-            loop="asyncio"
-        )
+        print(f"Starting server on 0.0.0.0:{port} with {workers} worker(s)")
+
+        if workers > 1:
+            embed_server = _configure_workers()
+            try:
+                uvicorn.run(
+                    "main:app",
+                    host="0.0.0.0",
+                    port=port,
+                    workers=workers,
+                    log_level="info",
+                    access_log=True,
+                    loop="asyncio"
+                )
+            finally:
+                embed_server.terminate()
+        else:
+            uvicorn.run(
+                app,
+                host="0.0.0.0",
+                port=port,
+                log_level="info",
+                access_log=True,
+                loop="asyncio"
+            )
 except Exception as e:
     print(f"Error starting server: {e}")
     import traceback
     traceback.print_exc()
     sys.exit(1)
-
@@ -0,0 +1,91 @@
+"""
+Helpers for state shared by several backend worker processes.
+
+FileLock is an advisory lock on a side file (flock on POSIX, msvcrt on
+Windows, where shared locks fall back to exclusive). It serializes writers
+across processes: KB builds, testcase log appends. Readers take it shared
+so they never see half of a write.
+
+file_stamp() identifies a file's current version (inode, size, mtime), so a
+process can notice that another one rewrote a file and reload it.
+"""
+
+import os
+import threading
+from typing import Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Re-entrant (per thread) inter-process lock on `path`."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._local = threading.local()
+
+    def acquire(self, shared: bool = False):
+        self._thread_lock.acquire()
+        depth = getattr(self._local, "depth", 0)
+        if depth == 0:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+                else:
+                    msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            except Exception:
+                os.close(fd)
+                self._thread_lock.release()
+                raise
+            self._local.fd = fd
+        self._local.depth = depth + 1
+
+    def release(self):
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            fd = self._local.fd
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                else:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            finally:
+                os.close(fd)
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def shared(self):
+        return _SharedHold(self)
+
+
+class _SharedHold:
+    def __init__(self, lock: FileLock):
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire(shared=True)
+        return self.lock
+
+    def __exit__(self, *exc):
+        self.lock.release()
+
+
+def file_stamp(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
@@ -0,0 +1,342 @@
+"""
+Append-only store for generated testcases.
+
+Each insert appends one JSON line to a log and fsyncs it, so the cost of a
+write does not depend on how many testcases already exist and a crash can at
+worst lose the line being written (a torn last line is dropped on load).
+Overwrites and deletes leave dead lines behind; once they outnumber the live
+records the log is compacted into a fresh file that atomically replaces it.
+
+The log is read lazily on first access, and an old generated_testcases.json
+is migrated into it the first time.
+
+Several worker processes can share one log. Appends (and compactions)
+happen under an exclusive file lock, and every access first tails whatever
+other processes appended since (or reloads the log if it was compacted), so
+each process sees all writes.
+
+Every live record has a sequence number (its position in insertion order),
+which doubles as the pagination cursor. Secondary indexes map Feature and
+Grounded_In source to sorted sequence lists, and creation times are kept in
+sequence order for binary search, so filtered pages never scan the store.
+"""
+
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from shared_state import FileLock, file_stamp
+
+logger = logging.getLogger("qa-agent")
+
+
+class TestcaseStore:
+    def __init__(self, log_path: str, legacy_path: Optional[str] = None,
+                 compact_min_dead: int = 1000, fsync: bool = True):
+        self.log_path = log_path
+        self.legacy_path = legacy_path
+        self.compact_min_dead = compact_min_dead
+        self.fsync = fsync
+
+        self._lock = threading.RLock()
+        self._records: Optional[Dict[str, Dict]] = None
+        self._dead = 0
+        self._file_lock = FileLock(log_path + ".lock")
+        self._offset = 0      # bytes of the log applied so far
+        self._inode = None
+
+        # seq -> id (None once overwritten/deleted), running max of created_at per seq, id -> seq
+        self._order: List[Optional[str]] = []
+        self._created: List[float] = []
+        self._in_time_order = True
+        self._seq_of: Dict[str, int] = {}
+        self._by_feature: Dict[str, List[int]] = {}
+        self._by_source: Dict[str, List[int]] = {}
+
+    # ---------- loading ----------
+
+    def _ensure_loaded(self) -> Dict[str, Dict]:
+        with self._lock:
+            if self._records is None:
+                with self._file_lock:
+                    self._load()
+            else:
+                self._refresh()
+        return self._records
+
+    def _refresh(self):
+        """Apply lines other processes appended since we last looked; reload after a compaction."""
+        stamp = file_stamp(self.log_path)
+        if stamp is None or (stamp[0] == self._inode and stamp[1] == self._offset):
+            return
+        with self._file_lock.shared():
+            stamp = file_stamp(self.log_path)
+            if stamp is None:
+                return
+            if stamp[0] != self._inode or stamp[1] < self._offset:
+                self._load()
+                return
+            with open(self.log_path, "rb") as f:
+                f.seek(self._offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    self._offset += len(line)
+                    entry = json.loads(line)
+                    if entry.get("op") == "del":
+                        if self._records.pop(entry["id"], None) is not None:
+                            self._unindex(entry["id"])
+                            self._dead += 1
+                        self._dead += 1
+                        continue
+                    if entry["id"] in self._records:
+                        self._dead += 1
+                    self._records[entry["id"]] = entry
+                    self._index(entry)
+
+    def _load(self):
+        records: Dict[str, Dict] = {}
+        dead = 0
+        good_bytes = 0
+
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("unterminated line")
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn write from a crash; everything after it is discarded
+                        logger.warning(f"Dropping corrupt tail of {self.log_path} at byte {good_bytes}")
+                        break
+                    good_bytes += len(line)
+                    if entry.get("op") == "del":
+                        if records.pop(entry["id"], None) is not None:
+                            dead += 1
+                        dead += 1
+                        continue
+                    if records.pop(entry["id"], None) is not None:
+                        dead += 1
+                    records[entry["id"]] = entry
+            if good_bytes < os.path.getsize(self.log_path):
+                with open(self.log_path, "r+b") as f:
+                    f.truncate(good_bytes)
+
+        elif self.legacy_path and os.path.exists(self.legacy_path):
+            try:
+                with open(self.legacy_path, "r", encoding="utf-8") as f:
+                    legacy = json.load(f)
+                mtime = os.path.getmtime(self.legacy_path)
+                for uid, item in legacy.items():
+                    records[uid] = {"id": uid, "payload": item.get("payload", {}), "created_at": mtime}
+                logger.info(f"Migrating {len(records)} testcases from {self.legacy_path}")
+            except Exception as e:
+                logger.error(f"Could not read {self.legacy_path}: {str(e)}")
+            self._rewrite(records.values())
+
+        self._records = records
+        self._dead = dead
+        stamp = file_stamp(self.log_path)
+        self._inode = stamp[0] if stamp else None
+        self._offset = stamp[1] if stamp else 0
+        self._reindex()
+
+    # ---------- secondary indexes ----------
+
+    def _reindex(self):
+        self._order = []
+        self._created = []
+        self._in_time_order = True
+        self._seq_of = {}
+        self._by_feature = {}
+        self._by_source = {}
+        for entry in self._records.values():
+            self._index(entry)
+
+    def _index(self, entry: Dict):
+        old = self._seq_of.get(entry["id"])
+        if old is not None:
+            self._order[old] = None
+        seq = len(self._order)
+        self._order.append(entry["id"])
+        # A running max of created times, so time filters can bisect to narrow the range
+        created = entry.get("created_at") or 0.0
+        if self._created and created < self._created[-1]:
+            self._in_time_order = False
+        self._created.append(max(created, self._created[-1]) if self._created else created)
+        self._seq_of[entry["id"]] = seq
+
+        payload = entry.get("payload") or {}
+        feature = payload.get("Feature")
+        if feature is not None:
+            self._by_feature.setdefault(str(feature), []).append(seq)
+        for source in payload.get("Grounded_In") or []:
+            self._by_source.setdefault(str(source), []).append(seq)
+
+    def _unindex(self, uid: str):
+        seq = self._seq_of.pop(uid, None)
+        if seq is not None:
+            self._order[seq] = None
+
+    # ---------- writing ----------
+
+    def _append(self, entries: List[Dict]):
+        # Caller holds the exclusive file lock and has just refreshed, so the log ends at _offset
+        data = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries).encode("utf-8")
+        with open(self.log_path, "ab") as f:
+            f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        stamp = file_stamp(self.log_path)
+        self._inode = stamp[0]
+        self._offset += len(data)
+
+    def _rewrite(self, entries: Iterable[Dict]):
+        tmp = self.log_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for e in entries:
+                f.write(json.dumps(e, ensure_ascii=False) + "\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, self.log_path)
+        stamp = file_stamp(self.log_path)
+        self._inode = stamp[0]
+        self._offset = stamp[1]
+
+    def put_many(self, items: List[Dict]) -> List[Dict]:
+        """Insert or overwrite testcases ({"id", "payload"}); one append + fsync per call."""
+        if not items:
+            return []
+        now = time.time()
+        entries = [{"id": it["id"], "payload": it["payload"], "created_at": it.get("created_at", now)}
+                   for it in items]
+        with self._lock, self._file_lock:
+            records = self._ensure_loaded()
+            self._append(entries)
+            for e in entries:
+                if e["id"] in records:
+                    self._dead += 1
+                records[e["id"]] = e
+                self._index(e)
+            self._maybe_compact()
+        return entries
+
+    def put(self, item: Dict) -> Dict:
+        return self.put_many([item])[0]
+
+    def delete(self, uid: str) -> bool:
+        with self._lock, self._file_lock:
+            records = self._ensure_loaded()
+            if uid not in records:
+                return False
+            self._append([{"op": "del", "id": uid}])
+            del records[uid]
+            self._unindex(uid)
+            self._dead += 2
+            self._maybe_compact()
+        return True
+
+    def _maybe_compact(self):
+        if self._dead >= self.compact_min_dead and self._dead > len(self._records):
+            self.compact()
+
+    def compact(self):
+        """Rewrite the log with only live records."""
+        with self._lock, self._file_lock:
+            records = self._ensure_loaded()
+            self._rewrite(records.values())
+            logger.info(f"Compacted {self.log_path}: dropped {self._dead} dead lines")
+            self._dead = 0
+            self._reindex()
+
+    # ---------- reading ----------
+
+    def get(self, uid: str) -> Optional[Dict]:
+        return self._ensure_loaded().get(uid)
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self._ensure_loaded()
+
+    def __len__(self) -> int:
+        return len(self._ensure_loaded())
+
+    def values(self) -> List[Dict]:
+        with self._lock:
+            return list(self._ensure_loaded().values())
+
+    def __iter__(self) -> Iterator[Dict]:
+        return iter(self.values())
+
+    def query(self, cursor: Optional[int] = None, limit: int = 100,
+              feature: Optional[str] = None, source: Optional[str] = None,
+              created_after: Optional[float] = None, created_before: Optional[float] = None
+              ) -> Tuple[List[Dict], Optional[int]]:
+        """
+        One page of testcases in insertion order, starting after `cursor`.
+        Returns (items, next_cursor); next_cursor is None on the last page.
+        Note: a cursor is only stable until the next compaction.
+        """
+        with self._lock:
+            self._ensure_loaded()
+
+            # Narrow to the smallest candidate list the indexes can give us
+            candidates = None
+            if feature is not None:
+                candidates = self._by_feature.get(feature, [])
+            if source is not None:
+                by_source = self._by_source.get(source, [])
+                if candidates is None or len(by_source) < len(candidates):
+                    candidates = by_source
+
+            lo = 0 if cursor is None else cursor + 1
+            hi = len(self._order)
+            # Every seq before lo was created at or before created_after. The upper bound only
+            # holds while no record is older than one before it; each record's own time is checked below
+            if created_after is not None:
+                lo = max(lo, bisect.bisect_right(self._created, created_after))
+            if created_before is not None and self._in_time_order:
+                hi = min(hi, bisect.bisect_left(self._created, created_before))
+
+            if candidates is None:
+                seqs = range(lo, hi)
+            else:
+                seqs = candidates[bisect.bisect_left(candidates, lo):bisect.bisect_left(candidates, hi)]
+
+            items = []
+            last = None
+            for seq in seqs:
+                uid = self._order[seq]
+                if uid is None or self._seq_of.get(uid) != seq:
+                    continue
+                record = self._records[uid]
+                payload = record.get("payload") or {}
+                if feature is not None and payload.get("Feature") != feature:
+                    continue
+                if source is not None and source not in (payload.get("Grounded_In") or []):
+                    continue
+                created = record.get("created_at") or 0.0
+                if created_after is not None and created <= created_after:
+                    continue
+                if created_before is not None and created >= created_before:
+                    continue
+                if len(items) == limit:
+                    return items, last
+                items.append(record)
+                last = seq
+            return items, None
+
+    def iter_query(self, page_size: int = 500, **filters) -> Iterator[Dict]:
+        """Stream every matching record, one page (and one lock hold) at a time."""
+        cursor = None
+        while True:
+            items, cursor = self.query(cursor=cursor, limit=page_size, **filters)
+            yield from items
+            if cursor is None:
+                return
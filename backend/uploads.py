@@ -0,0 +1,99 @@
+"""
+Streaming upload helpers.
+
+Uploaded files are copied to disk in fixed-size blocks, with blocking writes
+offloaded to the threadpool and the sha256 computed on the fly, so memory
+use does not grow with the payload size. The hashes are kept in a small
+index next to the uploads so identical re-uploads can be skipped and later
+ingestion steps can deduplicate.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, Optional
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+UPLOAD_BLOCK_SIZE = 1024 * 1024  # 1MB
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadIndex:
+    """Maps saved upload path -> sha256 (and back), persisted as JSON."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.hashes: Dict[str, str] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.hashes = json.load(f)
+            except Exception:
+                self.hashes = {}
+
+    def get(self, path: str) -> Optional[str]:
+        return self.hashes.get(path)
+
+    def find(self, sha256: str) -> Optional[str]:
+        """Path of an existing upload with this content, if any."""
+        with self._lock:
+            for p, h in self.hashes.items():
+                if h == sha256 and os.path.exists(p):
+                    return p
+        return None
+
+    def record(self, path: str, sha256: str):
+        with self._lock:
+            self.hashes[path] = sha256
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.hashes, f)
+            os.replace(tmp, self.path)
+
+
+async def stream_to_disk(f: UploadFile, path: str, max_size: int, known_sha256: Optional[str] = None) -> Dict:
+    """
+    Copy an upload to `path` block by block, hashing as it goes. Writes go to
+    a temp file that is renamed into place only once the whole file is in,
+    so a rejected or failed upload never leaves a partial file behind.
+    If the content hash equals `known_sha256` (the file already on disk) the
+    existing file is left untouched, keeping its mtime for incremental builds.
+    """
+    # Starlette knows the part size once the form is parsed: reject before copying anything
+    if f.size is not None and f.size > max_size:
+        raise UploadTooLarge(f.size)
+
+    h = hashlib.sha256()
+    size = 0
+    tmp = path + ".part"
+    fh = await run_in_threadpool(open, tmp, "wb")
+    try:
+        while True:
+            block = await f.read(UPLOAD_BLOCK_SIZE)
+            if not block:
+                break
+            size += len(block)
+            if size > max_size:
+                raise UploadTooLarge(size)
+            h.update(block)
+            await run_in_threadpool(fh.write, block)
+    except BaseException:
+        await run_in_threadpool(fh.close)
+        await run_in_threadpool(os.remove, tmp)
+        raise
+
+    await run_in_threadpool(fh.close)
+    sha256 = h.hexdigest()
+    if known_sha256 == sha256 and os.path.exists(path):
+        await run_in_threadpool(os.remove, tmp)
+        return {"size": size, "sha256": sha256, "unchanged": True}
+
+    await run_in_threadpool(os.replace, tmp, path)
+    return {"size": size, "sha256": sha256, "unchanged": False}
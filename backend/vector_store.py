@@ -0,0 +1,232 @@
+"""
+On-disk vector store for the Retriever.
+
+Layout of a store directory:
+    store.json        header: format, dtype, dim, count
+    vectors.npy       pre-normalized vectors as float16, int8 or float32
+    scales.npy        per-row dequantization scale (int8 only)
+    chunks.bin        ids, sources, indexes and texts per row (see chunk_store.py)
+
+Everything is opened with mmap, so loading is O(1) in the number of chunks
+and several worker processes share one page-cached copy. Chunk text is only
+read for the rows a caller asks for (e.g. the top-k hits).
+
+VectorStoreWriter builds a store batch by batch (see ingest/pipeline.py),
+and write_store() writes one from arrays already in memory.
+"""
+
+import os
+import json
+import shutil
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+
+from chunk_store import ChunkStore, ChunkStoreWriter
+
+STORE_FORMAT = 2  # 1 kept chunk metadata in chunk_meta.json + texts.bin
+STORE_DTYPES = ("float16", "int8", "float32")
+SCORE_BLOCK = 65536
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def quantize_int8(vectors: np.ndarray):
+    """Symmetric per-row int8 quantization; returns (codes, scales)."""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class QuantizedMatrix:
+    """
+    Read-only matrix view over stored vectors. Indexing returns dequantized
+    float32 rows; dot() scores in blocks so a float16/int8 memmap is never
+    upcast to a full float32 copy.
+    """
+
+    def __init__(self, data: np.ndarray, scales: Optional[np.ndarray] = None):
+        self.data = data
+        self.scales = scales
+        self.shape = data.shape
+        self.dtype = np.dtype(np.float32)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key) -> np.ndarray:
+        rows = np.asarray(self.data[key], dtype=np.float32)
+        if self.scales is not None:
+            scales = np.asarray(self.scales[key], dtype=np.float32)
+            rows = rows * (scales[..., None] if rows.ndim > 1 else scales)
+        return rows
+
+    def dot(self, qvec: np.ndarray) -> np.ndarray:
+        qvec = np.asarray(qvec, dtype=np.float32)
+        out = np.empty(self.shape[0], dtype=np.float32)
+        for start in range(0, self.shape[0], SCORE_BLOCK):
+            stop = start + SCORE_BLOCK
+            out[start:stop] = np.asarray(self.data[start:stop], dtype=np.float32) @ qvec
+            if self.scales is not None:
+                out[start:stop] *= self.scales[start:stop]
+        return out
+
+    def __matmul__(self, qvec):
+        return self.dot(qvec)
+
+
+class VectorStoreWriter:
+    """
+    Builds a store by appending (vectors, chunks) batches, so a corpus of any
+    size is written with one batch in memory. Rows go to temp files in
+    `work_dir` (default: <directory>/.partial). close() assembles them and
+    swaps the finished files into `directory`; readers holding the old
+    files keep a valid mmap. state()/`resume` checkpoint and continue an
+    interrupted build (see ChunkStoreWriter).
+    """
+
+    def __init__(self, directory, dtype: str = "float16", work_dir=None,
+                 resume: Optional[Dict[str, Any]] = None):
+        if dtype not in STORE_DTYPES:
+            raise ValueError(f"dtype must be one of {STORE_DTYPES}")
+        self.dir = Path(directory)
+        self.work = Path(work_dir) if work_dir else self.dir / ".partial"
+        self.work.mkdir(parents=True, exist_ok=True)
+        self.dtype = dtype
+        self.chunks = ChunkStoreWriter(self.work / "chunks.bin", resume=resume and resume["chunks"])
+        self._vectors_part = self.work / "vectors.tmp"
+        self._scales_part = self.work / "scales.tmp"
+        if resume:
+            self.dim = resume["dim"]
+            self._vectors = open(self._vectors_part, "r+b")
+            self._vectors.truncate(resume["sizes"]["vectors"])
+            self._vectors.seek(0, os.SEEK_END)
+            self._scales = open(self._scales_part, "r+b")
+            self._scales.truncate(resume["sizes"]["scales"])
+            self._scales.seek(0, os.SEEK_END)
+        else:
+            self.dim = 0
+            self._vectors = open(self._vectors_part, "wb")
+            self._scales = open(self._scales_part, "wb")
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def append(self, vectors: np.ndarray, entries: Iterable[Dict[str, Any]]):
+        entries = list(entries)
+        if len(entries) != len(vectors):
+            raise ValueError("vectors and chunks must have the same length")
+        if not entries:
+            return
+        vectors = normalize_rows(vectors)
+        if self.dim and vectors.shape[1] != self.dim:
+            raise ValueError(f"expected {self.dim}-d vectors, got {vectors.shape[1]}")
+        self.dim = int(vectors.shape[1])
+        if self.dtype == "int8":
+            codes, scales = quantize_int8(vectors)
+            self._vectors.write(codes.tobytes())
+            self._scales.write(scales.tobytes())
+        else:
+            self._vectors.write(vectors.astype(self.dtype).tobytes())
+        for entry in entries:
+            self.chunks.add_entry(entry)
+
+    def state(self) -> Dict[str, Any]:
+        for f in (self._vectors, self._scales):
+            f.flush()
+            os.fsync(f.fileno())
+        return {"dim": self.dim, "chunks": self.chunks.state(),
+                "sizes": {"vectors": self._vectors.tell(), "scales": self._scales.tell()}}
+
+    @staticmethod
+    def _write_npy(part: Path, target: Path, dtype: str, shape):
+        tmp = target.with_name(target.name + ".tmp")
+        with open(tmp, "wb") as out, open(part, "rb") as src:
+            np.lib.format.write_array_header_1_0(
+                out, {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False, "shape": shape})
+            shutil.copyfileobj(src, out, 1 << 20)
+        os.replace(tmp, target)
+
+    def close(self):
+        self._vectors.close()
+        self._scales.close()
+        count = len(self.chunks)
+        self.chunks.close()
+        self.dir.mkdir(parents=True, exist_ok=True)
+
+        # Vectors first, store.json last: a reader only switches once everything is in place
+        self._write_npy(self._vectors_part, self.dir / "vectors.npy", self.dtype, (count, self.dim))
+        if self.dtype == "int8":
+            self._write_npy(self._scales_part, self.dir / "scales.npy", "float32", (count,))
+        else:
+            (self.dir / "scales.npy").unlink(missing_ok=True)
+        os.replace(self.work / "chunks.bin", self.dir / "chunks.bin")
+        for legacy in ("chunk_meta.json", "texts.bin", "text_offsets.npy"):
+            (self.dir / legacy).unlink(missing_ok=True)
+
+        header = {"format": STORE_FORMAT, "dtype": self.dtype, "dim": self.dim, "count": count}
+        tmp = self.dir / "store.json.tmp"
+        tmp.write_text(json.dumps(header), encoding="utf-8")
+        os.replace(tmp, self.dir / "store.json")
+        self._cleanup()
+
+    def abort(self):
+        self._vectors.close()
+        self._scales.close()
+        self.chunks.abort()
+        self._cleanup()
+
+    def _cleanup(self):
+        self._vectors_part.unlink(missing_ok=True)
+        self._scales_part.unlink(missing_ok=True)
+        try:
+            self.work.rmdir()
+        except OSError:
+            pass  # not empty: the caller keeps other files there (e.g. a checkpoint)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_store(directory, vectors: np.ndarray, chunks: Iterable[Dict[str, Any]], dtype: str = "float16"):
+    """Normalize, quantize and write `vectors` plus their chunks (a ChunkStore or chunk dicts) to `directory`."""
+    with VectorStoreWriter(directory, dtype) as writer:
+        writer.append(vectors, chunks)
+
+
+class VectorStore:
+    def __init__(self, directory):
+        self.dir = Path(directory)
+        self.header = json.loads((self.dir / "store.json").read_text(encoding="utf-8"))
+        if self.header.get("format", 1) != STORE_FORMAT:
+            raise ValueError(f"{self.dir} was written by an older version; re-run ingest/embedChunks.py")
+
+        data = np.load(self.dir / "vectors.npy", mmap_mode="r")
+        scales = np.load(self.dir / "scales.npy", mmap_mode="r") if self.header["dtype"] == "int8" else None
+        self.vectors = data if self.header["dtype"] == "float32" else QuantizedMatrix(data, scales)
+        self.chunks = ChunkStore(self.dir / "chunks.bin")
+
+    def __len__(self):
+        return self.header["count"]
+
+    def meta(self, row: int) -> Dict[str, Any]:
+        return self.chunks.meta(row)
+
+    def text(self, row: int) -> str:
+        return self.chunks.text(row)
+
+    def close(self):
+        self.chunks.close()
@@ -1,75 +1,108 @@
-
+import sys
 import json
 from pathlib import Path
 
+# Share content-addressed chunk ids and the chunker with the backend
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+from kb_manifest import chunk_id
+from chunker import CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS, detect_format, iter_chunks
+from extract import NoiseFilter, extract_file
+from chunk_store import ChunkStoreWriter
 
-CHUNK_LEN = 800
-CHUNK_OVERLAP = 100
-
-
-OUTPUT_PATH = Path("ingest/chunks.json")
 
+OUTPUT_PATH = Path("ingest/chunks.bin")
+QUARANTINE_PATH = Path("ingest/quarantine.json")
 
-def split_into_chunks(text, size=CHUNK_LEN, overlap=CHUNK_OVERLAP):
-    """Simple function to break long texts into overlapping chunks."""
-    if not text:
-        return []
-
-    text = text.replace("\r\n", "\n")
-    chunks = []
-    start = 0
-    n = len(text)
 
-    while start < n:
-        end = start + size
-        chunk = text[start:end].strip()
-        chunks.append(chunk)
-        start += (size - overlap)
-
-    return chunks
-
-
-def prepare_chunks(upload_folder="uploaded_docs"):
-    """Reads all files inside uploaded_docs and splits them into text chunks."""
+def list_files(upload_folder="uploaded_docs"):
     folder = Path(upload_folder)
     if not folder.exists():
         print("No uploaded files found.")
         return []
+    return [f for f in sorted(folder.iterdir()) if f.is_file()]
+
+
+def iter_file_chunks(file, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, skipped=None):
+    """
+    Yields the chunks of one file. Files go through the backend's extraction
+    (PDF text via PyMuPDF, HTML), binary files and blocks that are not text
+    are left out; a skipped file is appended to `skipped` as {"source", "reason"}.
+    """
+    extracted = extract_file(str(file))
+    reason = extracted["skipped"] or extracted["error"]
+    if reason:
+        print(f"Skipping {file.name}: {reason}")
+        if skipped is not None:
+            skipped.append({"source": file.name, "reason": reason})
+        return
+
+    content = extracted["text"]
+    if not content:
+        return
+
+    seen = set()
+    noise = NoiseFilter()
+    for idx, part in enumerate(iter_chunks(content, detect_format(file.name), max_tokens, overlap_tokens,
+                                           keep=noise)):
+        # Same source + same text -> same id, so embedChunks.py can reuse vectors
+        cid = chunk_id(file.name, part)
+        if cid in seen:
+            continue
+        seen.add(cid)
+        yield {
+            "id": cid,
+            "source": file.name,
+            "index": idx,
+            "text": part
+        }
+    if noise.dropped:
+        print(f"{file.name}: dropped {noise.dropped} blocks that are not text")
 
-    all_data = []
-    chunk_counter = 0
 
-    for file in sorted(folder.iterdir()):
-        try:
-            content = file.read_text(encoding="utf-8", errors="ignore")
-        except:
-            content = ""
+def iter_chunk_entries(upload_folder="uploaded_docs", max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS,
+                       skipped=None):
+    """Reads all files inside uploaded_docs and yields their chunks one at a time."""
+    for file in list_files(upload_folder):
+        yield from iter_file_chunks(file, max_tokens, overlap_tokens, skipped)
 
-        if not content:
-            continue
 
-        pieces = split_into_chunks(content)
-        for idx, part in enumerate(pieces):
-            entry = {
-                "id": f"chunk_{chunk_counter}",
-                "source": file.name,
-                "index": idx,
-                "text": part
-            }
-            all_data.append(entry)
-            chunk_counter += 1
+def prepare_chunks(upload_folder="uploaded_docs"):
+    """Reads all files inside uploaded_docs and splits them into text chunks."""
+    return list(iter_chunk_entries(upload_folder))
+
+
+def write_chunks(entries, path=OUTPUT_PATH):
+    """Stream entries into the chunk store at `path`; returns how many were written."""
+    writer = ChunkStoreWriter(path)
+    try:
+        for entry in entries:
+            writer.add_entry(entry)
+    except BaseException:
+        writer.abort()
+        raise
+    if len(writer):
+        writer.close()
+    else:
+        writer.abort()  # keep the previous chunks.bin
+    return len(writer)
+
 
-    return all_data
+def write_quarantine(skipped):
+    """List the files kept out of the index, and why; fix or remove them from uploaded_docs."""
+    if skipped:
+        QUARANTINE_PATH.write_text(json.dumps(skipped, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"Skipped {len(skipped)} files, listed in {QUARANTINE_PATH}")
+    elif QUARANTINE_PATH.exists():
+        QUARANTINE_PATH.unlink()
 
 
 if __name__ == "__main__":
-    chunks = prepare_chunks()
+    skipped = []
+    count = write_chunks(iter_chunk_entries(skipped=skipped))
 
-    if not chunks:
+    write_quarantine(skipped)
+
+    if not count:
         print("No chunks created.")
     else:
-        OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
-        with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
-            json.dump(chunks, f, indent=2, ensure_ascii=False)
-
-        print(f"Saved {len(chunks)} chunks to {OUTPUT_PATH}")
+        print(f"Saved {count} chunks to {OUTPUT_PATH}")
@@ -1,27 +1,29 @@
-
-
-import json
+import os
+import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+from vector_store import VectorStoreWriter
+from chunk_store import ChunkStore
+from bm25 import BM25Index
+from pipeline import BATCH_SIZE, Embedder, PreviousVectors, embed_into
 
-from sentence_transformers import SentenceTransformer
-import numpy as np
-
-CHUNKS_FILE = Path("ingest/chunks.json")
-OUTPUT_FILE = Path("ingest/embeddings.npy")
-META_FILE = Path("ingest/embeddings_meta.json")
+CHUNKS_FILE = Path("ingest/chunks.bin")
+STORE_DIR = Path("ingest/vector_store")
+BM25_FILE = Path("ingest/bm25_index.npz")
+# float16 halves the store; int8 quarters it (with per-row scales)
+STORE_DTYPE = os.environ.get("QA_STORE_DTYPE", "float16")
 
 
 def load_chunks():
     if not CHUNKS_FILE.exists():
-        print("chunks.json not found. Run chunkSave.py first.")
-        return []
+        print("chunks.bin not found. Run chunkSave.py first.")
+        return None
     try:
-        text = CHUNKS_FILE.read_text(encoding="utf-8")
-        return json.loads(text)
+        return ChunkStore(CHUNKS_FILE)
     except Exception as e:
-        print("Failed to read chunks.json:", e)
-        return []
+        print("Failed to read chunks.bin:", e)
+        return None
 
 
 def create_embeddings():
@@ -30,23 +32,26 @@ def create_embeddings():
         print("No chunks to embed.")
         return
 
-   
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-
-    texts = [entry["text"] for entry in data]
-    print(f"Creating embeddings for {len(texts)} chunks...")
-
-
-    vectors = model.encode(texts, show_progress_bar=True)
-
- 
-    np.save(OUTPUT_FILE, vectors)
-
-   
-    META_FILE.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
-
-    print(f"Saved embeddings to {OUTPUT_FILE}")
-    print(f"Saved metadata to {META_FILE}")
+    # Chunks are read from the mmap and embedded a batch at a time; vectors of
+    # chunks already in the previous store are copied over, not re-embedded
+    previous = PreviousVectors(STORE_DIR)
+    embed = Embedder(previous)
+    print(f"Embedding {len(data)} chunks...")
+    with VectorStoreWriter(STORE_DIR, STORE_DTYPE) as writer:
+        embed_into(writer, data, embed, BATCH_SIZE)
+    previous.close()
+    print(f"{embed.reused} chunks unchanged, {embed.embedded} embedded.")
+    if embed.cache is not None and embed.embedded:
+        print(f"Embedding cache: {embed.cache.stats()}")
+
+    # Lexical index for hybrid retrieval: only new chunks are tokenized, removed ones dropped
+    ids = data.id_list()
+    lexical = BM25Index(str(BM25_FILE))
+    if lexical.sync([cid or str(i) for i, cid in enumerate(ids)], data.text):
+        lexical.save()
+
+    print(f"Saved {STORE_DTYPE} vector store to {STORE_DIR}")
+    print(f"Saved lexical index ({len(lexical)} chunks) to {BM25_FILE}")
 
 
 if __name__ == "__main__":
@@ -1,19 +1,23 @@
-import os
+import sys
 from pathlib import Path
 
+# Same format detection and extraction as the backend
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+from extract import extract_file
+
 def load_documents(folder="uploaded_docs"):
     docs = []
     folder_path = Path(folder)
 
-    for file in folder_path.iterdir():
-        if file.suffix in [".txt", ".md", ".json", ".html"]:
-            with open(file, "r", encoding="utf-8", errors="ignore") as f:
-                docs.append(f.read())
-        elif file.suffix == ".pdf":
-            # placeholder for PDF extraction
-            docs.append("PDF content goes here")
-        else:
-            print(f"Skipping unsupported file: {file}")
+    for file in sorted(folder_path.iterdir()):
+        if not file.is_file():
+            continue
+        extracted = extract_file(str(file))
+        reason = extracted["skipped"] or extracted["error"]
+        if reason:
+            print(f"Skipping {file}: {reason}")
+        elif extracted["text"]:
+            docs.append(extracted["text"])
 
     return docs
 
@@ -0,0 +1,209 @@
+"""
+Streaming ingest: uploaded_docs -> extract -> chunk -> embed -> vector store in one pass.
+
+    python ingest/pipeline.py                   # resumes an interrupted run
+    python ingest/pipeline.py --restart         # discard it and start over
+    python ingest/pipeline.py --batch-size 128
+
+Every stage is a generator, so only one batch of chunks (--batch-size) and
+its vectors are in memory at a time, however large the corpus is. Batches
+are appended to a VectorStoreWriter, whose rows go to temp files in
+ingest/vector_store.partial/. After each file the writer is flushed and
+checkpoint.json records which files are done and how far the temp files are
+valid. A run that dies part-way resumes after the last finished file,
+unless the settings or one of those files changed since.
+
+Vectors of chunks already in the previous store are copied over instead of
+being re-embedded, and the shared embedding cache covers texts seen
+elsewhere, so the model only runs on new text. This does in one pass what
+chunkSave.py followed by embedChunks.py does in two.
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+from chunker import CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS, CHUNKER_VERSION
+from embed_cache import encode_cached, get_default_cache
+from vector_store import VectorStore, VectorStoreWriter
+from bm25 import BM25Index
+from chunkSave import iter_file_chunks, list_files, write_quarantine
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+STORE_DIR = Path("ingest/vector_store")
+WORK_DIR = Path("ingest/vector_store.partial")
+CHECKPOINT_FILE = WORK_DIR / "checkpoint.json"
+BM25_FILE = Path("ingest/bm25_index.npz")
+BATCH_SIZE = 64
+STORE_DTYPE = os.environ.get("QA_STORE_DTYPE", "float16")
+
+
+def batched(iterable, size):
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+class PreviousVectors:
+    """Vectors of the store being replaced, by chunk id; empty if there is none (or it is outdated)."""
+
+    def __init__(self, store_dir=STORE_DIR):
+        self.store = None
+        if (Path(store_dir) / "store.json").exists():
+            try:
+                self.store = VectorStore(store_dir)
+            except Exception as e:
+                print("Ignoring previous vector store:", e)
+
+    def get(self, chunk_id):
+        if self.store is None:
+            return None
+        row = self.store.chunks.row_of(chunk_id)
+        return None if row is None else self.store.vectors[row]
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+
+
+class Embedder:
+    """Embeds batches of chunk dicts; the model is only loaded once a chunk needs it."""
+
+    def __init__(self, previous: PreviousVectors, model_name=MODEL_NAME):
+        self.previous = previous
+        self.model_name = model_name
+        self.model = None
+        self.cache = get_default_cache(model_name)
+        self.reused = 0
+        self.embedded = 0
+
+    def __call__(self, batch):
+        found = [self.previous.get(entry["id"]) for entry in batch]
+        missing = [i for i, v in enumerate(found) if v is None]
+        if missing:
+            if self.model is None:
+                from sentence_transformers import SentenceTransformer
+                self.model = SentenceTransformer(self.model_name)
+            fresh = encode_cached(self.model, [batch[i]["text"] for i in missing], self.cache)
+            for i, vec in zip(missing, fresh):
+                found[i] = vec
+        self.reused += len(batch) - len(missing)
+        self.embedded += len(missing)
+        return np.stack(found).astype(np.float32)
+
+
+def embed_into(writer: VectorStoreWriter, entries, embed: Embedder, batch_size=BATCH_SIZE) -> int:
+    """Chunk dicts -> batches -> vectors -> writer; returns how many were written."""
+    written = 0
+    for batch in batched(entries, batch_size):
+        writer.append(embed(batch), batch)
+        written += len(batch)
+    return written
+
+
+def _file_stamp(file):
+    st = file.stat()
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _save_checkpoint(data):
+    tmp = CHECKPOINT_FILE.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data), encoding="utf-8")
+    os.replace(tmp, CHECKPOINT_FILE)
+
+
+def _load_checkpoint(settings, files):
+    """The checkpoint, if it belongs to this run: same settings, finished files unchanged."""
+    if not CHECKPOINT_FILE.exists():
+        return None
+    try:
+        data = json.loads(CHECKPOINT_FILE.read_text(encoding="utf-8"))
+    except Exception:
+        return None
+    if data.get("settings") != settings:
+        print("Settings changed since the interrupted run; starting over.")
+        return None
+    stamps = {f.name: _file_stamp(f) for f in files}
+    if any(stamps.get(name) != stamp for name, stamp in data["done"].items()):
+        print("Files changed since the interrupted run; starting over.")
+        return None
+    return data
+
+
+def run(upload_folder="uploaded_docs", batch_size=BATCH_SIZE, restart=False,
+        max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, dtype=STORE_DTYPE):
+    files = list_files(upload_folder)
+    settings = {"folder": str(Path(upload_folder).resolve()), "model": MODEL_NAME, "dtype": dtype,
+                "max_tokens": max_tokens, "overlap_tokens": overlap_tokens, "chunker": CHUNKER_VERSION}
+
+    checkpoint = None if restart else _load_checkpoint(settings, files)
+    writer = None
+    if checkpoint:
+        try:
+            writer = VectorStoreWriter(STORE_DIR, dtype, work_dir=WORK_DIR, resume=checkpoint["writer"])
+            print(f"Resuming: {len(checkpoint['done'])} files ({len(writer)} chunks) already done.")
+        except OSError as e:
+            print("Cannot resume, starting over:", e)
+            checkpoint = None
+    if writer is None:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+        writer = VectorStoreWriter(STORE_DIR, dtype, work_dir=WORK_DIR)
+        checkpoint = {"settings": settings, "done": {}, "skipped": []}
+
+    previous = PreviousVectors()
+    embed = Embedder(previous)
+    done, skipped = checkpoint["done"], checkpoint["skipped"]
+
+    for file in files:
+        if file.name in done:
+            continue
+        n = embed_into(writer, iter_file_chunks(file, max_tokens, overlap_tokens, skipped), embed, batch_size)
+        print(f"{file.name}: {n} chunks")
+        done[file.name] = _file_stamp(file)
+        _save_checkpoint({"settings": settings, "done": done, "skipped": skipped, "writer": writer.state()})
+
+    count = len(writer)
+    previous.close()
+    CHECKPOINT_FILE.unlink(missing_ok=True)
+    write_quarantine(skipped)
+    if not count:
+        writer.abort()  # keep the previous store
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+        print("No chunks created.")
+        return 0
+    writer.close()
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+    print(f"Saved {count} chunks ({embed.embedded} embedded, {embed.reused} reused) to {STORE_DIR}")
+
+    # Lexical index for hybrid retrieval: only new chunks are tokenized, removed ones dropped
+    store = VectorStore(STORE_DIR)
+    ids = store.chunks.id_list()
+    lexical = BM25Index(str(BM25_FILE))
+    if lexical.sync([cid or str(i) for i, cid in enumerate(ids)], store.text):
+        lexical.save()
+    store.close()
+    print(f"Saved lexical index ({len(lexical)} chunks) to {BM25_FILE}")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream uploaded_docs into the vector store.")
+    parser.add_argument("--folder", default="uploaded_docs")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="chunks embedded (and held) at a time")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint of an interrupted run")
+    args = parser.parse_args()
+    run(args.folder, args.batch_size, args.restart)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Locator strategy for generated Selenium scripts.
+
+find_first() polls every candidate selector on each tick under a single
+deadline, instead of giving each fallback selector its own WebDriverWait.
+A missing element therefore costs one timeout, not one per selector. The
+selector that matched is remembered per page and field in
+.locator_cache.json and tried first next time.
+
+Uses driver.find_elements, which returns immediately as long as no implicit
+wait is configured on the driver.
+"""
+
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from selenium.common.exceptions import StaleElementReferenceException, WebDriverException
+
+POLL_INTERVAL = 0.1
+CACHE_FILE = Path(os.environ.get("QA_LOCATOR_CACHE", Path(__file__).resolve().parent / ".locator_cache.json"))
+
+Selector = Tuple[str, str]
+
+
+class LocatorCache:
+    """page|field -> winning (by, selector), persisted as JSON."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.entries: Dict[str, List[str]] = {}
+        if self.path.exists():
+            try:
+                self.entries = json.loads(self.path.read_text(encoding="utf-8"))
+            except Exception:
+                self.entries = {}
+
+    def get(self, key: str) -> Optional[Selector]:
+        hit = self.entries.get(key)
+        return (hit[0], hit[1]) if hit else None
+
+    def put(self, key: str, selector: Selector):
+        with self._lock:
+            if self.entries.get(key) == list(selector):
+                return
+            self.entries[key] = list(selector)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_text(json.dumps(self.entries, indent=2), encoding="utf-8")
+            os.replace(tmp, self.path)
+
+
+_default_cache = LocatorCache(CACHE_FILE)
+
+
+def page_key(driver, field: str) -> str:
+    parts = urlsplit(driver.current_url)
+    return f"{parts.scheme}://{parts.netloc}{parts.path}|{field}"
+
+
+def _usable(el, clickable: bool) -> bool:
+    if not clickable:
+        return True
+    return el.is_displayed() and el.is_enabled()
+
+
+def find_first(driver, field: str, candidates: Sequence[Selector], timeout: float = 10,
+               clickable: bool = False, cache: Optional[LocatorCache] = None):
+    """
+    Return the first element matched by any candidate (in priority order),
+    polling all of them until `timeout` seconds have passed; None if nothing
+    matched. `field` names the element for the per-page selector cache.
+    """
+    cache = cache or _default_cache
+    key = page_key(driver, field)
+
+    ordered = list(candidates)
+    cached = cache.get(key)
+    if cached in ordered:
+        ordered.remove(cached)
+    if cached:
+        ordered.insert(0, cached)
+
+    deadline = time.monotonic() + timeout
+    while True:
+        for by, sel in ordered:
+            try:
+                for el in driver.find_elements(by, sel):
+                    if _usable(el, clickable):
+                        cache.put(key, (by, sel))
+                        return el
+            except StaleElementReferenceException:
+                continue
+            except WebDriverException:
+                # e.g. an invalid selector for this page; try the others
+                continue
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(POLL_INTERVAL)
@@ -3,47 +3,43 @@
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 import pathlib
 import time
 import os
 
-
-driver = webdriver.Chrome()
+from locators import find_first
 
 
 checkout_path = pathlib.Path("uploaded_docs/checkout.html").absolute()
-driver.get(f"file:///{checkout_path.as_posix()}")
+URL = f"file:///{checkout_path.as_posix()}"
 
-wait = WebDriverWait(driver, 10)
 
 
+DISCOUNT_SELECTORS = [
+    (By.ID, "discount-code"),
+    (By.NAME, "discount-code"),
+    (By.NAME, "discount"),
+    (By.CSS_SELECTOR, "input[id*='discount']"),
+    (By.CSS_SELECTOR, "input[name*='discount']"),
+    (By.XPATH, "//input[contains(translate(@id,'DISCOUNT','discount'),'discount')]"),
+    (By.XPATH, "//input[contains(translate(@name,'DISCOUNT','discount'),'discount')]"),
+    (By.CSS_SELECTOR, "input[placeholder*='discount']"),
+]
 
-def find_with_fallback():
-    selectors = [
-        (By.ID, "discount-code"),
-        (By.NAME, "discount-code"),
-        (By.NAME, "discount"),
-        (By.CSS_SELECTOR, "input[id*='discount']"),
-        (By.CSS_SELECTOR, "input[name*='discount']"),
-        (By.XPATH, "//input[contains(translate(@id,'DISCOUNT','discount'),'discount')]"),
-        (By.XPATH, "//input[contains(translate(@name,'DISCOUNT','discount'),'discount')]"),
-        (By.CSS_SELECTOR, "input[placeholder*='discount']"),
-    ]
+APPLY_SELECTORS = [
+    (By.ID, "apply-discount"),
+    (By.CSS_SELECTOR, "button.apply-discount"),
+    (By.XPATH, "//button[contains(translate(.,'APPLY','apply'),'apply')]"),
+]
 
-    for by, sel in selectors:
-        try:
-            return wait.until(EC.presence_of_element_located((by, sel)))
-        except:
-            pass
 
-    return None
+def run(driver, url=None):
+    driver.get(url or URL)
 
-try:
     time.sleep(0.5)
 
-    discount_input = find_with_fallback()
+    # All selectors are polled together under one 10s deadline
+    discount_input = find_first(driver, "discount-input", DISCOUNT_SELECTORS, timeout=10)
 
     if discount_input is None:
         debug_dir = pathlib.Path("selenium_debug")
@@ -61,29 +57,21 @@ try:
     discount_input.clear()
     discount_input.send_keys("DISCOUNT50")
 
-    button_selectors = [
-        (By.ID, "apply-discount"),
-        (By.CSS_SELECTOR, "button.apply-discount"),
-        (By.XPATH, "//button[contains(translate(.,'APPLY','apply'),'apply')]"),
-    ]
-
-    clicked = False
-    for by, sel in button_selectors:
-        try:
-            btn = wait.until(EC.element_to_be_clickable((by, sel)))
-            btn.click()
-            clicked = True
-            break
-        except:
-            pass
-
-    if not clicked:
+    btn = find_first(driver, "apply-button", APPLY_SELECTORS, timeout=10, clickable=True)
+    if btn is not None:
+        btn.click()
+    else:
         discount_input.send_keys(Keys.RETURN)
 
-    print("\n✓ Test Completed\n")
 
-except Exception as e:
-    print("\n✗ Test failed:", e, "\n")
+if __name__ == "__main__":
+    driver = webdriver.Chrome()
+    try:
+        run(driver)
+        print("\n✓ Test Completed\n")
+
+    except Exception as e:
+        print("\n✗ Test failed:", e, "\n")
 
-finally:
-    driver.quit()
+    finally:
+        driver.quit()
@@ -0,0 +1,35 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+from bm25 import BM25Index
+
+
+def test_lone_hit_without_identifier_is_not_confident():
+    index = BM25Index()
+    index.add_many(["d", "e"], ["coupon rules", "SAVE15 discount"])
+    hits = index.search("coupon SAVE15", 5, mask=index.doc_mask(["e"], invert=True))
+    assert [key for key, _ in hits] == ["d"]
+    assert index.confident_hits("coupon SAVE15", hits) is None
+
+
+def test_hit_holding_identifier_is_confident():
+    index = BM25Index()
+    index.add_many(["d", "e"], ["coupon rules", "SAVE15 discount"])
+    hits = index.search("SAVE15", 5)
+    assert index.confident_hits("SAVE15", hits) == hits
+
+
+def test_sync_numbers_documents_in_key_order():
+    texts = {"a": "cart checkout", "b": "coupon SAVE15 checkout", "c": "login page", "d": "checkout coupon rules"}
+    index = BM25Index()
+    index.add_many(["a", "b", "c"], [texts[k] for k in "abc"])
+    keys = ["d", "b", "a"]
+    assert index.sync(keys, lambda i: texts[keys[i]])
+    assert [index.doc(k) for k in keys] == [0, 1, 2] and "c" not in index
+
+    fresh = BM25Index()
+    fresh.add_many(keys, [texts[k] for k in keys])
+    for query in ("checkout coupon", "SAVE15", "cart"):
+        assert index.search(query, 5) == fresh.search(query, 5)
+    assert not index.sync(keys, lambda i: texts[keys[i]])
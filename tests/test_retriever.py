@@ -0,0 +1,75 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+st = pytest.importorskip("sentence_transformers")
+
+from vector_store import write_store
+
+CHUNKS = [
+    ("p1", "product_specs.md", "Promo SAVE15 gives 15% off every order."),
+    ("f1", "faq.json", "Error code 402 means the payment failed."),
+    ("f2", "faq.json", "Passwords are reset from the login page."),
+    ("n1", "notes.md", "Customers can apply a promotional voucher at checkout."),
+]
+
+
+@pytest.fixture
+def retriever(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("QA_EMBED_CACHE", "0")
+    import retriever as retriever_module
+
+    model = st.SentenceTransformer(retriever_module.MODEL_NAME)
+    vectors = model.encode([text for _, _, text in CHUNKS])
+    write_store(retriever_module.STORE_DIR, vectors,
+                [{"id": cid, "source": source, "index": 0, "text": text} for cid, source, text in CHUNKS])
+    return retriever_module.Retriever()
+
+
+@pytest.mark.parametrize("top_k", [5, 20])
+def test_source_filter_does_not_take_lexical_shortcut(retriever, top_k):
+    # SAVE15 is only in product_specs.md, which the filter leaves out
+    include = ["faq.json", "notes.md"]
+    results = retriever.retrieve("discount code SAVE15", top_k=top_k, include_sources=include)
+    assert {r["source"] for r in results} == set(include)
+    assert len(results) == 3
+
+    batch = retriever.retrieve_many(["discount code SAVE15"], top_k=top_k, include_sources=include)
+    assert sorted(batch.chunk_ids()[0]) == ["f1", "f2", "n1"]
+
+
+FILTERS = [
+    ({"include_sources": ["faq.json", "notes.md"]}, {"faq.json", "notes.md"}),
+    ({"exclude_sources": ["faq.json"]}, {"product_specs.md", "notes.md"}),
+    ({"include_sources": ["faq.json", "notes.md"], "exclude_sources": ["notes.md"]}, {"faq.json"}),
+]
+# Lexical matches in every source, and words that are in no chunk (dense ranking only)
+QUERIES = ["SAVE15 payment 402 voucher checkout", "zqxjv wkpfh"]
+
+
+@pytest.mark.parametrize("filters,allowed", FILTERS)
+@pytest.mark.parametrize("top_k", [1, 5])
+def test_filtered_hybrid_results_stay_in_allowed_sources(retriever, filters, allowed, top_k):
+    dense_only = type(retriever)(hybrid=False)
+    n_allowed = sum(source in allowed for _, source, _ in CHUNKS)
+    batch = retriever.retrieve_many(QUERIES, top_k=top_k, **filters)
+    dense_batch = dense_only.retrieve_many(QUERIES, top_k=top_k, **filters)
+
+    for q, query in enumerate(QUERIES):
+        results = retriever.retrieve(query, top_k=top_k, **filters)
+        dense = [r["chunk_id"] for r in dense_only.retrieve(query, top_k=top_k, **filters)]
+        ids = [r["chunk_id"] for r in results]
+        assert {r["source"] for r in results} <= allowed
+        assert len(ids) == min(top_k, n_allowed)
+        if top_k >= n_allowed:
+            assert sorted(ids) == sorted(dense)
+            if q == 0:
+                assert any(r["lexical_score"] is not None for r in results)
+        if all(r["lexical_score"] is None for r in results):
+            assert ids == dense
+
+        assert batch.chunk_ids()[q] == ids
+        assert dense_batch.chunk_ids()[q] == dense
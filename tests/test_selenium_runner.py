@@ -0,0 +1,36 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+from seleniumRunner import DriverPool, run_scripts
+
+
+class CrashingDriver:
+    """Runs a test, then dies on the reset that follows it."""
+
+    def delete_all_cookies(self):
+        raise RuntimeError("browser crashed")
+
+    def quit(self):
+        pass
+
+
+def test_lost_drivers_fail_the_remaining_tests_instead_of_hanging():
+    started = []
+
+    def factory():
+        if started:
+            raise RuntimeError("chrome failed to start")
+        started.append(1)
+        return CrashingDriver()
+
+    pool = DriverPool(size=1, factory=factory)
+    pool.warm_up()
+    scripts = {f"t{i}": "def run(driver, url=None):\n    pass\n" for i in range(3)}
+    report = run_scripts(scripts, workers=1, pool=pool)
+
+    statuses = [r["status"] for r in report["results"]]
+    assert statuses == ["passed", "error", "error"]
+    assert "WebDrivers were lost" in report["results"][1]["error"]
+    assert "chrome failed to start" in report["results"][1]["error"]
+    assert pool.capacity == 0 and report["summary"]["drivers_lost"] == 1
@@ -2,6 +2,7 @@ import streamlit as st
 import requests
 import json
 import os
+import time
 
 # Use environment variable for backend URL (useful for deployment)
 BACKEND_URL = os.getenv("BACKEND_URL", "http://127.0.0.1:8000")
@@ -127,17 +128,47 @@ if st.button("Build KB"):
             try:
                 payload = {
                     "file_paths": st.session_state["uploaded_paths"],
-                    "chunk_size": 1000,
-                    "chunk_overlap": 200
+                    "chunk_size": 254,
+                    "chunk_overlap": 32
                 }
-                resp = requests.post(f"{BACKEND_URL}/build_kb/", json=payload, timeout=120)
+                resp = requests.post(f"{BACKEND_URL}/build_kb/", json=payload, timeout=30)
 
                 if resp.ok:
                     result = resp.json()
+                    job_id = result.get("job_id")
+                    if result.get("status") == "queued" and job_id:
+                        # The build runs as a background job; poll it until it finishes
+                        progress = st.progress(0.0)
+                        status_text = st.empty()
+                        job = {}
+                        while True:
+                            job = requests.get(f"{BACKEND_URL}/jobs/{job_id}", timeout=10).json()
+                            total = job.get("chunks_total", 0)
+                            done = job.get("chunks_done", 0)
+                            if total:
+                                progress.progress(min(done / total, 1.0))
+                            status_text.text(
+                                f"{job.get('status')}: {done}/{total} chunks, "
+                                f"batch {job.get('batches_done', 0)}/{job.get('batches_total', 0)}, "
+                                f"{job.get('chunks_per_sec', 0)} chunks/s"
+                            )
+                            if job.get("status") in ("completed", "failed", "cancelled"):
+                                break
+                            time.sleep(1)
+
+                        if job.get("status") == "completed":
+                            result = job.get("result") or {}
+                        elif job.get("status") == "failed":
+                            result = {"status": "error", "message": job.get("error")}
+                        else:
+                            result = {"status": "cancelled", "message": "KB build was cancelled"}
+
                     if result.get("status") == "kb_built":
                         st.success(f"✅ Knowledge base built! Processed {result.get('num_chunks', 0)} chunks from {len(result.get('ingested_files', []))} file(s)")
                     elif result.get("status") == "no_docs_found":
                         st.warning(f"⚠️ {result.get('message', 'No documents found to process')}")
+                    elif result.get("status") == "error":
+                        st.error(f"❌ {result.get('message', 'Build KB failed')}")
                     else:
                         st.info(f"ℹ️ {result}")
                 else:
@@ -193,11 +224,35 @@ if st.session_state.get("generated"):
 
 st.header("3️⃣ Generate Selenium Script")
 
+feature_filter = st.text_input("Filter by feature (optional):")
+PAGE_SIZE = 200
+
+
+def fetch_testcases(cursor=None):
+    params = {"limit": PAGE_SIZE}
+    if feature_filter.strip():
+        params["feature"] = feature_filter.strip()
+    if cursor is not None:
+        params["cursor"] = cursor
+    return requests.get(f"{BACKEND_URL}/list_testcases/", params=params)
+
+
 if st.button("Refresh Testcases from Backend"):
-    resp = requests.get(f"{BACKEND_URL}/list_testcases/")
+    resp = fetch_testcases()
+    if resp.ok:
+        data = resp.json()
+        st.session_state["backend_cases"] = data.get("items", [])
+        st.session_state["cases_cursor"] = data.get("next_cursor")
+        st.success(f"Fetched {len(st.session_state['backend_cases'])} of {data.get('total', 0)} testcases!")
+    else:
+        st.error("Failed to fetch")
+
+if st.session_state.get("cases_cursor") is not None and st.button("Load more testcases"):
+    resp = fetch_testcases(st.session_state["cases_cursor"])
     if resp.ok:
-        st.session_state["backend_cases"] = resp.json().get("items", [])
-        st.success("Fetched testcases!")
+        data = resp.json()
+        st.session_state["backend_cases"].extend(data.get("items", []))
+        st.session_state["cases_cursor"] = data.get("next_cursor")
     else:
         st.error("Failed to fetch")
 